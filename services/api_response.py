@@ -0,0 +1,105 @@
+"""API Gateway proxy responses shared by every service.
+
+Bodies are encoded with orjson when it is installed and with the stdlib
+json module otherwise. Both produce compact output. Handlers pass their
+finished response through ``compress``, which applies brotli or gzip when
+the client accepts it and the body is at least COMPRESSION_MIN_BYTES.
+Compression happens only at the handler boundary, so in-process callers
+(order-processing in composite mode) keep reading plain JSON bodies.
+"""
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+
+def dumps(body: object) -> bytes:
+    """Compact UTF-8 JSON; dicts keyed by int are written with string keys."""
+    if orjson is not None:
+        return orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(body, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def build(status: int, body: object = None, headers: dict | None = None, encoded: bytes | None = None) -> dict:
+    """Proxy response with ``body`` encoded as JSON.
+
+    ``encoded`` takes already serialized JSON bytes instead, such as the
+    pre-encoded documents of the inventory catalog cache.
+    """
+    response = {
+        "isBase64Encoded": False,
+        "statusCode": status,
+        "headers": headers or {},
+    }
+    if encoded is not None:
+        response["body"] = encoded.decode()
+    elif body is not None:
+        response["body"] = dumps(body).decode()
+    return response
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        params = params.strip()
+        try:
+            weight = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            weight = 0.0
+        weights[name.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if weights.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(response: dict, accept_encoding: str | None) -> dict:
+    """Return ``response`` with its body compressed if the client accepts it."""
+    body = response.get("body")
+    if not body or response.get("isBase64Encoded"):
+        return response
+    # The threshold is in UTF-8 bytes; non-ASCII text encodes to more than one byte per character
+    raw = body.encode()
+    if len(raw) < COMPRESSION_MIN_BYTES:
+        return response
+    headers = {**response["headers"], "Vary": "Accept-Encoding"}
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return {**response, "headers": headers}
+
+    if encoding == "br":
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        # mtime=0 keeps the output identical for identical bodies
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    headers["Content-Encoding"] = encoding
+    return {
+        **response,
+        "isBase64Encoded": True,
+        "headers": headers,
+        "body": base64.b64encode(data).decode(),
+    }
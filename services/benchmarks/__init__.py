@@ -0,0 +1,21 @@
+"""Local end-to-end benchmarks for the service Lambda handlers.
+
+Drives the inventory_management, order-processing, order, payment and
+shipping handlers in-process with synthetic API Gateway v2 and SNS events,
+against a local MySQL built from data/create_db.sql. SNS is replaced by
+outbox.LocalPublisher, and order-processing runs with SERVICE_MODE=inprocess
+so no AWS endpoint is involved.
+
+    cd services
+    python -m benchmarks --setup                       # (re)create the schema and seed it
+    python -m benchmarks --save-baseline baseline.json
+    python -m benchmarks --compare baseline.json       # exits 1 on a regression
+    python -m benchmarks.contention                    # flash-sale reservation load
+
+Connection settings come from the usual DB_* variables. DB_NAME must be
+vacationsalesdb, the schema create_db.sql creates. --setup drops it, so it
+only runs against a loopback DB_HOST unless --yes-drop repeats
+DB_HOST/DB_NAME. Queries per request
+are read from the server's global Questions counter, so run against a
+server that nothing else is using.
+"""
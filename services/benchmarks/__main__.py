@@ -0,0 +1,107 @@
+"""Command line entry point: ``python -m benchmarks`` from the services directory."""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+
+from . import __doc__ as package_doc
+from . import harness, scenarios
+
+_COLUMNS = ("requests", "errors", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "throughput_rps", "queries_per_request")
+
+
+def _print_table(results: dict) -> None:
+    width = max([len("scenario")] + [len(name) for name in results])
+    print(f"{'scenario':<{width}}  " + "  ".join(f"{column:>{len(column)}}" for column in _COLUMNS))
+    for name, summary in results.items():
+        print(f"{name:<{width}}  " + "  ".join(f"{summary[column]:>{len(column)}}" for column in _COLUMNS))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=package_doc, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--setup", action="store_true",
+                        help="drop and recreate DB_NAME from create_db.sql and seed the catalog first "
+                             "(DB_NAME must be vacationsalesdb on a loopback DB_HOST)")
+    parser.add_argument("--yes-drop", metavar="HOST/DB",
+                        help="allow --setup to drop DB on a non-loopback HOST; must match DB_HOST/DB_NAME")
+    parser.add_argument("--items", type=int, default=500, help="catalog size seeded by --setup")
+    parser.add_argument("--scenarios", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and exit")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="threads invoking the handler")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write the results as the new baseline")
+    parser.add_argument("--compare", metavar="FILE", help="baseline to check the results against")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2,
+                        help="relative p50/p95 increase counted as a regression")
+    parser.add_argument("--min-latency-delta", type=float, default=1.0,
+                        help="milliseconds a latency must also grow by to count")
+    parser.add_argument("--query-tolerance", type=float, default=0.1,
+                        help="relative queries-per-request increase counted as a regression")
+    args = parser.parse_args(argv)
+
+    harness.configure_environment()
+    if args.setup:
+        print(f"Recreating {os.environ['DB_NAME']} on {os.environ['DB_HOST']}", file=sys.stderr)
+        try:
+            harness.create_database(args.yes_drop)
+        except RuntimeError as exc:
+            parser.error(str(exc))
+    services = harness.load_services()
+    if args.setup:
+        print(f"Seeded catalog: {json.dumps(harness.seed_catalog(args.items))}", file=sys.stderr)
+
+    available = scenarios.build(services)
+    if args.list:
+        for scenario in available.values():
+            print(f"{scenario.name:<16} {scenario.description}")
+        return 0
+    names = args.scenarios.split(",") if args.scenarios else list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    counter = harness.QueryCounter()
+    results = {}
+    try:
+        for name in names:
+            result = harness.run_scenario(available[name], args.requests, args.warmup, args.concurrency,
+                                          counter, args.seed)
+            results[name] = result.summary()
+            if result.first_error:
+                print(f"{name}: {result.errors} errors, first: {result.first_error}", file=sys.stderr)
+    finally:
+        counter.close()
+    _print_table(results)
+
+    report = {
+        "createdAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {"requests": args.requests, "warmup": args.warmup, "concurrency": args.concurrency},
+        "scenarios": results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = harness.compare(results, baseline, args.latency_tolerance, args.min_latency_delta,
+                                      args.query_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""Flash-sale load on reserve_items, comparing reservation strategies.
+
+    cd services
+    python -m benchmarks.contention --strategies locking,optimistic,sharded \\
+        --processes 4 --threads 8 --carts 20000 --stock 300
+
+Concurrent buyers send overlapping multi-item carts. Item popularity
+follows a Zipf distribution over the first --items vacations, so a few
+items take most of the traffic. Each strategy starts from the same stock.
+It reports throughput, the 409 rate, latency, and InnoDB row-lock waits
+and deadlocks, then checks the database against what buyers were told
+they reserved: no counter may go negative, and no item may be oversold.
+
+Strategies:
+    locking     RESERVATION_MODE=locking (SELECT ... FOR UPDATE)
+    optimistic  RESERVATION_MODE=optimistic (conditional UPDATE)
+    sharded     locking, with the --hot most popular items split across
+                --shards counter rows
+
+Runs against the benchmark database (see ``python -m benchmarks --setup``)
+and overwrites the stock of the items it uses.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from . import harness
+
+STRATEGIES = {
+    "locking": {"mode": "locking", "sharded": False},
+    "optimistic": {"mode": "optimistic", "sharded": False},
+    "sharded": {"mode": "locking", "sharded": True},
+}
+
+
+def _inventory(threads: int):
+    """Import inventory_management with a connection pool sized for ``threads``."""
+    harness.configure_environment()
+    os.environ["DB_POOL_SIZE"] = str(max(threads, int(os.environ.get("DB_POOL_SIZE", "4"))))
+    import inventory_management
+    return inventory_management
+
+
+def _zipf_weights(count: int, exponent: float) -> list[float]:
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def run_workers(mode: str, item_ids: list[int], config: dict, seed: int) -> dict:
+    """Send ``config["carts"]`` carts from ``config["threads"]`` threads; return the tallies.
+
+    Runs in the parent for thread-only runs and in each worker process
+    otherwise, so the same code measures both.
+    """
+    inventory = _inventory(config["threads"])
+    inventory.RESERVATION_MODE = mode
+    inventory._SOLD_OUT.clear()
+    inventory._invalidate_shard_map()
+
+    weights = _zipf_weights(len(item_ids), config["zipf"])
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    lock = threading.Lock()
+    tallies = {"carts": 0, "reserved_carts": 0, "conflicts": 0, "errors": 0, "deadlock_errors": 0,
+               "first_error": None, "latencies": [], "reserved": Counter()}
+
+    def buyer(thread_seed: int, carts: int) -> None:
+        rng = random.Random(thread_seed)
+        latencies, reserved = [], Counter()
+        counts = {"carts": 0, "reserved_carts": 0, "conflicts": 0, "errors": 0, "deadlock_errors": 0}
+        first_error = None
+        for _ in range(carts):
+            size = rng.randint(1, config["max_cart_size"])
+            chosen = set()
+            while len(chosen) < min(size, len(item_ids)):
+                chosen.add(rng.choices(item_ids, cum_weights=cumulative)[0])
+            cart = [{"id": item_id, "quantity": rng.randint(1, config["max_quantity"])} for item_id in chosen]
+
+            started = time.perf_counter()
+            response = inventory.reserve_items({"items": cart})
+            latencies.append(time.perf_counter() - started)
+            counts["carts"] += 1
+            status = response["statusCode"]
+            if status == 200:
+                counts["reserved_carts"] += 1
+                reserved.update({line["id"]: line["quantity"] for line in cart})
+            elif status == 409:
+                counts["conflicts"] += 1
+            else:
+                counts["errors"] += 1
+                if "deadlock" in response.get("body", "").lower():
+                    counts["deadlock_errors"] += 1
+                first_error = first_error or response.get("body")
+        with lock:
+            for key, value in counts.items():
+                tallies[key] += value
+            tallies["latencies"].extend(latencies)
+            tallies["reserved"].update(reserved)
+            tallies["first_error"] = tallies["first_error"] or first_error
+
+    threads = config["threads"]
+    share, extra = divmod(config["carts"], threads)
+    workers = [
+        threading.Thread(target=buyer, args=(seed * 1000 + index, share + (index < extra)))
+        for index in range(threads)
+    ]
+    # reserve_items logs with print(); keep that off the terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    tallies["reserved"] = dict(tallies["reserved"])
+    return tallies
+
+
+def _merge(parts: list[dict]) -> dict:
+    merged = {"carts": 0, "reserved_carts": 0, "conflicts": 0, "errors": 0, "deadlock_errors": 0,
+              "first_error": None, "latencies": [], "reserved": Counter()}
+    for part in parts:
+        for key in ("carts", "reserved_carts", "conflicts", "errors", "deadlock_errors"):
+            merged[key] += part[key]
+        merged["latencies"].extend(part["latencies"])
+        merged["reserved"].update(part["reserved"])
+        merged["first_error"] = merged["first_error"] or part["first_error"]
+    return merged
+
+
+def _server_counters(cursor) -> dict:
+    cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ('Innodb_row_lock_waits', 'Innodb_row_lock_time')")
+    counters = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.execute("SELECT `COUNT` FROM information_schema.INNODB_METRICS WHERE NAME = 'lock_deadlocks'")
+    row = cursor.fetchone()
+    counters["lock_deadlocks"] = int(row[0]) if row else 0
+    return counters
+
+
+def _stock(inventory, cursor, item_ids: list[int]) -> dict[int, int]:
+    """Live ticket count of each item, summing shards for sharded items."""
+    cursor.execute(f"SELECT v.id, {inventory._LIVE_TICKETS} "
+                   f"FROM Vacation v WHERE v.id IN ({', '.join(['%s'] * len(item_ids))})",
+                   tuple(item_ids))
+    return {item_id: tickets for item_id, tickets in cursor.fetchall()}
+
+
+def _prepare(cursor, strategy: dict, item_ids: list[int], stock: int, hot: int, shards: int) -> None:
+    """Give every item ``stock`` tickets, sharding the hottest ones for the sharded strategy."""
+    import manage_shards
+
+    cursor.execute("SELECT id FROM Vacation WHERE ticketShards > 0")
+    for (item_id,) in cursor.fetchall():
+        manage_shards.unshard_item(item_id)
+    cursor.execute(f"UPDATE Vacation SET availableTickets = %s WHERE id IN ({', '.join(['%s'] * len(item_ids))})",
+                   (stock, *item_ids))
+    if strategy["sharded"]:
+        for item_id in item_ids[:hot]:
+            manage_shards.shard_item(item_id, shards)
+
+
+def _verify(cursor, item_ids: list[int], initial: dict[int, int], final: dict[int, int],
+            reserved: dict[int, int]) -> list[str]:
+    """Every way the database disagrees with the reservations buyers were granted."""
+    problems = []
+    cursor.execute("SELECT id, availableTickets FROM Vacation WHERE availableTickets < 0")
+    problems += [f"Vacation {item_id} has {tickets} tickets" for item_id, tickets in cursor.fetchall()]
+    cursor.execute("SELECT vacationId, shardId, availableTickets FROM VacationTicketShard WHERE availableTickets < 0")
+    problems += [f"shard {shard} of {item_id} has {tickets} tickets" for item_id, shard, tickets in cursor.fetchall()]
+    for item_id in item_ids:
+        sold = reserved.get(item_id, 0)
+        if sold > initial[item_id]:
+            problems.append(f"item {item_id} oversold: {sold} reserved of {initial[item_id]}")
+        if final[item_id] != initial[item_id] - sold:
+            problems.append(f"item {item_id}: {initial[item_id]} - {sold} reserved != {final[item_id]} left")
+    return problems
+
+
+def run_strategy(name: str, item_ids: list[int], args: argparse.Namespace) -> dict:
+    strategy = STRATEGIES[name]
+    inventory = _inventory(args.threads)
+    cnx = harness.connect()
+    cursor = cnx.cursor()
+    try:
+        _prepare(cursor, strategy, item_ids, args.stock, args.hot, args.shards)
+        initial = _stock(inventory, cursor, item_ids)
+        before = _server_counters(cursor)
+
+        config = {"threads": args.threads, "zipf": args.zipf, "max_cart_size": args.max_cart_size,
+                  "max_quantity": args.max_quantity}
+        started = time.perf_counter()
+        if args.processes > 1:
+            share, extra = divmod(args.carts, args.processes)
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=args.processes, mp_context=context) as executor:
+                futures = [
+                    executor.submit(run_workers, strategy["mode"], item_ids,
+                                    {**config, "carts": share + (index < extra)}, args.seed + index)
+                    for index in range(args.processes)
+                ]
+                tallies = _merge([future.result() for future in futures])
+        else:
+            tallies = _merge([run_workers(strategy["mode"], item_ids, {**config, "carts": args.carts}, args.seed)])
+        elapsed = time.perf_counter() - started
+
+        after = _server_counters(cursor)
+        final = _stock(inventory, cursor, item_ids)
+        problems = _verify(cursor, item_ids, initial, final, tallies["reserved"])
+    finally:
+        cursor.close()
+        cnx.close()
+
+    latencies = sorted(tallies["latencies"])
+    carts = tallies["carts"]
+    return {
+        "carts": carts,
+        "reserved": tallies["reserved_carts"],
+        "conflict_rate": round(tallies["conflicts"] / carts, 3) if carts else 0.0,
+        "errors": tallies["errors"],
+        "carts_per_s": round(carts / elapsed, 1) if elapsed else 0.0,
+        "reserved_per_s": round(tallies["reserved_carts"] / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(harness.percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(harness.percentile(latencies, 99) * 1000, 2),
+        "lock_waits": after["Innodb_row_lock_waits"] - before["Innodb_row_lock_waits"],
+        "lock_wait_ms": after["Innodb_row_lock_time"] - before["Innodb_row_lock_time"],
+        "deadlocks": after["lock_deadlocks"] - before["lock_deadlocks"],
+        "deadlock_errors": tallies["deadlock_errors"],
+        "tickets_sold": sum(tallies["reserved"].values()),
+        "verified": not problems,
+        "problems": problems,
+        "first_error": tallies["first_error"],
+    }
+
+
+_COLUMNS = ("carts", "reserved", "conflict_rate", "errors", "carts_per_s", "reserved_per_s", "p50_ms", "p99_ms",
+            "lock_waits", "lock_wait_ms", "deadlocks", "deadlock_errors", "tickets_sold", "verified")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--strategies", default=",".join(STRATEGIES), help="comma-separated strategies to compare")
+    parser.add_argument("--items", type=int, default=50, help="vacations buyers choose from")
+    parser.add_argument("--zipf", type=float, default=1.2, help="Zipf exponent of item popularity")
+    parser.add_argument("--stock", type=int, default=300, help="tickets per item at the start of each strategy")
+    parser.add_argument("--carts", type=int, default=5000, help="carts sent per strategy")
+    parser.add_argument("--threads", type=int, default=8, help="buyer threads per process")
+    parser.add_argument("--processes", type=int, default=1, help="buyer processes")
+    parser.add_argument("--max-cart-size", type=int, default=3, help="distinct items per cart, at most")
+    parser.add_argument("--max-quantity", type=int, default=2, help="tickets per cart line, at most")
+    parser.add_argument("--hot", type=int, default=5, help="most popular items the sharded strategy shards")
+    parser.add_argument("--shards", type=int, default=8, help="counter rows per hot item when sharded")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    names = args.strategies.split(",")
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        parser.error(f"unknown strategies: {', '.join(unknown)}")
+
+    harness.configure_environment()
+    cnx = harness.connect()
+    cursor = cnx.cursor()
+    try:
+        cursor.execute("SELECT id FROM Vacation ORDER BY id LIMIT %s", (args.items,))
+        item_ids = [item_id for (item_id,) in cursor.fetchall()]
+    finally:
+        cursor.close()
+        cnx.close()
+    if not item_ids:
+        print("The catalog is empty; run python -m benchmarks --setup first", file=sys.stderr)
+        return 1
+
+    results = {}
+    for name in names:
+        print(f"Running {name}: {args.carts} carts, {args.processes} x {args.threads} buyers", file=sys.stderr)
+        results[name] = run_strategy(name, item_ids, args)
+        if results[name]["first_error"]:
+            print(f"{name}: first error: {results[name]['first_error']}", file=sys.stderr)
+        for problem in results[name]["problems"]:
+            print(f"{name}: {problem}", file=sys.stderr)
+
+    width = max(len("strategy"), *(len(name) for name in results))
+    print(f"{'strategy':<{width}}  " + "  ".join(f"{column:>{len(column)}}" for column in _COLUMNS))
+    for name, result in results.items():
+        print(f"{name:<{width}}  " + "  ".join(f"{str(result[column]):>{len(column)}}" for column in _COLUMNS))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "strategies": results}, f, indent=2)
+    return 0 if all(result["verified"] for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
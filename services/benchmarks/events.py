@@ -0,0 +1,87 @@
+"""Synthetic Lambda events and request payloads."""
+from __future__ import annotations
+
+import json
+from urllib.parse import urlencode
+from uuid import uuid4
+
+
+def http_event(method: str, path: str, body: object = None, query: dict | None = None,
+               headers: dict | None = None, path_params: dict | None = None) -> dict:
+    """An API Gateway HTTP API (payload format 2.0) proxy event."""
+    query = {key: str(value) for key, value in (query or {}).items()}
+    return {
+        "version": "2.0",
+        "routeKey": f"{method} {path}",
+        "rawPath": path,
+        "rawQueryString": urlencode(query),
+        "headers": {"content-type": "application/json", "accept-encoding": "gzip, br", **(headers or {})},
+        "queryStringParameters": query or None,
+        "pathParameters": path_params or None,
+        "requestContext": {
+            "http": {"method": method, "path": path, "protocol": "HTTP/1.1", "sourceIp": "127.0.0.1"},
+            "requestId": uuid4().hex,
+            "stage": "$default",
+        },
+        "body": None if body is None else json.dumps(body),
+        "isBase64Encoded": False,
+    }
+
+
+def sns_event(messages: list[dict], topic_arn: str = "arn:aws:sns:local:000000000000:shipping") -> dict:
+    """An SNS notification event delivering each message as its own record."""
+    return {
+        "Records": [
+            {
+                "EventSource": "aws:sns",
+                "EventVersion": "1.0",
+                "Sns": {
+                    "Type": "Notification",
+                    "MessageId": uuid4().hex,
+                    "TopicArn": topic_arn,
+                    "Message": json.dumps(message),
+                },
+            }
+            for message in messages
+        ]
+    }
+
+
+def payment() -> dict:
+    return {
+        "card_holder_name": "Bench Mark",
+        "credit_card_number": "4111111111111111",
+        "expir_date": "12/30",
+        "cvvCode": "123",
+    }
+
+
+def shipping() -> dict:
+    return {
+        "name": "Bench Mark",
+        "addressLine1": "1 Benchmark Way",
+        "addressLine2": "",
+        "city": "Columbus",
+        "state": "OH",
+        "zip": "43210",
+    }
+
+
+def shipping_message() -> dict:
+    """A shipping message as order-processing writes it to the outbox."""
+    return {
+        **shipping(),
+        "confirmation_number": uuid4().hex[:10].upper(),
+        "business_id": 1234567,
+        "num_packets": 1,
+        "weight": 1.0,
+    }
+
+
+def cart(items: list[dict], quantity: int = 1) -> list[dict]:
+    return [{"id": item["id"], "name": item["name"], "price": item["price"], "quantity": quantity} for item in items]
+
+
+def checkout(items: list[dict], quantity: int = 1) -> dict:
+    """A storefront order submission for ``items``."""
+    return {"items": cart(items, quantity), "payment": payment(), "shipping": shipping()}
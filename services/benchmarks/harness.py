@@ -0,0 +1,321 @@
+"""Database setup, service loading, measurement and baseline comparison."""
+from __future__ import annotations
+
+import contextlib
+import importlib.util
+import ipaddress
+import math
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Callable
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREATE_DB_SQL = os.path.join(SERVICES_DIR, "data", "create_db.sql")
+# The schema create_db.sql creates, whatever DB_NAME says
+SCHEMA_NAME = "vacationsalesdb"
+
+# Read by the services at import time, so applied before load_services().
+# Anything already set in the environment wins.
+_ENVIRONMENT = {
+    "DB_HOST": "127.0.0.1",
+    "DB_USER": "root",
+    "DB_PASSWORD": "",
+    "DB_NAME": "vacationsalesdb",
+    "SERVICE_MODE": "inprocess",
+    "CHECKOUT_MODE": "sync",
+    "CHECKOUT_QUEUE": "local",
+    "OUTBOX_PUBLISHER": "local",
+    "ROOT_URL": "http://localhost",
+}
+# Large enough that no benchmark run sells out an item
+STOCK = 1_000_000
+_WORDS = ("alpine", "beach", "canyon", "desert", "island", "jungle", "lake", "safari", "river", "volcano",
+          "coast", "glacier", "harbor", "meadow", "summit", "valley", "village", "castle", "forest", "reef")
+
+
+def configure_environment() -> None:
+    for name, value in _ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+
+
+def load_services() -> SimpleNamespace:
+    """Import every service module; order-processing is loaded by path for its hyphen."""
+    configure_environment()
+    import inventory_management
+    import order
+    import outbox
+    import payment
+    import shipping
+
+    spec = importlib.util.spec_from_file_location("order_processing", os.path.join(SERVICES_DIR, "order-processing.py"))
+    order_processing = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(order_processing)
+    return SimpleNamespace(inventory=inventory_management, order=order, outbox=outbox, payment=payment,
+                           shipping=shipping, order_processing=order_processing)
+
+
+def connect(database: bool = True):
+    import mysql.connector
+    return mysql.connector.connect(
+        host=os.environ["DB_HOST"],
+        user=os.environ["DB_USER"],
+        password=os.environ["DB_PASSWORD"],
+        database=os.environ["DB_NAME"] if database else None,
+        autocommit=True,
+    )
+
+
+def _sql_statements(script: str) -> list[str]:
+    """Split a mysql client script into statements, honoring DELIMITER lines."""
+    statements, current, delimiter = [], [], ";"
+    for line in script.splitlines():
+        stripped = line.strip()
+        if not current and (not stripped or stripped.startswith("--")):
+            continue
+        if stripped.upper().startswith("DELIMITER "):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        current.append(line)
+        if stripped.endswith(delimiter):
+            statement = "\n".join(current).strip()
+            statements.append(statement[:-len(delimiter)].strip())
+            current = []
+    if current and "\n".join(current).strip():
+        statements.append("\n".join(current).strip())
+    return statements
+
+
+def drop_target() -> str:
+    """``HOST/DB`` that create_database would drop."""
+    return f"{os.environ['DB_HOST']}/{os.environ['DB_NAME']}"
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def create_database(confirmed_target: str | None = None) -> None:
+    """Drop and recreate the schema from create_db.sql.
+
+    Refuses unless DB_NAME is the schema create_db.sql creates, and the
+    server is on a loopback address or ``confirmed_target`` repeats
+    drop_target() exactly.
+    """
+    if os.environ["DB_NAME"] != SCHEMA_NAME:
+        raise RuntimeError(f"create_db.sql creates {SCHEMA_NAME}; refusing to drop DB_NAME={os.environ['DB_NAME']}")
+    if not _is_loopback(os.environ["DB_HOST"]) and confirmed_target != drop_target():
+        raise RuntimeError(f"{os.environ['DB_HOST']} is not a loopback address; "
+                           f"pass --yes-drop {drop_target()} to drop it anyway")
+    with open(CREATE_DB_SQL) as f:
+        statements = _sql_statements(f.read())
+    cnx = connect(database=False)
+    cursor = cnx.cursor()
+    try:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{os.environ['DB_NAME']}`")
+        for statement in statements:
+            cursor.execute(statement)
+    finally:
+        cursor.close()
+        cnx.close()
+
+
+def synthetic_products(count: int, first_id: int, seed: int = 0) -> list[dict]:
+    """Normalized products in the shape load_catalog.parse_product returns."""
+    rng = random.Random(seed)
+    products = []
+    for item_id in range(first_id, first_id + count):
+        words = rng.sample(_WORDS, 3)
+        products.append({
+            "id": item_id,
+            "name": f"{words[0].title()} {words[1].title()} Getaway {item_id}",
+            "location": f"{words[2].title()} Bay",
+            "price": round(rng.uniform(199, 4999), 2),
+            "duration": f"{rng.randint(3, 14)} Days",
+            "departureDate": f"2027-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "shortDescription": f"A {words[0]} and {words[1]} trip",
+            "description": " ".join(rng.choices(_WORDS, k=40)),
+            "availableTickets": STOCK,
+            "images": [f"/images/synthetic/{item_id}-{index}.jpeg" for index in range(rng.randint(1, 4))],
+            "includes": [f"Includes {word}" for word in rng.sample(_WORDS, rng.randint(2, 5))],
+            "highlights": [f"See the {word}" for word in rng.sample(_WORDS, rng.randint(2, 5))],
+        })
+    return products
+
+
+def seed_catalog(items: int) -> dict:
+    """Load data/products plus synthetic products up to ``items`` vacations."""
+    import load_catalog
+
+    products = load_catalog.parse_products(workers=1)
+    first_id = max((product["id"] for product in products), default=0) + 1
+    products += synthetic_products(max(items - len(products), 0), first_id)
+    for product in products:
+        product["availableTickets"] = STOCK
+    return load_catalog.load_catalog(products)
+
+
+def restock() -> None:
+    """Top every item back up so checkout scenarios never hit a sold-out path."""
+    cnx = connect()
+    cursor = cnx.cursor()
+    try:
+        cursor.execute("UPDATE Vacation SET availableTickets = %s WHERE ticketShards = 0", (STOCK,))
+        cursor.execute("UPDATE VacationTicketShard SET availableTickets = %s", (STOCK,))
+    finally:
+        cursor.close()
+        cnx.close()
+
+
+class QueryCounter:
+    """Statements executed server-wide, from the global Questions status counter."""
+
+    def __init__(self):
+        self._cnx = connect()
+
+    def read(self) -> int:
+        cursor = self._cnx.cursor()
+        try:
+            cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+            return int(cursor.fetchone()[1])
+        finally:
+            cursor.close()
+
+    def close(self) -> None:
+        self._cnx.close()
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    handler: Callable[[dict, object], object]
+    make_event: Callable[[random.Random], dict]
+    expected_statuses: tuple[int, ...] = (200,)
+    setup: Callable[[], None] | None = None
+
+
+@dataclass
+class Result:
+    name: str
+    latencies: list[float] = field(default_factory=list)  # seconds
+    errors: int = 0
+    first_error: str | None = None
+    wall_time: float = 0.0
+    queries: int = 0
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "p50_ms": _ms(percentile(ordered, 50)),
+            "p95_ms": _ms(percentile(ordered, 95)),
+            "p99_ms": _ms(percentile(ordered, 99)),
+            "mean_ms": _ms(sum(ordered) / count if count else 0.0),
+            "throughput_rps": round(count / self.wall_time, 1) if self.wall_time else 0.0,
+            "queries_per_request": round(self.queries / count, 2) if count else 0.0,
+        }
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _status(response: object) -> int | None:
+    """HTTP status of a proxy response; handlers that return nothing (SNS) count as 200."""
+    if response is None:
+        return 200
+    if isinstance(response, dict):
+        if "statusCode" in response:
+            return response["statusCode"]
+        if response.get("batchItemFailures"):
+            return 500
+        return 200
+    return None
+
+
+def run_scenario(scenario: Scenario, requests: int, warmup: int, concurrency: int = 1,
+                 counter: QueryCounter | None = None, seed: int = 0) -> Result:
+    """Invoke the scenario's handler ``warmup`` times unmeasured, then ``requests`` times measured."""
+    if scenario.setup is not None:
+        scenario.setup()
+    rng = random.Random(seed)
+    result = Result(scenario.name)
+
+    def invoke(event: dict) -> tuple[float, str | None]:
+        started = time.perf_counter()
+        try:
+            response = scenario.handler(event, None)
+            status = _status(response)
+            error = None if status in scenario.expected_statuses else f"status {status}: {str(response)[:300]}"
+        except Exception as e:
+            error = repr(e)
+        return time.perf_counter() - started, error
+
+    # The services log every request with print(); keep that off the terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(warmup):
+            invoke(scenario.make_event(rng))
+
+        # Events are built up front so their cost stays out of the timings
+        events = [scenario.make_event(rng) for _ in range(requests)]
+        before = counter.read() if counter else 0
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes = list(executor.map(invoke, events))
+        else:
+            outcomes = [invoke(event) for event in events]
+        result.wall_time = time.perf_counter() - started
+        if counter:
+            # Minus the SHOW STATUS that took the second reading
+            result.queries = counter.read() - before - 1
+
+    result.latencies = [latency for latency, _ in outcomes]
+    errors = [error for _, error in outcomes if error is not None]
+    result.errors = len(errors)
+    result.first_error = errors[0] if errors else None
+    return result
+
+
+def compare(results: dict, baseline: dict, latency_tolerance: float, min_latency_delta_ms: float,
+            query_tolerance: float) -> list[str]:
+    """Regressions of ``results`` against ``baseline``, one line each.
+
+    A latency regression needs p50 or p95 to exceed the baseline by both
+    ``latency_tolerance`` (relative) and ``min_latency_delta_ms``, so
+    sub-millisecond jitter is ignored. Queries per request are nearly
+    deterministic and get a relative ``query_tolerance`` only.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+        for metric in ("p50_ms", "p95_ms"):
+            before, after = previous[metric], current[metric]
+            if after > before * (1 + latency_tolerance) and after - before > min_latency_delta_ms:
+                regressions.append(f"{name}: {metric} {before} -> {after}")
+        before, after = previous["queries_per_request"], current["queries_per_request"]
+        if after > before * (1 + query_tolerance) + 0.01:
+            regressions.append(f"{name}: queries_per_request {before} -> {after}")
+    return regressions
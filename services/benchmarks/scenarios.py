@@ -0,0 +1,82 @@
+"""The benchmark scenarios, one per user-facing path through the handlers."""
+from __future__ import annotations
+
+import random
+from types import SimpleNamespace
+
+from . import events
+from .harness import Scenario, connect, restock
+
+INVENTORY = "/inventory-management/inventory"
+SHIPPING_BATCH_SIZE = 10
+
+
+def catalog_items() -> list[dict]:
+    """``id``, ``name`` and ``price`` of every vacation, for building carts."""
+    cnx = connect()
+    cursor = cnx.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT id, name, price FROM Vacation ORDER BY id")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        cnx.close()
+
+
+def build(services: SimpleNamespace) -> dict[str, Scenario]:
+    items = catalog_items()
+    if not items:
+        raise RuntimeError("The catalog is empty; run with --setup first")
+    ids = [item["id"] for item in items]
+    search_terms = sorted({word.lower() for item in items for word in item["name"].split() if len(word) > 3})
+
+    inventory = services.inventory.lambda_handler
+    order_processing = services.order_processing.lambda_handler
+    # SNS stand-in: delivers straight to the shipping handler with SNS-shaped events
+    sns = services.outbox.LocalPublisher({"shipping": services.shipping.lambda_handler})
+
+    def publish_shipping_batch(event: dict, context) -> None:
+        sns.publish("shipping", [(record["Sns"]["MessageId"], record["Sns"]["Message"]) for record in event["Records"]])
+        sns.published.clear()
+
+    scenarios = [
+        Scenario("browse", "full catalog listing", inventory,
+                 lambda rng: events.http_event("GET", INVENTORY)),
+        Scenario("browse_page", "first listing page with card fields", inventory,
+                 lambda rng: events.http_event("GET", INVENTORY, query={
+                     "limit": 24, "fields": "id,name,price,image,availableTickets"})),
+        Scenario("item", "one item by id", inventory,
+                 lambda rng: events.http_event("GET", f"{INVENTORY}/items/{rng.choice(ids)}")),
+        Scenario("items_by_ids", "five items by ?ids=", inventory,
+                 lambda rng: events.http_event("GET", f"{INVENTORY}/items", query={
+                     "ids": ",".join(map(str, rng.sample(ids, min(5, len(ids)))))})),
+        Scenario("availability", "live ticket counts", inventory,
+                 lambda rng: events.http_event("GET", f"{INVENTORY}/availability")),
+        Scenario("search", "search by name", inventory,
+                 lambda rng: events.http_event("GET", f"{INVENTORY}/items", query={"name": rng.choice(search_terms)}),
+                 expected_statuses=(200, 404)),
+        Scenario("payment", "payment service write", services.payment.lambda_handler,
+                 lambda rng: events.http_event("POST", "/payment", events.payment())),
+        Scenario("order", "order service write with its outbox row", services.order.lambda_handler,
+                 lambda rng: events.http_event("POST", "/orders", {
+                     "orders": {"customer_name": "Bench Mark", "shipping_info": "BENCH", "payment_info": "BENCH"},
+                     "items": events.cart(_sample(rng, items, 2)),
+                     "shipping": events.shipping_message(),
+                 })),
+        Scenario("checkout_single", "order submission with one item", order_processing,
+                 lambda rng: events.http_event("POST", "/order-processing/order",
+                                               events.checkout(_sample(rng, items, 1))),
+                 setup=restock),
+        Scenario("checkout_multi", "order submission with three items", order_processing,
+                 lambda rng: events.http_event("POST", "/order-processing/order",
+                                               events.checkout(_sample(rng, items, 3))),
+                 setup=restock),
+        Scenario("shipping_batch", f"{SHIPPING_BATCH_SIZE} shipping messages through the SNS stand-in",
+                 publish_shipping_batch,
+                 lambda rng: events.sns_event([events.shipping_message() for _ in range(SHIPPING_BATCH_SIZE)])),
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
+
+
+def _sample(rng: random.Random, items: list[dict], count: int) -> list[dict]:
+    return rng.sample(items, min(count, len(items)))
@@ -0,0 +1,98 @@
+"""Write the catalog as a content-hashed static snapshot for the storefront.
+
+Usage:
+    python build_catalog_snapshot.py [--output-dir DIR] [--keep N]
+
+Writes ``catalog.<hash>.json`` with gzip (and brotli, when installed)
+variants next to it, plus ``manifest.json`` naming the current file. The
+snapshot holds only static fields. Live stock comes from
+``GET /inventory-management/inventory/availability``, so the snapshot
+changes only when the catalog itself does, and an unchanged catalog
+rebuilds to the same file.
+
+The default output directory is website/public/catalog, which ships with
+the site's static hosting. Serve the hashed files with
+``Cache-Control: public, max-age=31536000, immutable`` and the manifest
+with ``no-cache``. Uses the same DB_* environment variables as the
+inventory service.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import api_response
+import inventory_management
+
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "website", "public", "catalog")
+MANIFEST_NAME = "manifest.json"
+
+
+def build_snapshot(output_dir: str = SNAPSHOT_DIR, keep: int = 3) -> dict:
+    """Export the catalog to ``output_dir`` and return the new manifest."""
+    items = []
+    for line in inventory_management.export_catalog():
+        item = json.loads(line)
+        item.pop("availableTickets", None)
+        items.append(item)
+    body = api_response.dumps(items)
+    digest = hashlib.sha256(body).hexdigest()
+    name = f"catalog.{digest[:16]}.json"
+
+    os.makedirs(output_dir, exist_ok=True)
+    # Content-Encoding -> precompressed file
+    encodings = {"gzip": (f"{name}.gz", gzip.compress(body, compresslevel=9, mtime=0))}
+    if api_response.brotli is not None:
+        encodings["br"] = (f"{name}.br", api_response.brotli.compress(body, quality=11))
+    _write_atomic(os.path.join(output_dir, name), body)
+    for filename, data in encodings.values():
+        _write_atomic(os.path.join(output_dir, filename), data)
+
+    manifest = {
+        "file": name,
+        "sha256": digest,
+        "items": len(items),
+        "bytes": len(body),
+        "encodings": {encoding: filename for encoding, (filename, _) in encodings.items()},
+        "generatedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    # The manifest goes last so it never names a file that is not there yet
+    _write_atomic(os.path.join(output_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+    _prune(output_dir, name, keep)
+    return manifest
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _prune(output_dir: str, current: str, keep: int) -> None:
+    """Keep the newest ``keep`` snapshots so clients holding an older manifest can still load theirs."""
+    snapshots = sorted(glob.glob(os.path.join(output_dir, "catalog.*.json")), key=os.path.getmtime, reverse=True)
+    stale = [path for path in snapshots if os.path.basename(path) != current][max(keep - 1, 0):]
+    for path in stale:
+        for variant in glob.glob(f"{path}*"):
+            os.remove(variant)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", default=SNAPSHOT_DIR, help="directory served by static hosting")
+    parser.add_argument("--keep", type=int, default=3, help="snapshots to keep, including the new one")
+    args = parser.parse_args(argv)
+    manifest = build_snapshot(args.output_dir, args.keep)
+    print(f"Wrote {manifest['file']} ({manifest['items']} items, {manifest['bytes']} bytes)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""State store and work queue for asynchronous checkout.
+
+With CHECKOUT_MODE=async, order-processing answers 202 with an order token
+as soon as the tickets are reserved and the payment is stored. The
+reservation itself writes the RESERVED row of the CHECKOUT table
+(inventory_management.reserve_items with an ``order_token``); the payment
+step moves it to PAID along with the shipping details, and only the token
+is queued for the order and shipping work. Card data never enters the
+queue. ``order-processing.checkout_worker_handler`` consumes the queue, and
+``GET /order-processing/order/{token}`` reads the progress back. A checkout
+that cannot be completed is released with
+inventory_management.release_checkout, so that module is deployed with
+order-processing in this mode. ``order-processing.checkout_sweep_handler``
+runs on a schedule and releases checkouts stuck in RESERVED or PAID.
+
+The queue is SQS in production. The event source mapping must enable
+ReportBatchItemFailures. LocalQueue stands in for it in tests and local runs.
+"""
+from __future__ import annotations
+
+import json
+import os
+from collections import deque
+from itertools import count
+
+import db
+
+
+# "sqs" or "local"
+CHECKOUT_QUEUE = os.environ.get('CHECKOUT_QUEUE', 'sqs')
+CHECKOUT_QUEUE_URL = os.environ.get('CHECKOUT_QUEUE_URL')
+
+# Checkout states, in order
+RESERVED = "RESERVED"
+PAID = "PAID"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+
+_COLUMNS = {
+    "shipping": "SHIPPING",
+    "payment_confirmation_number": "PAYMENT_CONFIRMATION_NUMBER",
+    "confirmation_number": "ORDER_CONFIRMATION_NUMBER",
+    "error": "ERROR",
+}
+
+
+def get(order_token: str) -> dict | None:
+    # Status polling hits this on every poll, so it borrows a pooled connection
+    with db.connection() as cnx:
+        cursor = cnx.cursor(dictionary=True)
+        try:
+            get_checkout = ("SELECT STATUS, ITEMS, SHIPPING, PAYMENT_CONFIRMATION_NUMBER, ORDER_CONFIRMATION_NUMBER, ERROR "
+                            "FROM CHECKOUT "
+                            "WHERE ORDER_TOKEN = %s")
+            cursor.execute(get_checkout, (order_token,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    if row is None:
+        return None
+    return {
+        "order_token": order_token,
+        "status": row["STATUS"],
+        "items": json.loads(row["ITEMS"]),
+        "shipping": json.loads(row["SHIPPING"]) if row["SHIPPING"] else None,
+        "payment_confirmation_number": row["PAYMENT_CONFIRMATION_NUMBER"],
+        "confirmation_number": row["ORDER_CONFIRMATION_NUMBER"],
+        "error": row["ERROR"],
+    }
+
+
+def advance(order_token: str, from_statuses: tuple[str, ...], to_status: str, cnx=None, **fields) -> bool:
+    """Move a checkout to ``to_status`` if it is still in one of ``from_statuses``.
+
+    ``fields`` sets shipping (a dict), payment_confirmation_number,
+    confirmation_number or error along with the status. The status check
+    makes every transition happen at most once, even when the queue
+    delivers a message twice. With ``cnx`` the update joins the caller's
+    open transaction and is not committed here. Returns whether this call
+    made the transition.
+    """
+    if "shipping" in fields:
+        fields["shipping"] = json.dumps(fields["shipping"])
+    if cnx is None:
+        # One statement, autocommitted on a pooled connection
+        with db.connection() as cnx:
+            return _update(cnx, order_token, from_statuses, to_status, fields)
+    return _update(cnx, order_token, from_statuses, to_status, fields)
+
+
+def _update(cnx, order_token: str, from_statuses: tuple[str, ...], to_status: str, fields: dict) -> bool:
+    assignments = ["STATUS = %s"] + [f"{_COLUMNS[name]} = %s" for name in fields]
+    cursor = cnx.cursor()
+    try:
+        update_checkout = (f"UPDATE CHECKOUT SET {', '.join(assignments)} "
+                           "WHERE ORDER_TOKEN = %s "
+                           f"AND STATUS IN ({', '.join(['%s'] * len(from_statuses))})")
+        cursor.execute(update_checkout, (to_status, *fields.values(), order_token, *from_statuses))
+        return cursor.rowcount == 1
+    finally:
+        cursor.close()
+
+
+def stale(older_than: float, limit: int) -> list[str]:
+    """Tokens of RESERVED or PAID checkouts without an order, unchanged for ``older_than`` seconds."""
+    with db.connection() as cnx:
+        cursor = cnx.cursor()
+        try:
+            get_stale = ("SELECT ORDER_TOKEN FROM CHECKOUT "
+                         "WHERE STATUS IN (%s, %s) "
+                         "AND UPDATED_AT < CURRENT_TIMESTAMP - INTERVAL %s SECOND "
+                         "AND NOT EXISTS (SELECT 1 FROM ORDERS WHERE ORDERS.ORDER_TOKEN = CHECKOUT.ORDER_TOKEN) "
+                         "ORDER BY UPDATED_AT "
+                         "LIMIT %s")
+            cursor.execute(get_stale, (RESERVED, PAID, int(older_than), limit))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+
+class SqsQueue:
+    def __init__(self, url: str, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('sqs')
+        self._url = url
+        self._client = client
+
+    def send(self, message: dict) -> None:
+        self._client.send_message(QueueUrl=self._url, MessageBody=json.dumps(message))
+
+
+class LocalQueue:
+    """In-memory stand-in for SQS.
+
+    ``drain`` hands queued messages to a handler as SQS-shaped events and
+    redelivers any the handler reports in ``batchItemFailures``, counting
+    deliveries in ``ApproximateReceiveCount`` as SQS does.
+    """
+
+    def __init__(self):
+        self._messages: deque[dict] = deque()
+        self._ids = count(1)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def send(self, message: dict) -> None:
+        self._messages.append({
+            "messageId": str(next(self._ids)),
+            "body": json.dumps(message),
+            "attributes": {"ApproximateReceiveCount": "0"},
+        })
+
+    def drain(self, handler, max_rounds: int = 10) -> int:
+        """Deliver until the queue is empty or max_rounds; return messages processed."""
+        processed = 0
+        for _ in range(max_rounds):
+            if not self._messages:
+                break
+            records = list(self._messages)
+            self._messages.clear()
+            for record in records:
+                attributes = record["attributes"]
+                attributes["ApproximateReceiveCount"] = str(int(attributes["ApproximateReceiveCount"]) + 1)
+            result = handler({"Records": records}, None) or {}
+            failed = {failure["itemIdentifier"] for failure in result.get("batchItemFailures", [])}
+            self._messages.extend(record for record in records if record["messageId"] in failed)
+            processed += len(records) - len(failed)
+        return processed
+
+
+_QUEUE = None
+
+
+def queue():
+    """The configured work queue, created once per container."""
+    global _QUEUE
+    if _QUEUE is None:
+        _QUEUE = LocalQueue() if CHECKOUT_QUEUE == 'local' else SqsQueue(CHECKOUT_QUEUE_URL)
+    return _QUEUE
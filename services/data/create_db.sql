@@ -1,4 +1,6 @@
 -- MySQL Workbench Forward Engineering
+-- Tables that already exist are left as they are; upgrade_db.sql adds the
+-- columns and indexes introduced since they were created.
 
 SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS, UNIQUE_CHECKS=0;
 SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS, FOREIGN_KEY_CHECKS=0;
@@ -21,7 +23,9 @@ CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`ADDRESS` (
   `CITY` VARCHAR(255) NULL DEFAULT NULL,
   `STATE` VARCHAR(255) NULL DEFAULT NULL,
   `POSTAL_CODE` VARCHAR(255) NULL DEFAULT NULL,
-  PRIMARY KEY (`ADDRESS_ID`))
+  `SHIPPING_INFO_CONFIRMATION_NUMBER` VARCHAR(255) NULL DEFAULT NULL,
+  PRIMARY KEY (`ADDRESS_ID`),
+  INDEX `SHIPPING_INFO_CONFIRMATION_NUMBER` (`SHIPPING_INFO_CONFIRMATION_NUMBER` ASC) VISIBLE)
 ENGINE = InnoDB
 AUTO_INCREMENT = 6
 DEFAULT CHARACTER SET = utf8mb4
@@ -41,13 +45,56 @@ CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`Vacation` (
   `shortDescription` VARCHAR(255) NULL DEFAULT NULL,
   `description` TEXT NULL DEFAULT NULL,
   `availableTickets` INT NULL DEFAULT NULL,
-  PRIMARY KEY (`id`))
+  `ticketShards` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id`),
+  FULLTEXT INDEX `ft_vacation_search` (`name`, `location`, `shortDescription`) VISIBLE)
 ENGINE = InnoDB
 AUTO_INCREMENT = 6
 DEFAULT CHARACTER SET = utf8mb4
 COLLATE = utf8mb4_0900_ai_ci;
 
 
+-- -----------------------------------------------------
+-- Table `vacationsalesdb`.`VacationTicketShard`
+-- Sharded ticket counters for hot items. While Vacation.ticketShards > 0 the
+-- item's stock is the sum of its shard rows and Vacation.availableTickets is 0.
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`VacationTicketShard` (
+  `vacationId` INT NOT NULL,
+  `shardId` INT NOT NULL,
+  `availableTickets` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`vacationId`, `shardId`),
+  CONSTRAINT `VacationTicketShard_ibfk_1`
+    FOREIGN KEY (`vacationId`)
+    REFERENCES `vacationsalesdb`.`Vacation` (`id`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_0900_ai_ci;
+
+
+-- -----------------------------------------------------
+-- Table `vacationsalesdb`.`VacationDocument`
+-- Materialized item documents (everything but availableTickets, which is
+-- overlaid live). The triggers below bump `version` and clear `document`
+-- whenever a vacation or its child rows change, inserting the row if it is
+-- missing; readers rebuild a cleared document only if `version` is
+-- unchanged since they read it.
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`VacationDocument` (
+  `vacationId` INT NOT NULL,
+  `version` INT NOT NULL DEFAULT 0,
+  `document` MEDIUMTEXT NULL DEFAULT NULL,
+  `updatedAt` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`vacationId`),
+  CONSTRAINT `VacationDocument_ibfk_1`
+    FOREIGN KEY (`vacationId`)
+    REFERENCES `vacationsalesdb`.`Vacation` (`id`)
+    ON DELETE CASCADE)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_0900_ai_ci;
+
+
 -- -----------------------------------------------------
 -- Table `vacationsalesdb`.`Highlight`
 -- -----------------------------------------------------
@@ -112,7 +159,10 @@ CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`ORDERS` (
   `SHIPPING_INFO_CONFIRMATION_NUMBER` VARCHAR(255) NULL DEFAULT NULL,
   `PAYMENT_INFO_CONFIRMATION_NUMBER` VARCHAR(255) NULL DEFAULT NULL,
   `STATUS` VARCHAR(255) NULL DEFAULT 'New',
-  PRIMARY KEY (`ORDER_ID`))
+  `ORDER_TOKEN` CHAR(32) NULL DEFAULT NULL,
+  PRIMARY KEY (`ORDER_ID`),
+  UNIQUE INDEX `ORDER_CONFIRMATION_NUMBER` (`ORDER_CONFIRMATION_NUMBER` ASC) VISIBLE,
+  UNIQUE INDEX `ORDER_TOKEN` (`ORDER_TOKEN` ASC) VISIBLE)
 ENGINE = InnoDB
 AUTO_INCREMENT = 11
 DEFAULT CHARACTER SET = utf8mb4
@@ -139,6 +189,70 @@ DEFAULT CHARACTER SET = utf8mb4
 COLLATE = utf8mb4_0900_ai_ci;
 
 
+-- -----------------------------------------------------
+-- Table `vacationsalesdb`.`OUTBOX`
+-- Events written in the same transaction as the order; outbox.py publishes
+-- unpublished rows in batches and stamps PUBLISHED_AT.
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`OUTBOX` (
+  `OUTBOX_ID` BIGINT NOT NULL AUTO_INCREMENT,
+  `TOPIC` VARCHAR(64) NOT NULL,
+  `PAYLOAD` TEXT NOT NULL,
+  `CREATED_AT` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `PUBLISHED_AT` TIMESTAMP NULL DEFAULT NULL,
+  `ATTEMPTS` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`OUTBOX_ID`),
+  INDEX `PUBLISHED_AT` (`PUBLISHED_AT` ASC, `OUTBOX_ID` ASC) VISIBLE)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_0900_ai_ci;
+
+
+-- -----------------------------------------------------
+-- Table `vacationsalesdb`.`CHECKOUT`
+-- Progress of asynchronous checkouts: RESERVED when tickets are held,
+-- PAID after the payment step, then COMPLETED or FAILED. The row is written
+-- in the reservation's transaction, so ITEMS is exactly what was reserved.
+-- Rows stuck in RESERVED or PAID are found by STATUS and UPDATED_AT and
+-- released by order-processing's checkout_sweep_handler.
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`CHECKOUT` (
+  `ORDER_TOKEN` CHAR(32) NOT NULL,
+  `STATUS` VARCHAR(16) NOT NULL,
+  `ITEMS` TEXT NOT NULL,
+  `SHIPPING` TEXT NULL DEFAULT NULL,
+  `PAYMENT_CONFIRMATION_NUMBER` VARCHAR(255) NULL DEFAULT NULL,
+  `ORDER_CONFIRMATION_NUMBER` VARCHAR(255) NULL DEFAULT NULL,
+  `ERROR` TEXT NULL DEFAULT NULL,
+  `CREATED_AT` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `UPDATED_AT` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`ORDER_TOKEN`),
+  INDEX `STATUS` (`STATUS` ASC, `UPDATED_AT` ASC) VISIBLE)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_0900_ai_ci;
+
+
+-- -----------------------------------------------------
+-- Table `vacationsalesdb`.`IDEMPOTENCY`
+-- Idempotency-Key claims of order submissions, shared by every
+-- order-processing container (see idempotency.py). IN_PROGRESS rows expire
+-- after the lock timeout, COMPLETED rows after the replay TTL.
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`IDEMPOTENCY` (
+  `IDEMPOTENCY_KEY` VARCHAR(255) NOT NULL,
+  `FINGERPRINT` CHAR(64) NOT NULL,
+  `STATUS` VARCHAR(16) NOT NULL,
+  `RESPONSE` MEDIUMTEXT NULL DEFAULT NULL,
+  `EXPIRES_AT` DATETIME NOT NULL,
+  `CREATED_AT` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`IDEMPOTENCY_KEY`),
+  INDEX `EXPIRES_AT` (`EXPIRES_AT` ASC) VISIBLE)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_0900_ai_ci;
+
+
 -- -----------------------------------------------------
 -- Table `vacationsalesdb`.`PAYMENT_INFO`
 -- -----------------------------------------------------
@@ -149,7 +263,9 @@ CREATE TABLE IF NOT EXISTS `vacationsalesdb`.`PAYMENT_INFO` (
   `CARD_NUM` VARCHAR(255) NULL DEFAULT NULL,
   `EXP_DATE` VARCHAR(255) NULL DEFAULT NULL,
   `CVV` CHAR(3) NULL DEFAULT NULL,
-  PRIMARY KEY (`PAYMENT_INFO_ID`))
+  `ORDER_TOKEN` CHAR(32) NULL DEFAULT NULL,
+  PRIMARY KEY (`PAYMENT_INFO_ID`),
+  UNIQUE INDEX `ORDER_TOKEN` (`ORDER_TOKEN` ASC) VISIBLE)
 ENGINE = InnoDB
 AUTO_INCREMENT = 23
 DEFAULT CHARACTER SET = utf8mb4
@@ -177,6 +293,127 @@ DEFAULT CHARACTER SET = utf8mb4
 COLLATE = utf8mb4_0900_ai_ci;
 
 
+-- -----------------------------------------------------
+-- Triggers keeping `VacationDocument` in sync
+-- They upsert the document row, so vacations created before the table
+-- existed get a version row on their first change too. Dropped and
+-- recreated, so rerunning this script updates them.
+-- -----------------------------------------------------
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS `vacationsalesdb`.`invalidate_vacation_document`$$
+
+CREATE PROCEDURE `vacationsalesdb`.`invalidate_vacation_document`(IN p_vacation_id INT)
+BEGIN
+  IF p_vacation_id IS NOT NULL THEN
+    INSERT INTO `vacationsalesdb`.`VacationDocument` (`vacationId`, `version`)
+    VALUES (p_vacation_id, 1)
+    ON DUPLICATE KEY UPDATE `version` = `version` + 1, `document` = NULL;
+  END IF;
+END$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Vacation_document_insert`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Vacation_document_insert`
+AFTER INSERT ON `vacationsalesdb`.`Vacation`
+FOR EACH ROW
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(NEW.id)$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Vacation_document_update`$$
+
+-- Reservations only touch availableTickets/ticketShards and leave documents alone
+CREATE TRIGGER `vacationsalesdb`.`Vacation_document_update`
+AFTER UPDATE ON `vacationsalesdb`.`Vacation`
+FOR EACH ROW
+BEGIN
+  IF NOT (OLD.name <=> NEW.name AND OLD.location <=> NEW.location AND OLD.price <=> NEW.price
+          AND OLD.duration <=> NEW.duration AND OLD.departureDate <=> NEW.departureDate
+          AND OLD.shortDescription <=> NEW.shortDescription AND OLD.description <=> NEW.description) THEN
+    CALL `vacationsalesdb`.`invalidate_vacation_document`(NEW.id);
+  END IF;
+END$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Image_document_insert`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Image_document_insert`
+AFTER INSERT ON `vacationsalesdb`.`Image`
+FOR EACH ROW
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(NEW.vacationId)$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Image_document_update`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Image_document_update`
+AFTER UPDATE ON `vacationsalesdb`.`Image`
+FOR EACH ROW
+BEGIN
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(NEW.vacationId);
+  IF NOT OLD.vacationId <=> NEW.vacationId THEN
+    CALL `vacationsalesdb`.`invalidate_vacation_document`(OLD.vacationId);
+  END IF;
+END$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Image_document_delete`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Image_document_delete`
+AFTER DELETE ON `vacationsalesdb`.`Image`
+FOR EACH ROW
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(OLD.vacationId)$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Include_document_insert`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Include_document_insert`
+AFTER INSERT ON `vacationsalesdb`.`Include`
+FOR EACH ROW
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(NEW.vacationId)$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Include_document_update`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Include_document_update`
+AFTER UPDATE ON `vacationsalesdb`.`Include`
+FOR EACH ROW
+BEGIN
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(NEW.vacationId);
+  IF NOT OLD.vacationId <=> NEW.vacationId THEN
+    CALL `vacationsalesdb`.`invalidate_vacation_document`(OLD.vacationId);
+  END IF;
+END$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Include_document_delete`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Include_document_delete`
+AFTER DELETE ON `vacationsalesdb`.`Include`
+FOR EACH ROW
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(OLD.vacationId)$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Highlight_document_insert`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Highlight_document_insert`
+AFTER INSERT ON `vacationsalesdb`.`Highlight`
+FOR EACH ROW
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(NEW.vacationId)$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Highlight_document_update`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Highlight_document_update`
+AFTER UPDATE ON `vacationsalesdb`.`Highlight`
+FOR EACH ROW
+BEGIN
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(NEW.vacationId);
+  IF NOT OLD.vacationId <=> NEW.vacationId THEN
+    CALL `vacationsalesdb`.`invalidate_vacation_document`(OLD.vacationId);
+  END IF;
+END$$
+
+DROP TRIGGER IF EXISTS `vacationsalesdb`.`Highlight_document_delete`$$
+
+CREATE TRIGGER `vacationsalesdb`.`Highlight_document_delete`
+AFTER DELETE ON `vacationsalesdb`.`Highlight`
+FOR EACH ROW
+  CALL `vacationsalesdb`.`invalidate_vacation_document`(OLD.vacationId)$$
+
+DELIMITER ;
+
+
 SET SQL_MODE=@OLD_SQL_MODE;
 SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS;
 SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS;
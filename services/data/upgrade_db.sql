@@ -0,0 +1,82 @@
+-- Upgrades a vacationsalesdb created by an earlier create_db.sql in place.
+--
+-- create_db.sql only creates the tables that are missing, so columns and
+-- indexes later added to existing tables are applied here. Run create_db.sql
+-- first for the new tables, then this script; every step is skipped when it
+-- has already been applied, so the script can be run again safely:
+--
+--   mysql -u USER -p < services/data/create_db.sql
+--   mysql -u USER -p < services/data/upgrade_db.sql
+
+USE `vacationsalesdb` ;
+
+DROP PROCEDURE IF EXISTS `upgrade_add_column`;
+DROP PROCEDURE IF EXISTS `upgrade_add_index`;
+
+DELIMITER $$
+
+CREATE PROCEDURE `upgrade_add_column`(IN p_table VARCHAR(64), IN p_column VARCHAR(64), IN p_definition TEXT)
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.COLUMNS
+                 WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND COLUMN_NAME = p_column) THEN
+    SET @upgrade_statement = CONCAT('ALTER TABLE `', p_table, '` ADD COLUMN `', p_column, '` ', p_definition);
+    PREPARE upgrade_statement FROM @upgrade_statement;
+    EXECUTE upgrade_statement;
+    DEALLOCATE PREPARE upgrade_statement;
+  END IF;
+END$$
+
+-- p_definition is everything after ADD, e.g. 'INDEX `x` (`x` ASC)'
+CREATE PROCEDURE `upgrade_add_index`(IN p_table VARCHAR(64), IN p_index VARCHAR(64), IN p_definition TEXT)
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.STATISTICS
+                 WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = p_table AND INDEX_NAME = p_index) THEN
+    SET @upgrade_statement = CONCAT('ALTER TABLE `', p_table, '` ADD ', p_definition);
+    PREPARE upgrade_statement FROM @upgrade_statement;
+    EXECUTE upgrade_statement;
+    DEALLOCATE PREPARE upgrade_statement;
+  END IF;
+END$$
+
+DELIMITER ;
+
+
+-- -----------------------------------------------------
+-- Sharded ticket counters: every inventory read selects Vacation.ticketShards
+-- -----------------------------------------------------
+CALL upgrade_add_column('Vacation', 'ticketShards', 'INT NOT NULL DEFAULT 0');
+
+
+-- -----------------------------------------------------
+-- Ranked search (SEARCH_BACKEND=fulltext)
+-- -----------------------------------------------------
+CALL upgrade_add_index('Vacation', 'ft_vacation_search',
+                       'FULLTEXT INDEX `ft_vacation_search` (`name`, `location`, `shortDescription`)');
+
+
+-- -----------------------------------------------------
+-- Orders are looked up by their confirmation number when written in batches
+-- -----------------------------------------------------
+CALL upgrade_add_index('ORDERS', 'ORDER_CONFIRMATION_NUMBER',
+                       'UNIQUE INDEX `ORDER_CONFIRMATION_NUMBER` (`ORDER_CONFIRMATION_NUMBER` ASC)');
+
+
+-- -----------------------------------------------------
+-- Asynchronous checkout: at most one order and one payment per order token
+-- -----------------------------------------------------
+CALL upgrade_add_column('ORDERS', 'ORDER_TOKEN', 'CHAR(32) NULL DEFAULT NULL');
+CALL upgrade_add_index('ORDERS', 'ORDER_TOKEN', 'UNIQUE INDEX `ORDER_TOKEN` (`ORDER_TOKEN` ASC)');
+CALL upgrade_add_column('PAYMENT_INFO', 'ORDER_TOKEN', 'CHAR(32) NULL DEFAULT NULL');
+CALL upgrade_add_index('PAYMENT_INFO', 'ORDER_TOKEN', 'UNIQUE INDEX `ORDER_TOKEN` (`ORDER_TOKEN` ASC)');
+
+
+-- -----------------------------------------------------
+-- Batched shipping writes read ADDRESS ids back by confirmation number
+-- -----------------------------------------------------
+CALL upgrade_add_column('ADDRESS', 'SHIPPING_INFO_CONFIRMATION_NUMBER', 'VARCHAR(255) NULL DEFAULT NULL');
+CALL upgrade_add_index('ADDRESS', 'SHIPPING_INFO_CONFIRMATION_NUMBER',
+                       'INDEX `SHIPPING_INFO_CONFIRMATION_NUMBER` (`SHIPPING_INFO_CONFIRMATION_NUMBER` ASC)');
+
+
+DROP PROCEDURE `upgrade_add_column`;
+DROP PROCEDURE `upgrade_add_index`;
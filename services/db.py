@@ -0,0 +1,135 @@
+"""MySQL connections shared by the service modules.
+
+``connect`` opens a single connection from the DB_* environment variables.
+``connection`` borrows one from a pool that lives at module level, so it
+survives across warm Lambda invocations; request paths use it. Pooled
+connections run in autocommit mode, so multi-statement writes on them call
+``start_transaction()`` explicitly.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errorcode
+
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '4'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+# Connections idle for less than this many seconds are handed out without a ping
+DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', '1'))
+
+
+def connect(autocommit: bool = False):
+    try:
+        return mysql.connector.connect(
+            host=os.environ.get('DB_HOST'),
+            user=os.environ.get('DB_USER'),
+            password=os.environ.get('DB_PASSWORD'),
+            database=os.environ.get('DB_NAME'),
+            autocommit=autocommit,
+        )
+    except mysql.connector.Error as err:
+        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
+            print("Something is wrong with your user name or password")
+        elif err.errno == errorcode.ER_BAD_DB_ERROR:
+            print("Database does not exist")
+        else:
+            print(err)
+        raise
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections kept alive across warm invocations.
+
+    Idle connections are reused LIFO so the most recently used (and least
+    likely to have been dropped by the server) is handed out first. A
+    connection that has been idle longer than ``ping_interval`` is pinged on
+    borrow and transparently reconnected if the server has closed it.
+    """
+
+    def __init__(self, size: int, timeout: float, ping_interval: float):
+        self._size = size
+        self._timeout = timeout
+        self._ping_interval = ping_interval
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []  # (connection, released_at)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise RuntimeError(f"Timed out waiting for a database connection (pool size {self._size})")
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    # Pooled connections must not keep a REPEATABLE READ snapshot
+                    # open between requests; writes use an explicit start_transaction()
+                    return connect(autocommit=True)
+                cnx, released_at = entry
+                if time.monotonic() - released_at < self._ping_interval:
+                    return cnx
+                try:
+                    cnx.ping(reconnect=True, attempts=1, delay=0)
+                    return cnx
+                except mysql.connector.Error as err:
+                    print(f"Discarding dead pooled connection: {err}")
+                    self._close_quietly(cnx)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, cnx, discard: bool = False) -> None:
+        try:
+            if not discard:
+                try:
+                    if cnx.in_transaction:
+                        cnx.rollback()
+                except mysql.connector.Error:
+                    discard = True
+            if discard:
+                self._close_quietly(cnx)
+            else:
+                with self._lock:
+                    self._idle.append((cnx, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def clear(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for cnx, _ in idle:
+            self._close_quietly(cnx)
+
+    @staticmethod
+    def _close_quietly(cnx) -> None:
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+
+# One pool per container, shared by every module loaded into it
+POOL = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_PING_INTERVAL)
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection, returning it to the pool afterwards.
+
+    Connections that fail with an operational/interface error (lost
+    connection, server gone away) are discarded instead of being reused.
+    """
+    cnx = POOL.acquire()
+    discard = False
+    try:
+        yield cnx
+    except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+        discard = True
+        raise
+    finally:
+        POOL.release(cnx, discard=discard)
@@ -0,0 +1,36 @@
+"""Export the full inventory catalog as NDJSON, one item per line.
+
+Usage:
+    python export_catalog.py [--output FILE]
+
+Writes to stdout by default, so the feed can be piped straight on, e.g.
+``python export_catalog.py | aws s3 cp - s3://bucket/catalog.ndjson``.
+Uses the same DB_* environment variables as the inventory service.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+
+import inventory_management
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", "-o", help="file to write instead of stdout")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        count = 0
+        for line in inventory_management.export_catalog():
+            out.write(line)
+            count += 1
+    finally:
+        if args.output:
+            out.close()
+    print(f"Exported {count} items", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
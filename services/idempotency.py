@@ -0,0 +1,147 @@
+"""Shared store of Idempotency-Key claims and responses.
+
+order-processing claims a key by inserting its row into the IDEMPOTENCY
+table; the primary key rejects a second claim, whichever Lambda container
+it comes from. When the submission finishes, its response is stored for
+the replay TTL, or the row is deleted if the submission failed so the key
+can be retried. A claim whose container died is taken over once its
+EXPIRES_AT passes, so IDEMPOTENCY_LOCK_TIMEOUT must exceed the function
+timeout.
+
+Expired rows are only overwritten when their key is reused; run this
+module on a schedule (or ``python idempotency.py``) to delete them.
+"""
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import mysql.connector
+from mysql.connector import errorcode
+
+import db
+
+
+IDEMPOTENCY_PURGE_BATCH_SIZE = int(os.environ.get('IDEMPOTENCY_PURGE_BATCH_SIZE', '1000'))
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+
+def _now() -> datetime:
+    # Naive UTC, as DATETIME columns come back
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def claim(key: str, fingerprint: str, lock_timeout: float) -> dict | None:
+    """Claim ``key`` for a new submission.
+
+    Returns None if the caller now owns the key, otherwise the existing
+    claim as ``{"fingerprint", "status", "response"}`` (``response`` is the
+    stored proxy response once COMPLETED).
+    """
+    with db.connection() as cnx:
+        return _claim(cnx, key, fingerprint, lock_timeout)
+
+
+def _claim(cnx, key: str, fingerprint: str, lock_timeout: float) -> dict | None:
+    cursor = cnx.cursor(dictionary=True)
+    try:
+        now = _now()
+        expires_at = now + timedelta(seconds=lock_timeout)
+        insert_claim = ("INSERT INTO IDEMPOTENCY (IDEMPOTENCY_KEY, FINGERPRINT, STATUS, EXPIRES_AT) "
+                        "VALUES (%s, %s, %s, %s)")
+        try:
+            cursor.execute(insert_claim, (key, fingerprint, IN_PROGRESS, expires_at))
+            cnx.commit()
+            return None
+        except mysql.connector.IntegrityError as err:
+            if err.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            cnx.rollback()
+
+        # The key is taken; an expired row (stale claim or old response) is ours to reuse
+        take_over = ("UPDATE IDEMPOTENCY "
+                     "SET FINGERPRINT = %s, STATUS = %s, RESPONSE = NULL, EXPIRES_AT = %s "
+                     "WHERE IDEMPOTENCY_KEY = %s AND EXPIRES_AT <= %s")
+        cursor.execute(take_over, (fingerprint, IN_PROGRESS, expires_at, key, now))
+        cnx.commit()
+        if cursor.rowcount == 1:
+            return None
+
+        get_claim = "SELECT FINGERPRINT, STATUS, RESPONSE FROM IDEMPOTENCY WHERE IDEMPOTENCY_KEY = %s"
+        cursor.execute(get_claim, (key,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if row is None:
+        # Released between the insert and the read; the caller tries again
+        return {"fingerprint": fingerprint, "status": IN_PROGRESS, "response": None}
+    return _claim_of(row)
+
+
+def lookup(key: str) -> dict | None:
+    """The live claim on ``key`` as ``claim`` reports it; None once it is released or expired.
+
+    A single SELECT, for duplicates polling while the original runs.
+    """
+    with db.connection() as cnx:
+        cursor = cnx.cursor(dictionary=True)
+        try:
+            get_claim = ("SELECT FINGERPRINT, STATUS, RESPONSE FROM IDEMPOTENCY "
+                         "WHERE IDEMPOTENCY_KEY = %s AND EXPIRES_AT > %s")
+            cursor.execute(get_claim, (key, _now()))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    return None if row is None else _claim_of(row)
+
+
+def _claim_of(row: dict) -> dict:
+    return {
+        "fingerprint": row["FINGERPRINT"],
+        "status": row["STATUS"],
+        "response": json.loads(row["RESPONSE"]) if row["RESPONSE"] else None,
+    }
+
+
+def complete(key: str, response: dict, ttl: float) -> None:
+    """Store the response of the submission that claimed ``key`` for ``ttl`` seconds."""
+    _execute("UPDATE IDEMPOTENCY SET STATUS = %s, RESPONSE = %s, EXPIRES_AT = %s WHERE IDEMPOTENCY_KEY = %s",
+             (COMPLETED, json.dumps(response), _now() + timedelta(seconds=ttl), key))
+
+
+def release(key: str) -> None:
+    """Drop an unfinished claim so the key can be used again."""
+    _execute("DELETE FROM IDEMPOTENCY WHERE IDEMPOTENCY_KEY = %s AND STATUS = %s", (key, IN_PROGRESS))
+
+
+def purge_expired(batch_size: int = IDEMPOTENCY_PURGE_BATCH_SIZE) -> int:
+    """Delete expired rows in batches; returns how many were deleted."""
+    deleted = 0
+    while True:
+        count = _execute("DELETE FROM IDEMPOTENCY WHERE EXPIRES_AT <= %s LIMIT %s", (_now(), batch_size))
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def _execute(query: str, data: tuple) -> int:
+    with db.connection() as cnx:
+        cursor = cnx.cursor()
+        try:
+            cursor.execute(query, data)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+
+def lambda_handler(event: dict, context):
+    deleted = purge_expired()
+    print(f"Purged {deleted} expired idempotency keys")
+    return {"deleted": deleted}
+
+
+if __name__ == "__main__":
+    lambda_handler({}, None)
@@ -1,48 +1,72 @@
 import os
+import re
 import json
+import base64
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
 from uuid import uuid4
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Union
 
 import requests
 import mysql.connector
 from mysql.connector import errorcode
 
+import api_response
+import db
+
 ROOT_URL = os.environ.get('ROOT_URL')
 HEADERS = {
     "Content-Type": "application/json",
-    "Access-Control-Allow-Headers": "Content-Type",
+    "Access-Control-Allow-Headers": "Content-Type, If-None-Match",
     "Access-Control-Allow-Methods": "GET, POST",
+    "Access-Control-Expose-Headers": "ETag",
 }
+# Static catalog fields (names, descriptions, images, ...) change rarely;
+# availableTickets changes on every reservation and gets a much shorter TTL
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '300'))
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', '1024'))
+AVAILABILITY_CACHE_TTL = float(os.environ.get('AVAILABILITY_CACHE_TTL', '5'))
+# Seconds browsers and CDNs may reuse the live availability map
+AVAILABILITY_MAX_AGE = int(os.environ.get('AVAILABILITY_MAX_AGE', '5'))
+# "index" searches an in-process trigram index; "fulltext" uses the MySQL
+# FULLTEXT index on Vacation(name, location, shortDescription)
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'index')
+SEARCH_INDEX_TTL = float(os.environ.get('SEARCH_INDEX_TTL', str(CATALOG_CACHE_TTL)))
+SEARCH_DEFAULT_LIMIT = int(os.environ.get('SEARCH_DEFAULT_LIMIT', '50'))
+SEARCH_MAX_LIMIT = int(os.environ.get('SEARCH_MAX_LIMIT', '200'))
+# Page size of the cursor-paginated inventory listing
+PAGE_DEFAULT_LIMIT = int(os.environ.get('PAGE_DEFAULT_LIMIT', '24'))
+PAGE_MAX_LIMIT = int(os.environ.get('PAGE_MAX_LIMIT', '200'))
+# Most ids one ?ids= request may name
+IDS_MAX_COUNT = int(os.environ.get('IDS_MAX_COUNT', '200'))
+# Rows pulled from the server per round trip by the streaming export
+EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', '500'))
+# "locking" takes SELECT ... FOR UPDATE row locks; "optimistic" uses a
+# conditional decrement for carts of up to OPTIMISTIC_MAX_CART_SIZE items
+RESERVATION_MODE = os.environ.get('RESERVATION_MODE', 'locking')
+OPTIMISTIC_MAX_CART_SIZE = int(os.environ.get('OPTIMISTIC_MAX_CART_SIZE', '5'))
+# How long the set of sharded items is trusted before it is re-read
+SHARD_MAP_TTL = float(os.environ.get('SHARD_MAP_TTL', '30'))
+# Items seen at 0 tickets are rejected without a database round trip for this long
+SOLD_OUT_TTL = float(os.environ.get('SOLD_OUT_TTL', '2'))
 
-def _response(status: int, body: Union[Dict, List, None] = None) -> dict:
-    response = {
-        "isBase64Encoded": False,
-        "statusCode": status,
-        "headers": HEADERS,
-    }
-    if body is not None:
-        response["body"] = json.dumps(body)
-    return response
+def _response(status: int, body: Union[Dict, List, None] = None, headers: Optional[dict] = None,
+              encoded: Optional[bytes] = None) -> dict:
+    return api_response.build(status, body, {**HEADERS, **headers} if headers else HEADERS, encoded)
+
+# Shared with the other modules loaded into the container
+_db_connection = db.connection
 
-def _connect_to_db():
-    try:
-        return mysql.connector.connect(
-            host=os.environ.get('DB_HOST'),
-            user=os.environ.get('DB_USER'),
-            password=os.environ.get('DB_PASSWORD'),
-            database=os.environ.get('DB_NAME'),
-        )
-    except mysql.connector.Error as err:
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-            print("Something is wrong with your user name or password")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
-            print("Database does not exist")
-        else:
-            print(err)
-        raise
 
 def _execute_query(query: str, data: tuple = None, fetch_one=False, fetch_all=False):
-    cnx = _connect_to_db()
+    with _db_connection() as cnx:
+        return _execute_on(cnx, query, data, fetch_one=fetch_one, fetch_all=fetch_all)
+
+
+def _execute_on(cnx, query: str, data: tuple = None, fetch_one=False, fetch_all=False):
     cursor = cnx.cursor(dictionary=True)  # Return results as dictionary
     try:
         if data is not None:
@@ -60,218 +84,1053 @@ def _execute_query(query: str, data: tuple = None, fetch_one=False, fetch_all=Fa
         return cursor.lastrowid
     finally:
         cursor.close()
-        cnx.close()
   
-def get_all_inventory() -> dict:
-    try:
-        # Get all vacations
-        get_vacations = (
-            "SELECT * "
-            "FROM Vacation "
-            "ORDER BY id;"
+class _CatalogCache:
+    """In-process LRU cache of item documents with TTL expiry.
+
+    Static item fields and ``availableTickets`` are stored separately so the
+    rarely changing part can be kept for minutes while availability is
+    refreshed every few seconds. Cached documents are shared between callers
+    and must be treated as read-only.
+
+    Each document is also kept JSON-encoded, split around its
+    ``availableTickets`` value, so a response splices in the live count
+    instead of re-serializing descriptions and image lists (see ``encode``).
+    """
+
+    def __init__(self, ttl: float, max_items: int, availability_ttl: float):
+        self._ttl = ttl
+        self._max_items = max_items
+        self._availability_ttl = availability_ttl
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (item, stored_at)
+        self._availability: Dict[int, tuple] = {}  # id -> (tickets, stored_at)
+        self._catalog_ids: Optional[tuple] = None  # (ids, stored_at) of the full listing
+        self._digests: Dict[int, str] = {}  # id -> content hash of the static fields
+        self._encoded: Dict[int, tuple] = {}  # id -> JSON bytes (before, after) availableTickets
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.availability_hits = 0
+        self.availability_misses = 0
+
+    def get_item(self, item_id: int) -> Optional[dict]:
+        with self._lock:
+            item = self._get_fresh(item_id, time.monotonic())
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return item
+
+    def get_catalog(self) -> Optional[List[dict]]:
+        """Return the static documents of the full listing, or None on a miss."""
+        with self._lock:
+            now = time.monotonic()
+            items = None
+            if self._catalog_ids is not None and now - self._catalog_ids[1] < self._ttl:
+                items = [self._get_fresh(item_id, now) for item_id in self._catalog_ids[0]]
+                if any(item is None for item in items):
+                    items = None
+            if items is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return items
+
+    def put_items(self, items: List[dict], full_catalog: bool = False) -> None:
+        """Cache assembled items, splitting off their ``availableTickets``.
+
+        A full listing larger than ``max_items`` is not cached at all: the
+        LRU would evict part of it and get_catalog would never hit, so
+        digesting and pre-encoding it would be wasted on every request.
+        """
+        if full_catalog and len(items) > self._max_items:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for item in items:
+                static = dict(item)
+                static["availableTickets"] = None  # keeps key order when overlaid
+                self._items[item["id"]] = (static, now)
+                self._digests[item["id"]] = _static_digest(static)
+                self._encoded[item["id"]] = _split_encoded(static)
+                self._items.move_to_end(item["id"])
+                self._availability[item["id"]] = (item.get("availableTickets"), now)
+            while len(self._items) > self._max_items:
+                evicted_id, _ = self._items.popitem(last=False)
+                self._availability.pop(evicted_id, None)
+                self._digests.pop(evicted_id, None)
+                self._encoded.pop(evicted_id, None)
+                self.evictions += 1
+            if full_catalog:
+                self._catalog_ids = (tuple(item["id"] for item in items), now)
+
+    def get_availability(self, item_ids: List[int]) -> Dict[int, Optional[int]]:
+        """Return fresh ticket counts; ids that are stale or unknown are omitted."""
+        with self._lock:
+            now = time.monotonic()
+            found = {}
+            for item_id in item_ids:
+                entry = self._availability.get(item_id)
+                if entry is not None and now - entry[1] < self._availability_ttl:
+                    found[item_id] = entry[0]
+            self.availability_hits += len(found)
+            self.availability_misses += len(item_ids) - len(found)
+            return found
+
+    def set_availability(self, tickets: Dict[int, Optional[int]]) -> None:
+        with self._lock:
+            now = time.monotonic()
+            for item_id, count in tickets.items():
+                if item_id in self._items:
+                    self._availability[item_id] = (count, now)
+
+    def expire_availability(self, item_ids: List[int]) -> None:
+        with self._lock:
+            for item_id in item_ids:
+                self._availability.pop(item_id, None)
+
+    def invalidate(self, item_ids: Optional[List[int]] = None) -> None:
+        """Drop the given items (and the full listing), or everything if None."""
+        with self._lock:
+            self._catalog_ids = None
+            if item_ids is None:
+                self._items.clear()
+                self._availability.clear()
+                self._digests.clear()
+                self._encoded.clear()
+                return
+            for item_id in item_ids:
+                self._items.pop(item_id, None)
+                self._availability.pop(item_id, None)
+                self._digests.pop(item_id, None)
+                self._encoded.pop(item_id, None)
+
+    def digest(self, item_id: int) -> Optional[str]:
+        with self._lock:
+            return self._digests.get(item_id)
+
+    def encode(self, items: List[dict]) -> Optional[List[bytes]]:
+        """JSON documents of ``items`` with their current ``availableTickets``.
+
+        Returns None if any item has no pre-encoded document, in which case
+        the caller serializes the items itself.
+        """
+        with self._lock:
+            parts = [self._encoded.get(item["id"]) for item in items]
+        if any(part is None for part in parts):
+            return None
+        return [
+            before + (b"null" if item["availableTickets"] is None else str(int(item["availableTickets"])).encode()) + after
+            for item, (before, after) in zip(items, parts)
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "availabilityHits": self.availability_hits,
+                "availabilityMisses": self.availability_misses,
+            }
+
+    def _get_fresh(self, item_id: int, now: float) -> Optional[dict]:
+        entry = self._items.get(item_id)
+        if entry is None:
+            return None
+        if now - entry[1] >= self._ttl:
+            del self._items[item_id]
+            self._availability.pop(item_id, None)
+            self._digests.pop(item_id, None)
+            self._encoded.pop(item_id, None)
+            return None
+        self._items.move_to_end(item_id)
+        return entry[0]
+
+
+_CACHE = _CatalogCache(CATALOG_CACHE_TTL, CATALOG_CACHE_SIZE, AVAILABILITY_CACHE_TTL)
+
+
+class _SoldOutCache:
+    """Short-lived negative cache of item ids last seen with no tickets left.
+
+    Lets reserve_items turn away carts for sold-out items without opening a
+    transaction. Entries expire after ``ttl`` seconds and are dropped as soon
+    as this process sees the item with stock again.
+    """
+
+    def __init__(self, ttl: float):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._items: Dict[int, tuple] = {}  # id -> (name, expires_at)
+        self.rejections = 0
+
+    def update(self, counts: Dict[int, int], names: Dict[int, str]) -> None:
+        """Record observed ticket counts: 0 marks an item sold out, more clears it."""
+        with self._lock:
+            expires_at = time.monotonic() + self._ttl
+            for item_id, count in counts.items():
+                if count is not None and count <= 0:
+                    self._items[item_id] = (names.get(item_id), expires_at)
+                else:
+                    self._items.pop(item_id, None)
+
+    def sold_out(self, item_ids: List[int]) -> Dict[int, Optional[str]]:
+        """Return ``{item_id: name}`` for the given ids currently marked sold out."""
+        with self._lock:
+            now = time.monotonic()
+            found = {}
+            for item_id in item_ids:
+                entry = self._items.get(item_id)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self._items[item_id]
+                else:
+                    found[item_id] = entry[0]
+            if found:
+                self.rejections += 1
+            return found
+
+    def clear(self, item_ids: Optional[List[int]] = None) -> None:
+        with self._lock:
+            if item_ids is None:
+                self._items.clear()
+            for item_id in item_ids or []:
+                self._items.pop(item_id, None)
+
+
+_SOLD_OUT = _SoldOutCache(SOLD_OUT_TTL)
+
+
+def _static_digest(item: dict) -> str:
+    static = dict(item, availableTickets=None)
+    return hashlib.sha1(json.dumps(static, sort_keys=True).encode()).hexdigest()
+
+
+_TICKETS_PLACEHOLDER = b'"availableTickets":null'
+
+
+def _split_encoded(static: dict) -> Optional[tuple]:
+    encoded = api_response.dumps(static)
+    if encoded.count(_TICKETS_PLACEHOLDER) != 1:
+        return None
+    before, _, after = encoded.partition(_TICKETS_PLACEHOLDER)
+    return before + b'"availableTickets":', after
+
+
+def _etag(items: List[dict]) -> str:
+    """Strong ETag over the static content and live ticket counts of ``items``.
+
+    Static digests are computed once when an item enters the cache, so a
+    revalidation only hashes ``(digest, availableTickets)`` pairs and never
+    serializes the documents.
+    """
+    etag = hashlib.sha1()
+    for item in items:
+        digest = _CACHE.digest(item["id"]) or _static_digest(item)
+        etag.update(f"{digest}:{item['availableTickets']};".encode())
+    return f'"{etag.hexdigest()[:32]}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _conditional_response(body: Union[Dict, List], items: List[dict], if_none_match: Optional[str],
+                          encoded: Optional[bytes] = None, etag: Optional[str] = None) -> dict:
+    if encoded is None:
+        # Some item is not cached: serialize the body once and hash that,
+        # rather than digesting every item separately first
+        encoded = api_response.dumps(body)
+        etag = etag or f'"{hashlib.sha1(encoded).hexdigest()[:32]}"'
+    etag = etag or _etag(items)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return _response(304, headers=headers)
+    return _response(200, body, headers=headers, encoded=encoded)
+
+
+# Live ticket count of the Vacation row aliased as v. Sharded items keep their
+# stock in VacationTicketShard and Vacation.availableTickets stays at 0.
+_LIVE_TICKETS = (
+    "CAST(IF(v.ticketShards > 0, "
+    "(SELECT COALESCE(SUM(s.availableTickets), 0) FROM VacationTicketShard s WHERE s.vacationId = v.id), "
+    "v.availableTickets) AS SIGNED)"
+)
+_VACATION_COLUMNS = (
+    "v.id, v.name, v.location, v.price, v.duration, v.departureDate, "
+    f"v.shortDescription, v.description, {_LIVE_TICKETS} AS availableTickets"
+)
+
+
+def _with_availability(cnx, items: List[dict]) -> List[dict]:
+    """Overlay live ``availableTickets`` on cached static items.
+
+    Counts missing from the availability cache are read in one primary-key
+    query. Items that no longer exist in the database are dropped.
+    """
+    item_ids = [item["id"] for item in items]
+    tickets = _CACHE.get_availability(item_ids)
+    stale = [item_id for item_id in item_ids if item_id not in tickets]
+    if stale:
+        get_tickets = (
+            f"SELECT v.id, {_LIVE_TICKETS} AS availableTickets "
+            "FROM Vacation v "
+            f"WHERE v.id IN ({', '.join(['%s'] * len(stale))});"
         )
-        vacations = _execute_query(get_vacations, fetch_all=True)
+        fresh = {
+            row["id"]: row["availableTickets"]
+            for row in _execute_on(cnx, get_tickets, tuple(stale), fetch_all=True) or []
+        }
+        missing = [item_id for item_id in stale if item_id not in fresh]
+        if missing:
+            _CACHE.invalidate(missing)
+        _CACHE.set_availability(fresh)
+        _SOLD_OUT.clear([item_id for item_id, count in fresh.items() if count])
+        tickets.update(fresh)
 
-        if not vacations:
-            return _response(404, {"error": "No vacations found"})
+    results = []
+    for item in items:
+        if item["id"] in tickets:
+            result = dict(item)
+            result["availableTickets"] = tickets[item["id"]]
+            results.append(result)
+    return results
+
+
+def _items_by_ids(cnx, item_ids: List[int]) -> List[dict]:
+    """Load items in the given order, serving static fields from the cache."""
+    cached: Dict[int, dict] = {}
+    for item_id in item_ids:
+        item = _CACHE.get_item(item_id)
+        if item is not None:
+            cached[item_id] = item
+    missing = [item_id for item_id in item_ids if item_id not in cached]
+    loaded: Dict[int, dict] = {}
+    if missing:
+        where = f"WHERE v.id IN ({', '.join(['%s'] * len(missing))}) "
+        loaded = {item["id"]: item for item in _load_items(cnx, where, tuple(missing))}
+        _CACHE.put_items(list(loaded.values()))
+
+    items = {item["id"]: item for item in _with_availability(cnx, list(cached.values()))}
+    items.update(loaded)
+    return [items[item_id] for item_id in item_ids if item_id in items]
+
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+# Weight of a match in each searchable field
+_SEARCH_FIELDS = (("name", 3), ("location", 2), ("shortDescription", 1))
+
+
+def _tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def _trigrams(token: str) -> set:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class _SearchIndex:
+    """Trigram inverted index over the searchable Vacation fields.
+
+    Terms of three or more characters match anywhere inside a word; shorter
+    terms match word prefixes. Every query term must match. Results are
+    ranked by field weight and match quality (whole word > prefix >
+    substring), then by id.
+    """
+
+    def __init__(self, rows: List[dict]):
+        self._grams: Dict[str, set] = {}
+        self._prefixes: Dict[str, set] = {}  # 1-2 character word prefixes
+        self._fields: Dict[int, List[tuple]] = {}  # id -> [(weight, tokens)]
+        for row in rows:
+            fields = []
+            for field, weight in _SEARCH_FIELDS:
+                tokens = _tokenize(row.get(field))
+                fields.append((weight, tokens))
+                for token in tokens:
+                    for gram in _trigrams(token):
+                        self._grams.setdefault(gram, set()).add(row["id"])
+                    for size in (1, 2):
+                        if len(token) >= size:
+                            self._prefixes.setdefault(token[:size], set()).add(row["id"])
+            self._fields[row["id"]] = fields
+
+    def search(self, query: str) -> List[int]:
+        terms = _tokenize(query)
+        if not terms:
+            return []
+
+        candidates: Optional[set] = None
+        for term in terms:
+            if len(term) < 3:
+                matches = self._prefixes.get(term, set())
+            else:
+                postings = [self._grams.get(gram, set()) for gram in _trigrams(term)]
+                matches = set.intersection(*sorted(postings, key=len))
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+
+        scored = []
+        for item_id in candidates:
+            score = 0
+            for term in terms:
+                best = max((self._score(term, weight, tokens) for weight, tokens in self._fields[item_id]), default=0)
+                if not best:
+                    break  # trigram false positive
+                score += best
+            else:
+                scored.append((-score, item_id))
+        return [item_id for _, item_id in sorted(scored)]
+
+    @staticmethod
+    def _score(term: str, weight: int, tokens: List[str]) -> int:
+        best = 0
+        for token in tokens:
+            if token == term:
+                return weight * 3
+            if token.startswith(term):
+                best = max(best, 2)
+            elif len(term) >= 3 and term in token:
+                best = max(best, 1)
+        return weight * best
+
+
+_SEARCH_INDEX: Optional[_SearchIndex] = None
+_SEARCH_INDEX_BUILT_AT = 0.0
+_SEARCH_INDEX_LOCK = threading.Lock()
 
-        # Get all images, includes, highlights
-        get_images = (
-            "SELECT imageURL, vacationId "
-            "FROM Image "
+
+def _search_index(cnx) -> _SearchIndex:
+    """Return the in-process search index, rebuilding it once it is stale."""
+    global _SEARCH_INDEX, _SEARCH_INDEX_BUILT_AT
+    with _SEARCH_INDEX_LOCK:
+        if _SEARCH_INDEX is None or time.monotonic() - _SEARCH_INDEX_BUILT_AT >= SEARCH_INDEX_TTL:
+            get_searchable = (
+                "SELECT id, name, location, shortDescription "
+                "FROM Vacation;"
+            )
+            _SEARCH_INDEX = _SearchIndex(_execute_on(cnx, get_searchable, fetch_all=True) or [])
+            _SEARCH_INDEX_BUILT_AT = time.monotonic()
+        return _SEARCH_INDEX
+
+
+def _invalidate_search_index() -> None:
+    global _SEARCH_INDEX
+    with _SEARCH_INDEX_LOCK:
+        _SEARCH_INDEX = None
+
+
+def _fulltext_search(cnx, name_query: str, limit: int, offset: int) -> List[int]:
+    # Boolean mode with a trailing * on every term gives prefix matching;
+    # operator characters in user input are dropped
+    terms = " ".join(f"+{term}*" for term in _tokenize(name_query))
+    search_vacations = (
+        "SELECT id, MATCH(name, location, shortDescription) AGAINST (%s IN BOOLEAN MODE) AS score "
+        "FROM Vacation "
+        "WHERE MATCH(name, location, shortDescription) AGAINST (%s IN BOOLEAN MODE) "
+        "ORDER BY score DESC, id "
+        "LIMIT %s OFFSET %s;"
+    )
+    rows = _execute_on(cnx, search_vacations, (terms, terms, limit, offset), fetch_all=True)
+    return [row["id"] for row in rows or []]
+
+
+def _vacation_to_item(vacation: dict) -> dict:
+    return {
+        "id": vacation["id"],
+        "name": vacation.get("name"),
+        "location": vacation.get("location"),
+        "price": float(vacation.get("price", 0.0)),
+        "duration": vacation.get("duration"),
+        "departureDate": vacation["departureDate"].isoformat() if vacation.get("departureDate") else None,
+        "shortDescription": vacation.get("shortDescription"),
+        "description": vacation.get("description"),
+        "availableTickets": vacation.get("availableTickets"),
+        "images": [],
+        "includes": [],
+        "highlights": [],
+    }
+
+
+# (table, column, key in the assembled item) for each child table of Vacation
+_CHILD_TABLES = (
+    ("Image", "imageURL", "images"),
+    ("Include", "amenityDescription", "includes"),
+    ("Highlight", "highlightDescription", "highlights"),
+)
+
+
+def _assemble_items(cnx, vacations: List[dict], scoped: bool = True,
+                    children: Optional[set] = None) -> Dict[int, dict]:
+    """Build item documents for ``vacations`` with one query per child table.
+
+    When ``scoped`` is False the child tables are read in full, which is
+    cheaper than an ``IN`` list when every vacation is being loaded anyway.
+    ``children`` limits the child tables read to those item keys (e.g.
+    ``{"images"}``); the others are left as empty lists.
+    """
+    items: Dict[int, dict] = {}
+    for vacation in vacations:
+        items[vacation["id"]] = _vacation_to_item(vacation)
+    if not items:
+        return items
+
+    where = ""
+    data = None
+    if scoped:
+        where = f"WHERE vacationId IN ({', '.join(['%s'] * len(items))}) "
+        data = tuple(items)
+
+    for table, column, key in _CHILD_TABLES:
+        if children is not None and key not in children:
+            continue
+        get_children = (
+            f"SELECT {column}, vacationId "
+            f"FROM {table} "
+            f"{where}"
             "ORDER BY vacationId, id;"
         )
-        images = _execute_query(get_images, fetch_all=True)
+        for row in _execute_on(cnx, get_children, data, fetch_all=True) or []:
+            item = items.get(row.get("vacationId"))
+            if item is not None:
+                item[key].append(row.get(column))
+    return items
 
-        get_includes = (
-            "SELECT amenityDescription, vacationId "
-            "FROM Include "
-            "ORDER BY vacationId, id;"
+
+def get_all_inventory(if_none_match: Optional[str] = None) -> dict:
+    try:
+        with _db_connection() as cnx:
+            cached = _CACHE.get_catalog()
+            if cached is not None:
+                items = _with_availability(cnx, cached)
+            else:
+                items = _load_items(cnx)
+                _CACHE.put_items(items, full_catalog=True)
+
+        if not items:
+            return _response(404, {"error": "No vacations found"})
+
+        inventory: Dict[int, dict] = {item["id"]: item for item in items}
+        documents = _CACHE.encode(items)
+        encoded = None
+        if documents is not None:
+            encoded = b"{" + b",".join(b'"%d":%s' % (item["id"], document)
+                                       for item, document in zip(items, documents)) + b"}"
+        return _conditional_response(inventory, items, if_none_match, encoded)
+
+    except Exception as e:
+        return _response(500, {"error": f"Database error: {str(e)}"})
+  
+def _load_items(cnx, where: str = "", data: Optional[tuple] = None) -> List[dict]:
+    """Read items from their materialized documents, in id order.
+
+    One query returns each stored document with its live ticket count.
+    Vacations whose document is missing or was cleared by a catalog change
+    are assembled from the source tables and their documents rewritten.
+    """
+    get_documents = (
+        f"SELECT v.id, d.document, d.version, {_LIVE_TICKETS} AS availableTickets "
+        "FROM Vacation v "
+        "LEFT JOIN VacationDocument d ON d.vacationId = v.id "
+        f"{where}"
+        "ORDER BY v.id;"
+    )
+    rows = _execute_on(cnx, get_documents, data, fetch_all=True) or []
+    items: Dict[int, dict] = {}
+    stale: Dict[int, Optional[int]] = {}  # id -> document version read, None if no row
+    for row in rows:
+        if row["document"] is None:
+            stale[row["id"]] = row["version"]
+            continue
+        item = json.loads(row["document"])
+        item["availableTickets"] = row["availableTickets"]
+        items[row["id"]] = item
+
+    if stale:
+        get_vacations = (
+            f"SELECT {_VACATION_COLUMNS} "
+            "FROM Vacation v "
+            f"WHERE v.id IN ({', '.join(['%s'] * len(stale))});"
         )
-        includes = _execute_query(get_includes, fetch_all=True)
+        vacations = _execute_on(cnx, get_vacations, tuple(stale), fetch_all=True) or []
+        assembled = _assemble_items(cnx, vacations)
+        _materialize(cnx, list(assembled.values()), stale)
+        items.update(assembled)
+    return [items[row["id"]] for row in rows if row["id"] in items]
 
-        get_highlights = (
-            "SELECT highlightDescription, vacationId "
-            "FROM Highlight "
-            "ORDER BY vacationId, id;"
+
+def _document(item: dict) -> str:
+    return api_response.dumps(dict(item, availableTickets=None)).decode()
+
+
+def _materialize(cnx, items: List[dict], versions: Dict[int, Optional[int]]) -> None:
+    """Store the documents of ``items`` assembled after reading ``versions``.
+
+    A document is only written if its version is still the one read, so a
+    catalog change that lands while an item is being assembled leaves the
+    document cleared rather than stale. A missing row is inserted only if
+    it is still missing; the triggers insert one for every change, so the
+    insert is ignored once the vacation changed after it was read.
+    """
+    insert_document = ("INSERT IGNORE INTO VacationDocument (vacationId, version, document) "
+                       "VALUES (%s, 0, %s);")
+    update_document = ("UPDATE VacationDocument SET document = %s "
+                       "WHERE vacationId = %s AND version = %s;")
+    cursor = cnx.cursor()
+    try:
+        for item in items:
+            version = versions.get(item["id"])
+            if version is None:
+                cursor.execute(insert_document, (item["id"], _document(item)))
+            else:
+                cursor.execute(update_document, (_document(item), item["id"], version))
+        if cnx.in_transaction:
+            cnx.commit()
+    finally:
+        cursor.close()
+
+
+def rebuild_documents(batch_size: int = 200) -> int:
+    """Regenerate every materialized item document; return how many were written.
+
+    Walks Vacation in id order, assembling ``batch_size`` items with one
+    query per table and writing them with one multi-row upsert per batch.
+    As in _materialize, a document changed since its version was read is
+    left for the next read to rebuild.
+    """
+    get_batch = (
+        f"SELECT {_VACATION_COLUMNS}, d.version "
+        "FROM Vacation v "
+        "LEFT JOIN VacationDocument d ON d.vacationId = v.id "
+        "WHERE v.id > %s "
+        "ORDER BY v.id "
+        "LIMIT %s;"
+    )
+    written = 0
+    last_id = 0
+    with _db_connection() as cnx:
+        while True:
+            vacations = _execute_on(cnx, get_batch, (last_id, batch_size), fetch_all=True) or []
+            if not vacations:
+                break
+            versions = {vacation["id"]: vacation["version"] or 0 for vacation in vacations}
+            items = _assemble_items(cnx, vacations)
+            upsert_documents = (
+                "INSERT INTO VacationDocument (vacationId, version, document) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(items))} "
+                "ON DUPLICATE KEY UPDATE document = IF(version = VALUES(version), VALUES(document), document);"
+            )
+            data = tuple(
+                value
+                for item_id, item in items.items()
+                for value in (item_id, versions[item_id], _document(item))
+            )
+            _execute_on(cnx, upsert_documents, data)
+            written += len(items)
+            last_id = vacations[-1]["id"]
+    _CACHE.invalidate()
+    return written
+
+
+def _stream_rows(cnx, query: str) -> Iterator[dict]:
+    """Yield the rows of ``query`` from an unbuffered cursor, EXPORT_FETCH_SIZE at a time."""
+    cursor = cnx.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            # Abandoned part way; the connection is closed by the caller
+            pass
+
+
+class _ChildStream:
+    """Child-table rows ordered by vacationId, consumed in step with Vacation."""
+
+    def __init__(self, rows: Iterator[dict], column: str):
+        self._rows = rows
+        self._column = column
+        self._next = next(rows, None)
+
+    def take(self, vacation_id: int) -> List[str]:
+        """Values for ``vacation_id``, skipping rows of vacations that were passed."""
+        values = []
+        while self._next is not None and self._next["vacationId"] <= vacation_id:
+            if self._next["vacationId"] == vacation_id:
+                values.append(self._next[self._column])
+            self._next = next(self._rows, None)
+        return values
+
+
+def export_catalog() -> Iterator[bytes]:
+    """Yield every item as one NDJSON line, in id order.
+
+    Vacation and each child table are read through their own connection
+    with an unbuffered cursor, since a connection can stream only one
+    result set at a time. The ordered child rows are merged into each
+    vacation as it passes, so memory use does not grow with the catalog.
+    The four streams do not share a snapshot; an item edited mid-export
+    may mix old and new child rows.
+    """
+    connections = [db.connect(autocommit=True) for _ in range(1 + len(_CHILD_TABLES))]
+    try:
+        get_vacations = (
+            f"SELECT {_VACATION_COLUMNS} "
+            "FROM Vacation v "
+            "ORDER BY v.id;"
         )
-        highlights = _execute_query(get_highlights, fetch_all=True)
+        vacations = _stream_rows(connections[0], get_vacations)
+        children = []
+        for cnx, (table, column, key) in zip(connections[1:], _CHILD_TABLES):
+            get_children = (
+                f"SELECT {column}, vacationId "
+                f"FROM {table} "
+                "WHERE vacationId IS NOT NULL "
+                "ORDER BY vacationId, id;"
+            )
+            children.append((key, _ChildStream(_stream_rows(cnx, get_children), column)))
 
-        # Group related data by vacation ID
-        inventory: Dict[int, dict] = {}
         for vacation in vacations:
-            vid = vacation["id"]
-            inventory[vid] = {
-                "id": vacation["id"],
-                "name": vacation.get("name"),
-                "location": vacation.get("location"),
-                "price": float(vacation.get("price", 0.0)),
-                "duration": vacation.get("duration"),
-                "departureDate": vacation["departureDate"].isoformat() if vacation.get("departureDate") else None,
-                "shortDescription": vacation.get("shortDescription"),
-                "description": vacation.get("description"),
-                "availableTickets": vacation.get("availableTickets"),
-                "images": [],
-                "includes": [],
-                "highlights": [],
-            }
+            item = _vacation_to_item(vacation)
+            for key, stream in children:
+                item[key] = stream.take(item["id"])
+            yield api_response.dumps(item) + b"\n"
+    finally:
+        for cnx in connections:
+            _ConnectionPool._close_quietly(cnx)
 
-        # Add images
-        for img in images or []:
-            vid = img.get("vacationId")
-            if vid in inventory:
-                inventory[vid]["images"].append(img.get("imageURL"))
 
-        # Add includes
-        for inc in includes or []:
-            vid = inc.get("vacationId")
-            if vid in inventory:
-                inventory[vid]["includes"].append(inc.get("amenityDescription"))
+# Columns behind each field of a projected listing (?fields=)
+_FIELD_COLUMNS = {
+    "id": "v.id",
+    "name": "v.name",
+    "location": "v.location",
+    "price": "v.price",
+    "duration": "v.duration",
+    "departureDate": "v.departureDate",
+    "shortDescription": "v.shortDescription",
+    "description": "v.description",
+    "availableTickets": f"{_LIVE_TICKETS} AS availableTickets",
+}
+# "image" is the first entry of "images", for card grids
+_PROJECTABLE_FIELDS = list(_FIELD_COLUMNS) + [key for _, _, key in _CHILD_TABLES] + ["image"]
 
-        # Add highlights
-        for high in highlights or []:
-            vid = high.get("vacationId")
-            if vid in inventory:
-                inventory[vid]["highlights"].append(high.get("highlightDescription"))
 
-        return _response(200, inventory)
+def _parse_fields(fields: Optional[str]) -> List[str]:
+    """Requested fields in canonical order; ``id`` is always included."""
+    if not fields:
+        return _PROJECTABLE_FIELDS[:-1]
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = sorted(requested.difference(_PROJECTABLE_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. "
+                         f"Valid fields are {', '.join(_PROJECTABLE_FIELDS)}")
+    requested.add("id")
+    return [field for field in _PROJECTABLE_FIELDS if field in requested]
+
+
+def _project(item: dict, fields: List[str]) -> dict:
+    projected = {}
+    for field in fields:
+        if field == "image":
+            projected["image"] = item["images"][0] if item["images"] else None
+        else:
+            projected[field] = item[field]
+    return projected
+
+
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str]) -> int:
+    """Id after which the page starts; 0 for the first page."""
+    if not cursor:
+        return 0
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def _load_page(cnx, after_id: int, limit: int, fields: List[str]) -> List[dict]:
+    """Read up to ``limit`` items after ``after_id``, querying only what ``fields`` need."""
+    columns = ", ".join(_FIELD_COLUMNS[field] for field in fields if field in _FIELD_COLUMNS)
+    get_page = (
+        f"SELECT {columns} "
+        "FROM Vacation v "
+        "WHERE v.id > %s "
+        "ORDER BY v.id "
+        "LIMIT %s;"
+    )
+    vacations = _execute_on(cnx, get_page, (after_id, limit), fetch_all=True) or []
+    children = {"images" if field == "image" else field for field in fields}
+    return list(_assemble_items(cnx, vacations, children=children).values())
+
+
+def get_inventory_page(limit: Optional[int] = None, cursor: Optional[str] = None,
+                       fields: Optional[str] = None, if_none_match: Optional[str] = None) -> dict:
+    """One page of the listing, ordered by id, as ``{"items": [...], "nextCursor": ...}``.
+
+    Keyset pagination: the cursor encodes the last id of the previous page,
+    so every page is an index range scan however deep it is. ``fields``
+    projects each item; child tables that are not requested are not read.
+    A warm catalog cache serves the page without touching Vacation, reading
+    only the page's ticket counts.
+    """
+    try:
+        limit = PAGE_DEFAULT_LIMIT if limit is None else int(limit)
+    except (TypeError, ValueError):
+        return _response(400, {"error": "limit must be an integer"})
+    try:
+        after_id = _decode_cursor(cursor)
+        projection = _parse_fields(fields)
+    except ValueError as e:
+        return _response(400, {"error": str(e)})
+    if limit <= 0:
+        return _response(400, {"error": "limit must be positive"})
+    limit = min(limit, PAGE_MAX_LIMIT)
+
+    try:
+        with _db_connection() as cnx:
+            cached = _CACHE.get_catalog()
+            if cached is not None:
+                page = [item for item in cached if item["id"] > after_id][:limit + 1]
+                if "availableTickets" in projection:
+                    page = _with_availability(cnx, page)
+            else:
+                page = _load_page(cnx, after_id, limit + 1, projection)
+
+        next_cursor = _encode_cursor(page[limit - 1]["id"]) if len(page) > limit else None
+        body = {"items": [_project(item, projection) for item in page[:limit]], "nextCursor": next_cursor}
+        encoded = api_response.dumps(body)
+        etag = f'"{hashlib.sha1(encoded).hexdigest()[:32]}"'
+        return _conditional_response(body, [], if_none_match, encoded, etag)
 
     except Exception as e:
         return _response(500, {"error": f"Database error: {str(e)}"})
-  
-def get_item_by_id(item_id: int) -> dict:
+
+
+def get_item_by_id(item_id: int, if_none_match: Optional[str] = None) -> dict:
     try:
         item_id = int(item_id)
     except (TypeError, ValueError):
         return _response(400, {"error": "Invalid item ID"})
 
     try:
-        get_vacation = (
-            "SELECT * "
-            "FROM Vacation "
-            "WHERE id = %s;"
-        )
-        vacation = _execute_query(get_vacation, (item_id,), fetch_one=True)
+        with _db_connection() as cnx:
+            cached = _CACHE.get_item(item_id)
+            if cached is not None:
+                result = next(iter(_with_availability(cnx, [cached])), None)
+            else:
+                result = next(iter(_load_items(cnx, "WHERE v.id = %s ", (item_id,))), None)
+                if result is not None:
+                    _CACHE.put_items([result])
 
-        if not vacation:
+        if result is None:
             return _response(404, {"error": f"Item {item_id} not found"})
 
-        # call the other 3 tables to get Image, Include, Highlight
-        get_images = (
-            "SELECT imageURL "
-            "FROM Image "
-            "WHERE vacationId = %s "
-            "ORDER BY id;"
-        )
-        images = _execute_query(get_images, (item_id,), fetch_all=True)
+        documents = _CACHE.encode([result])
+        return _conditional_response(result, [result], if_none_match, documents[0] if documents else None)
 
-        get_includes = (
-            "SELECT amenityDescription "
-            "FROM Include "
-            "WHERE vacationId = %s "
-            "ORDER BY id;"
-        )
-        includes = _execute_query(get_includes, (item_id,), fetch_all=True)
+    except Exception as e:
+        return _response(500, {"error": f"Database error: {str(e)}"})
 
-        get_highlights = (
-            "SELECT highlightDescription "
-            "FROM Highlight "
-            "WHERE vacationId = %s "
-            "ORDER BY id;"
-        )
-        highlights = _execute_query(get_highlights, (item_id,), fetch_all=True)
-
-        result = {
-            "id": vacation.get("id"),
-            "name": vacation.get("name"),
-            "location": vacation.get("location"),
-            "price": float(vacation.get("price", 0.0)),
-            "duration": vacation.get("duration"),
-            "departureDate": vacation["departureDate"].isoformat() if vacation.get("departureDate") else None,
-            "shortDescription": vacation.get("shortDescription"),
-            "description": vacation.get("description"),
-            "availableTickets": vacation.get("availableTickets"),
-            "images": [img.get("imageURL") for img in (images or [])],
-            "includes": [inc.get("amenityDescription") for inc in (includes or [])],
-            "highlights": [h.get("highlightDescription") for h in (highlights or [])],
-        }
+def _parse_ids(ids: str) -> List[int]:
+    """Distinct ids from a comma-separated list, in request order."""
+    try:
+        item_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of integers")
+    if not item_ids:
+        raise ValueError("ids is required")
+    if len(item_ids) > IDS_MAX_COUNT:
+        raise ValueError(f"At most {IDS_MAX_COUNT} ids per request")
+    return item_ids
+
+
+def get_items_by_ids(ids: str, view: Optional[str] = None, if_none_match: Optional[str] = None) -> dict:
+    """Items for ``?ids=1,2,3`` in request order; unknown ids are left out.
+
+    ``view=availability`` returns only ``id``, ``price`` and
+    ``availableTickets`` from a single primary-key ``IN`` query, for carts
+    and checkout. The full view serves documents from the catalog cache
+    and VacationDocument like get_item_by_id, in one round trip for all ids.
+    """
+    try:
+        item_ids = _parse_ids(ids)
+    except ValueError as e:
+        return _response(400, {"error": str(e)})
+    if view not in (None, "", "full", "availability"):
+        return _response(400, {"error": "view must be full or availability"})
 
-        return _response(200, result)
+    try:
+        with _db_connection() as cnx:
+            if view == "availability":
+                get_availability = (
+                    f"SELECT v.id, v.price, {_LIVE_TICKETS} AS availableTickets "
+                    "FROM Vacation v "
+                    f"WHERE v.id IN ({', '.join(['%s'] * len(item_ids))});"
+                )
+                rows = {
+                    row["id"]: row
+                    for row in _execute_on(cnx, get_availability, tuple(item_ids), fetch_all=True) or []
+                }
+                _CACHE.set_availability({item_id: row["availableTickets"] for item_id, row in rows.items()})
+                results = [
+                    {"id": item_id, "price": rows[item_id]["price"], "availableTickets": rows[item_id]["availableTickets"]}
+                    for item_id in item_ids if item_id in rows
+                ]
+                return _response(200, results, headers={"Cache-Control": "no-cache"})
+
+            results = _items_by_ids(cnx, item_ids)
+
+        documents = _CACHE.encode(results)
+        encoded = b"[" + b",".join(documents) + b"]" if documents else None
+        return _conditional_response(results, results, if_none_match, encoded)
 
     except Exception as e:
         return _response(500, {"error": f"Database error: {str(e)}"})
 
-def get_items_by_name(name_query: str) -> dict:
+
+def get_items_by_name(name_query: str, limit: Optional[int] = None, offset: int = 0) -> dict:
     print("querying items by name")
     if not name_query or not name_query.strip():
         return _response(400, {"error": "Name parameter is required"})
     try:
-        # Use lowercase comparison in SQL by lowering the parameter
-        get_vacation = (
-            "SELECT * "
-            "FROM Vacation "
-            "WHERE LOWER(name) LIKE %s "
-            "ORDER BY id;"
-        )
-        vacations = _execute_query(get_vacation, (f"%{name_query.lower()}%",), fetch_all=True)
+        limit = SEARCH_DEFAULT_LIMIT if limit is None else int(limit)
+        offset = int(offset or 0)
+    except (TypeError, ValueError):
+        return _response(400, {"error": "limit and offset must be integers"})
+    if limit <= 0 or offset < 0:
+        return _response(400, {"error": "limit must be positive and offset non-negative"})
+    limit = min(limit, SEARCH_MAX_LIMIT)
+
+    try:
+        with _db_connection() as cnx:
+            if SEARCH_BACKEND == 'fulltext':
+                item_ids = _fulltext_search(cnx, name_query, limit, offset)
+            else:
+                item_ids = _search_index(cnx).search(name_query)[offset:offset + limit]
 
-        if not vacations:
+            results: List[dict] = _items_by_ids(cnx, item_ids) if item_ids else []
+
+        if not results:
             return _response(404, {"error": f"No items found with name {name_query}"})
 
-        results: List[dict] = []
-        for vacation in vacations:
-            vacation_id = vacation["id"]
-
-            # Get images
-            get_images = (
-                "SELECT imageURL "
-                "FROM Image "
-                "WHERE vacationId = %s "
-                "ORDER BY id;"
-            )
-            images = _execute_query(get_images, (vacation_id,), fetch_all=True)
-
-            # Get includes
-            get_includes = (
-                "SELECT amenityDescription "
-                "FROM Include "
-                "WHERE vacationId = %s "
-                "ORDER BY id;"
-            )
-            includes = _execute_query(get_includes, (vacation_id,), fetch_all=True)
-
-            # Get highlights
-            get_highlights = (
-                "SELECT highlightDescription "
-                "FROM Highlight "
-                "WHERE vacationId = %s "
-                "ORDER BY id;"
+        documents = _CACHE.encode(results)
+        return _response(200, results, encoded=b"[" + b",".join(documents) + b"]" if documents else None)
+
+    except Exception as e:
+        return _response(500, {"error": f"Database error: {str(e)}"})
+
+
+def get_availability() -> dict:
+    """Live ``{id: availableTickets}`` for every item.
+
+    The storefront reads the static catalog from the snapshot written by
+    build_catalog_snapshot.py and only this small map from the API.
+    """
+    try:
+        with _db_connection() as cnx:
+            get_tickets = (
+                f"SELECT v.id, {_LIVE_TICKETS} AS availableTickets "
+                "FROM Vacation v "
+                "ORDER BY v.id;"
             )
-            highlights = _execute_query(get_highlights, (vacation_id,), fetch_all=True)
-
-            result = {
-                "id": vacation.get("id"),
-                "name": vacation.get("name"),
-                "location": vacation.get("location"),
-                "price": float(vacation.get("price", 0.0)),
-                "duration": vacation.get("duration"),
-                "departureDate": vacation["departureDate"].isoformat() if vacation.get("departureDate") else None,
-                "shortDescription": vacation.get("shortDescription"),
-                "description": vacation.get("description"),
-                "availableTickets": vacation.get("availableTickets"),
-                "images": [img.get("imageURL") for img in (images or [])],
-                "includes": [inc.get("amenityDescription") for inc in (includes or [])],
-                "highlights": [h.get("highlightDescription") for h in (highlights or [])],
+            tickets = {
+                row["id"]: row["availableTickets"]
+                for row in _execute_on(cnx, get_tickets, fetch_all=True) or []
             }
-            results.append(result)
-
-        return _response(200, results)
+        _CACHE.set_availability(tickets)
+        return _response(200, tickets, headers={"Cache-Control": f"public, max-age={AVAILABILITY_MAX_AGE}"})
 
     except Exception as e:
         return _response(500, {"error": f"Database error: {str(e)}"})
 
 
-def reserve_items(request_data: dict) -> dict:
+class _ShardingChanged(Exception):
+    """An item was sharded or unsharded after the shard map was read."""
+
+
+_SHARD_MAP: Optional[Dict[int, int]] = None
+_SHARD_MAP_LOADED_AT = 0.0
+_SHARD_MAP_LOCK = threading.Lock()
+
+
+def _sharded_items(cnx) -> Dict[int, int]:
+    """Return ``{item_id: shard_count}`` for every sharded item.
+
+    The map is cached for SHARD_MAP_TTL seconds. A stale map is safe: the
+    reservation paths re-check ``ticketShards`` and raise _ShardingChanged.
+    """
+    global _SHARD_MAP, _SHARD_MAP_LOADED_AT
+    with _SHARD_MAP_LOCK:
+        if _SHARD_MAP is None or time.monotonic() - _SHARD_MAP_LOADED_AT >= SHARD_MAP_TTL:
+            get_sharded = (
+                "SELECT id, ticketShards "
+                "FROM Vacation "
+                "WHERE ticketShards > 0;"
+            )
+            rows = _execute_on(cnx, get_sharded, fetch_all=True) or []
+            _SHARD_MAP = {row["id"]: row["ticketShards"] for row in rows}
+            _SHARD_MAP_LOADED_AT = time.monotonic()
+        return _SHARD_MAP
+
+
+def _invalidate_shard_map() -> None:
+    global _SHARD_MAP
+    with _SHARD_MAP_LOCK:
+        _SHARD_MAP = None
+
+
+# Asynchronous checkouts are keyed by uuid4().hex
+_ORDER_TOKEN = re.compile(r"[0-9a-f]{32}")
+
+
+def _merge_cart(items_to_reserve: List[dict]) -> Dict[int, int]:
+    """Collapse cart lines into ``{item_id: total_quantity}`` in request order."""
+    cart: Dict[int, int] = {}
+    for item_request in items_to_reserve:
+        try:
+            item_id = int(item_request['id'])
+            quantity = int(item_request.get('quantity', 0))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError('Each item must have an integer id and quantity')
+        if quantity <= 0:
+            raise ValueError('Quantity must be greater than 0')
+        cart[item_id] = cart.get(item_id, 0) + quantity
+    return cart
+
+
+def reserve_items(request_data: dict, cnx=None) -> dict:
+    """Reserve every item in ``request_data['items']`` or none of them.
+
+    When ``cnx`` is given (in-process checkout), the reservation runs inside
+    the caller's open transaction as a savepoint and is left for the caller
+    to commit or roll back.
+
+    An ``order_token`` (asynchronous checkout) records the reservation as a
+    RESERVED row in the CHECKOUT table in the same transaction, so the
+    tickets are held if and only if that row exists. release_checkout
+    returns them from that row.
+    """
     if not isinstance(request_data, dict):
         try:
             request_data = json.loads(request_data)
@@ -282,82 +1141,436 @@ def reserve_items(request_data: dict) -> dict:
     if not isinstance(items_to_reserve, list) or not items_to_reserve:
         return _response(400, {'error': 'Items must be a non-empty list'})
 
-    cnx = None
     try:
-        cnx = _connect_to_db()
-        cursor = cnx.cursor(dictionary=True)
-        
+        cart = _merge_cart(items_to_reserve)
+    except ValueError as e:
+        return _response(400, {'error': str(e)})
+
+    checkout = None
+    order_token = request_data.get('order_token')
+    if order_token is not None:
+        if not isinstance(order_token, str) or not _ORDER_TOKEN.fullmatch(order_token):
+            return _response(400, {'error': 'order_token must be 32 lowercase hex characters'})
+        checkout = (order_token, json.dumps(items_to_reserve))
+
+    sold_out = _SOLD_OUT.sold_out(list(cart))
+    if sold_out:
+        vacations = {item_id: {'name': name} for item_id, name in sold_out.items()}
+        return _insufficient_response(cart, vacations, dict.fromkeys(sold_out, 0))
+
+    try:
+        if cnx is not None:
+            return _reserve_with_retry(cnx, cart, checkout)
+        with _db_connection() as cnx:
+            return _reserve_with_retry(cnx, cart, checkout)
+    except Exception as e:
+        return _response(500, {'error': f'Reserve handling error: {str(e)}'})
+
+
+class _Transaction:
+    """Transaction scope for one reservation attempt.
+
+    Starts a transaction on ``cnx``, or a savepoint when the caller already
+    has one open, so a reservation can join a larger checkout transaction
+    without committing or rolling back the caller's work. A ``checkout``
+    of ``(order_token, items_json)`` is inserted into CHECKOUT just before
+    the commit.
+    """
+
+    def __init__(self, cnx, checkout: Optional[tuple] = None):
+        self.cnx = cnx
+        self.nested = cnx.in_transaction
+        self.active = False
+        self.checkout = checkout
+
+    def begin(self) -> None:
+        if self.nested:
+            self._execute("SAVEPOINT reserve_items;")
+        else:
+            self.cnx.start_transaction()
+        self.active = True
+
+    def commit(self) -> None:
+        if self.active:
+            if self.checkout is not None:
+                try:
+                    self._execute("INSERT INTO CHECKOUT (ORDER_TOKEN, STATUS, ITEMS) VALUES (%s, 'RESERVED', %s);",
+                                  self.checkout)
+                except Exception:
+                    self.rollback()
+                    raise
+            if self.nested:
+                self._execute("RELEASE SAVEPOINT reserve_items;")
+            else:
+                self.cnx.commit()
+            self.active = False
+
+    def rollback(self) -> None:
+        if self.active:
+            if self.nested:
+                self._execute("ROLLBACK TO SAVEPOINT reserve_items;")
+            else:
+                self.cnx.rollback()
+            self.active = False
+
+    def _execute(self, statement: str, data: Optional[tuple] = None) -> None:
+        cursor = self.cnx.cursor()
+        try:
+            cursor.execute(statement, data)
+        finally:
+            cursor.close()
+
+
+def _reserve_with_retry(cnx, cart: Dict[int, int], checkout: Optional[tuple] = None) -> dict:
+    """Run the configured reservation strategy.
+
+    Retries once if the shard layout changed underneath it, or if InnoDB
+    picked it as a deadlock victim and the transaction was our own (a
+    deadlock also rolls back the caller's work, so it cannot be retried
+    inside a joined transaction).
+    """
+    for attempt in (1, 2):
+        sharded = _sharded_items(cnx)
+        reserve = _reserve_in_transaction
+        if (RESERVATION_MODE == 'optimistic' and len(cart) <= OPTIMISTIC_MAX_CART_SIZE
+                and not any(item_id in sharded for item_id in cart)):
+            reserve = _reserve_optimistic
+        tx = _Transaction(cnx, checkout)
+        try:
+            return reserve(tx, cart, sharded)
+        except (_ShardingChanged, mysql.connector.Error) as err:
+            retryable = isinstance(err, _ShardingChanged) or (
+                err.errno == errorcode.ER_LOCK_DEADLOCK and not tx.nested)
+            if attempt == 2 or not retryable:
+                raise
+            tx.rollback()
+            _invalidate_shard_map()
+
+
+def _names(vacations: Dict[int, dict]) -> Dict[int, str]:
+    return {item_id: vacation['name'] for item_id, vacation in vacations.items()}
+
+
+def _insufficient_response(cart: Dict[int, int], vacations: Dict[int, dict], available: Dict[int, int]) -> dict:
+    """409 response listing the cart lines whose ``available`` count is short."""
+    return _response(409, {
+        'error': 'Insufficient inventory',
+        'items': [
+            {
+                'id': item_id,
+                'name': vacations[item_id]['name'],
+                'requested': quantity,
+                'available': available[item_id],
+            }
+            for item_id, quantity in cart.items()
+            if item_id in available
+        ]
+    })
+
+
+def _reserve_in_transaction(tx: _Transaction, cart: Dict[int, int], sharded: Dict[int, int]) -> dict:
+    """Check and decrement availability for the whole cart in one transaction.
+
+    All unsharded rows are locked by a single ``SELECT ... FOR UPDATE`` that
+    walks the primary key in ascending order, so concurrent carts always
+    acquire their locks in the same order and cannot deadlock against each
+    other. Sharded items never lock their Vacation row; each takes its
+    quantity from one shard row (see _take_from_shards).
+    """
+    cnx = tx.cnx
+    plain_ids = sorted(item_id for item_id in cart if item_id not in sharded)
+    shard_ids = sorted(item_id for item_id in cart if item_id in sharded)
+    vacations: Dict[int, dict] = {}
+    cursor = cnx.cursor(dictionary=True)
+    try:
         # Start transaction
-        cnx.start_transaction()
-        
-        insufficient_items = []
-        
-        # Check availability for each item
-        for item_request in items_to_reserve:
-            item_id = int(item_request['id'])
-            quantity = int(item_request.get('quantity', 0))
-            
-            if quantity <= 0:
-                cnx.rollback()
-                return _response(400, {'error': 'Quantity must be greater than 0'})
-            
-            # Lock row and get current availability
-            get_inventory = ("SELECT id, name, availableTickets "
-                            "FROM Vacation "
-                            "WHERE id = %s "
-                            "FOR UPDATE;")
-            cursor.execute(get_inventory, (item_id,))
-            vacation = cursor.fetchone()
-            
-            if not vacation:
-                cnx.rollback()
+        tx.begin()
+
+        if plain_ids:
+            # Lock every requested row and get current availability
+            placeholders = ', '.join(['%s'] * len(plain_ids))
+            get_inventory = ("SELECT id, name, availableTickets, ticketShards "
+                             "FROM Vacation "
+                             f"WHERE id IN ({placeholders}) "
+                             "ORDER BY id "
+                             "FOR UPDATE;")
+            cursor.execute(get_inventory, tuple(plain_ids))
+            vacations.update((row['id'], row) for row in cursor.fetchall())
+        if shard_ids:
+            # Plain read: the Vacation row of a hot item is deliberately not locked
+            get_sharded = ("SELECT id, name, ticketShards "
+                           "FROM Vacation "
+                           f"WHERE id IN ({', '.join(['%s'] * len(shard_ids))});")
+            cursor.execute(get_sharded, tuple(shard_ids))
+            vacations.update((row['id'], row) for row in cursor.fetchall())
+
+        for item_id in cart:
+            if item_id not in vacations:
+                tx.rollback()
                 return _response(404, {'error': f'Item {item_id} not found'})
-            
-            available_quantity = vacation['availableTickets']
-            
-            if quantity > available_quantity:
-                insufficient_items.append({
-                    'id': item_id,
-                    'name': vacation['name'],
-                    'requested': quantity,
-                    'available': available_quantity
-                })
-        
+            if bool(vacations[item_id]['ticketShards']) != (item_id in sharded):
+                raise _ShardingChanged()
+
+        # Locked ticket counts, patched into the cache
+        remaining = {item_id: vacations[item_id]['availableTickets'] or 0 for item_id in plain_ids}
+        short = {item_id: remaining[item_id] for item_id in plain_ids if cart[item_id] > remaining[item_id]}
+
         # If any items are insufficient, rollback
-        if insufficient_items:
-            cnx.rollback()
-            return _response(409, {
-                'error': 'Insufficient inventory',
-                'items': insufficient_items
-            })
-        
-        # All items available, update quantities
-        for item_request in items_to_reserve:
-            item_id = int(item_request['id'])
-            quantity = int(item_request['quantity'])
-            
+        if short:
+            totals = _shard_totals(cursor, shard_ids)
+            short.update((item_id, totals[item_id]) for item_id in shard_ids if cart[item_id] > totals[item_id])
+            tx.rollback()
+            _CACHE.set_availability(remaining)
+            _SOLD_OUT.update(short, _names(vacations))
+            return _insufficient_response(cart, vacations, short)
+
+        if plain_ids:
+            # All items available, decrement every row in one statement
+            cases = ' '.join(['WHEN %s THEN %s'] * len(plain_ids))
             update_quantity = ("UPDATE Vacation "
-                               "SET availableTickets = availableTickets - %s "
-                               "WHERE id = %s;")
-            cursor.execute(update_quantity, (quantity, item_id))
-        
+                               f"SET availableTickets = availableTickets - CASE id {cases} END "
+                               f"WHERE id IN ({placeholders});")
+            case_data = tuple(value for item_id in plain_ids for value in (item_id, cart[item_id]))
+            cursor.execute(update_quantity, case_data + tuple(plain_ids))
+
+        for item_id in shard_ids:
+            available = _take_from_shards(cursor, item_id, cart[item_id], sharded[item_id])
+            if available is not None:
+                short[item_id] = available
+        if short:
+            tx.rollback()
+            _SOLD_OUT.update(short, _names(vacations))
+            return _insufficient_response(cart, vacations, short)
+
         # Commit transaction
-        cnx.commit()
-        cursor.close()
-        cnx.close()
-        
+        tx.commit()
+        if tx.nested:
+            # The caller may still roll back, so only drop the stale counts
+            _CACHE.expire_availability(list(cart))
+        else:
+            for item_id in plain_ids:
+                remaining[item_id] -= cart[item_id]
+            _CACHE.set_availability(remaining)
+            _CACHE.expire_availability(shard_ids)
+            _SOLD_OUT.update(remaining, _names(vacations))
+
         return _response(200, {'message': 'Items reserved successfully'})
-    
-    except Exception as e:
-        if cnx:
+    finally:
+        cursor.close()
+
+
+def _take_from_shards(cursor, item_id: int, quantity: int, shard_count: int) -> Optional[int]:
+    """Decrement one shard of ``item_id`` by ``quantity``.
+
+    Starts at a random shard and takes the first one with enough stock that
+    no other transaction holds, so concurrent buyers of a hot item spread
+    across shards instead of queueing on one row. If no single shard can
+    cover the quantity, every shard is locked in order and drained
+    greedily. Returns None on success, otherwise the item's total stock.
+    """
+    pick_shard = ("SELECT shardId "
+                  "FROM VacationTicketShard "
+                  "WHERE vacationId = %s AND shardId >= %s AND availableTickets >= %s "
+                  "ORDER BY shardId "
+                  "LIMIT 1 "
+                  "FOR UPDATE SKIP LOCKED;")
+    update_shard = ("UPDATE VacationTicketShard "
+                    "SET availableTickets = availableTickets - %s "
+                    "WHERE vacationId = %s AND shardId = %s;")
+    for lowest in (random.randrange(shard_count), 0):
+        cursor.execute(pick_shard, (item_id, lowest, quantity))
+        shard = cursor.fetchone()
+        if shard:
+            cursor.execute(update_shard, (quantity, item_id, shard['shardId']))
+            return None
+
+    lock_shards = ("SELECT shardId, availableTickets "
+                   "FROM VacationTicketShard "
+                   "WHERE vacationId = %s "
+                   "ORDER BY shardId "
+                   "FOR UPDATE;")
+    cursor.execute(lock_shards, (item_id,))
+    shards = cursor.fetchall()
+    if not shards:
+        raise _ShardingChanged()
+    total = sum(shard['availableTickets'] for shard in shards)
+    if total < quantity:
+        return total
+
+    needed = quantity
+    for shard in shards:
+        take = min(needed, shard['availableTickets'])
+        if take:
+            cursor.execute(update_shard, (take, item_id, shard['shardId']))
+            needed -= take
+        if not needed:
+            break
+    return None
+
+
+def _shard_totals(cursor, item_ids: List[int]) -> Dict[int, int]:
+    totals = {item_id: 0 for item_id in item_ids}
+    if item_ids:
+        get_totals = ("SELECT vacationId, CAST(SUM(availableTickets) AS SIGNED) AS total "
+                      "FROM VacationTicketShard "
+                      f"WHERE vacationId IN ({', '.join(['%s'] * len(item_ids))}) "
+                      "GROUP BY vacationId;")
+        cursor.execute(get_totals, tuple(item_ids))
+        totals.update((row['vacationId'], row['total']) for row in cursor.fetchall())
+    return totals
+
+
+def _reserve_optimistic(tx: _Transaction, cart: Dict[int, int], sharded: Dict[int, int]) -> dict:
+    """Reserve the cart with one conditional decrement and no locking read.
+
+    Every row is decremented only if it still has enough tickets, and the
+    affected-row count tells whether the whole cart fit. A single-item cart
+    runs as one autocommit statement; larger carts, and carts recorded in
+    CHECKOUT, wrap the statement in a transaction so a partial decrement can
+    be rolled back. On failure the
+    current counts are read (without locks) to build the same 404/409
+    payloads as the locking path. Carts with sharded items are never routed
+    here.
+    """
+    cnx = tx.cnx
+    item_ids = sorted(cart)
+    placeholders = ', '.join(['%s'] * len(item_ids))
+    cases = ' '.join(['WHEN %s THEN %s'] * len(item_ids))
+    case_data = tuple(value for item_id in item_ids for value in (item_id, cart[item_id]))
+    cursor = cnx.cursor(dictionary=True)
+    try:
+        if len(item_ids) > 1 or tx.checkout is not None:
+            tx.begin()
+
+        update_quantity = ("UPDATE Vacation "
+                           f"SET availableTickets = availableTickets - CASE id {cases} END "
+                           f"WHERE id IN ({placeholders}) "
+                           "AND ticketShards = 0 "
+                           f"AND availableTickets >= CASE id {cases} END;")
+        cursor.execute(update_quantity, case_data + tuple(item_ids) + case_data)
+
+        if cursor.rowcount == len(item_ids):
+            tx.commit()
+            _CACHE.expire_availability(item_ids)
+            return _response(200, {'message': 'Items reserved successfully'})
+
+        tx.rollback()
+
+        get_inventory = ("SELECT id, name, availableTickets, ticketShards "
+                         "FROM Vacation "
+                         f"WHERE id IN ({placeholders});")
+        cursor.execute(get_inventory, tuple(item_ids))
+        vacations = {row['id']: row for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+    for item_id in cart:
+        if item_id not in vacations:
+            return _response(404, {'error': f'Item {item_id} not found'})
+        if vacations[item_id]['ticketShards']:
+            raise _ShardingChanged()
+
+    remaining = {item_id: vacations[item_id]['availableTickets'] or 0 for item_id in cart}
+    _CACHE.set_availability(remaining)
+    _SOLD_OUT.update(remaining, _names(vacations))
+    short = {item_id: count for item_id, count in remaining.items() if cart[item_id] > count}
+    # If stock was released between the update and the read, no line looks
+    # short any more; report the whole cart rather than retrying here
+    return _insufficient_response(cart, vacations, short or remaining)
+
+
+def release_checkout(order_token: str, error: str) -> bool:
+    """Cancel an asynchronous checkout and return its tickets to stock.
+
+    Deliberately not routed: order-processing calls this in-process when a
+    checkout cannot be completed. The tickets come from the checkout's own
+    CHECKOUT row, never from the caller, and are only returned while that
+    row is still RESERVED or PAID and no order exists for the token. The
+    row is marked FAILED in the same transaction, so a checkout is released
+    at most once. Unsharded items are incremented in one statement; a
+    sharded item gets its tickets back on a random shard. Returns whether
+    this call released the checkout.
+    """
+    with _db_connection() as cnx:
+        for attempt in (1, 2):
+            try:
+                cart = _release_in_transaction(cnx, order_token, error, _sharded_items(cnx))
+                break
+            except _ShardingChanged:
+                if attempt == 2:
+                    raise RuntimeError(f'Items of checkout {order_token} are missing or being resharded')
+                _invalidate_shard_map()
+
+    if cart is None:
+        return False
+    _CACHE.expire_availability(list(cart))
+    _SOLD_OUT.clear(list(cart))
+    return True
+
+
+def _release_in_transaction(cnx, order_token: str, error: str, sharded: Dict[int, int]) -> Optional[Dict[int, int]]:
+    """Release the checkout's cart and mark it FAILED; None if it is not releasable.
+
+    Raises _ShardingChanged (rolled back) if an item row was not found.
+    """
+    cursor = cnx.cursor()
+    try:
+        cnx.start_transaction()
+        # The CHECKOUT row lock is what keeps the release from racing an order
+        # insert: order._existing_orders locks the same row FOR UPDATE before
+        # writing, and refuses it once it is FAILED. The NOT EXISTS subquery is
+        # a plain read and locks nothing in ORDERS
+        get_checkout = ("SELECT ITEMS FROM CHECKOUT "
+                        "WHERE ORDER_TOKEN = %s "
+                        "AND STATUS IN ('RESERVED', 'PAID') "
+                        "AND NOT EXISTS (SELECT 1 FROM ORDERS WHERE ORDERS.ORDER_TOKEN = CHECKOUT.ORDER_TOKEN) "
+                        "FOR UPDATE;")
+        cursor.execute(get_checkout, (order_token,))
+        row = cursor.fetchone()
+        if row is None:
             cnx.rollback()
-            cnx.close()
-        return _response(500, {'error': f'Reserve handling error: {str(e)}'})
+            return None
+        cart = _merge_cart(json.loads(row[0]))
+
+        plain_ids = sorted(item_id for item_id in cart if item_id not in sharded)
+        if plain_ids:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(plain_ids))
+            update_quantity = ("UPDATE Vacation "
+                               f"SET availableTickets = availableTickets + CASE id {cases} END "
+                               f"WHERE id IN ({', '.join(['%s'] * len(plain_ids))}) "
+                               "AND ticketShards = 0;")
+            case_data = tuple(value for item_id in plain_ids for value in (item_id, cart[item_id]))
+            cursor.execute(update_quantity, case_data + tuple(plain_ids))
+            if cursor.rowcount != len(plain_ids):
+                raise _ShardingChanged()
+
+        update_shard = ("UPDATE VacationTicketShard "
+                        "SET availableTickets = availableTickets + %s "
+                        "WHERE vacationId = %s AND shardId = %s;")
+        for item_id in sorted(item_id for item_id in cart if item_id in sharded):
+            cursor.execute(update_shard, (cart[item_id], item_id, random.randrange(sharded[item_id])))
+            if cursor.rowcount != 1:
+                raise _ShardingChanged()
+
+        fail_checkout = "UPDATE CHECKOUT SET STATUS = 'FAILED', ERROR = %s WHERE ORDER_TOKEN = %s;"
+        cursor.execute(fail_checkout, (error, order_token))
+        cnx.commit()
+        return cart
+    except Exception:
+        cnx.rollback()
+        raise
+    finally:
+        cursor.close()
+
 
-        
 # AWS Lambda handler function
 def lambda_handler(event: dict, context) -> dict:
     """AWS Lambda handler for inventory management service"""
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    return api_response.compress(_route(event), headers.get('accept-encoding'))
+
+
+def _route(event: dict) -> dict:
     try:
         # Extract HTTP method and path from event
         requestContext = event.get('requestContext', {})
@@ -365,8 +1578,10 @@ def lambda_handler(event: dict, context) -> dict:
         path = http.get('path', '')
         method = http.get('method', '')
 
-        query_params = event.get('queryStringParameters', {})
-        path_params = event.get('pathParameters', {})
+        query_params = event.get('queryStringParameters') or {}
+        path_params = event.get('pathParameters') or {}
+        headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+        if_none_match = headers.get('if-none-match')
         body = event.get('body', {})
         
         if isinstance(body, str):
@@ -379,10 +1594,16 @@ def lambda_handler(event: dict, context) -> dict:
         
         # Debug logging
         print(f"Method: {method}, Path: {path}, PathParams: {path_params}, QueryParams: {query_params}")
+        print(f"Catalog cache: {_CACHE.stats()}, sold-out rejections: {_SOLD_OUT.rejections}")
         
         # Route requests based on path and method
         if path == '/inventory-management/inventory' and method == 'GET':
-            return get_all_inventory()
+            if any(query_params.get(key) for key in ('limit', 'cursor', 'fields')):
+                return get_inventory_page(query_params.get('limit'), query_params.get('cursor'),
+                                          query_params.get('fields'), if_none_match)
+            return get_all_inventory(if_none_match)
+        elif path == '/inventory-management/inventory/availability' and method == 'GET':
+            return get_availability()
         elif path.startswith('/inventory-management/inventory/items') and method == 'GET':
             # Check if we have an ID in path parameters or path
             item_id = None
@@ -395,14 +1616,16 @@ def lambda_handler(event: dict, context) -> dict:
                     item_id = int(path_parts[-1])
             
             if item_id is not None:
-                return get_item_by_id(item_id)
+                return get_item_by_id(item_id, if_none_match)
+            elif query_params.get('ids'):
+                return get_items_by_ids(query_params['ids'], query_params.get('view'), if_none_match)
             else:
                 # Search by name — check pathParams first, then query string
                 name_query = (
                     path_params.get('name') or
                     query_params.get('name', '')
                 )
-                return get_items_by_name(name_query)
+                return get_items_by_name(name_query, query_params.get('limit'), query_params.get('offset', 0))
         elif path == '/inventory-management/inventory/items' and method == 'POST':
             return reserve_items(request_data)
         else:
@@ -0,0 +1,232 @@
+"""Load the product JSON files into the catalog tables.
+
+Usage:
+    python load_catalog.py [--products DIR] [--workers N] [--prune] [--dry-run]
+
+Files are parsed and normalized in parallel worker processes. The result is
+diffed against the current Vacation, Image, Include and Highlight rows, and
+only the differences are written, in one transaction (see ``load_catalog``).
+Reloading an unchanged catalog writes nothing. availableTickets is taken
+from the files only for new vacations, so live stock is never reset. Uses
+the same DB_* environment variables and caches as the inventory service.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from inventory_management import (_CACHE, _CHILD_TABLES, _SOLD_OUT, _db_connection, _invalidate_search_index,
+                                  _invalidate_shard_map)
+
+
+PRODUCTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "products")
+# The files write dates as "January 15, 2026"; ISO dates are accepted too
+_DATE_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%Y-%m-%d")
+# Rows per multi-row statement
+LOAD_BATCH_SIZE = int(os.environ.get('LOAD_BATCH_SIZE', '1000'))
+
+
+def _text(value) -> str | None:
+    return None if value is None else str(value).strip()
+
+
+def _date(value) -> str | None:
+    if not value:
+        return None
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), date_format).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognized departureDate {value!r}")
+
+
+def _strings(values) -> list[str]:
+    return [str(value).strip() for value in values or []]
+
+
+def parse_product(path: str) -> dict:
+    """Read one product file into the row shape ``load_catalog`` expects."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    price = data.get("price")
+    return {
+        "id": int(data["id"]),
+        "name": _text(data["name"]),
+        "location": _text(data.get("location")),
+        "price": None if price is None else float(price),
+        "duration": _text(data.get("duration")),
+        "departureDate": _date(data.get("departureDate")),
+        "shortDescription": _text(data.get("shortDescription")),
+        "description": _text(data.get("description")),
+        "availableTickets": int(data.get("availableTickets") or 0),
+        "images": _strings(data.get("images")),
+        "includes": _strings(data.get("includes")),
+        "highlights": _strings(data.get("highlights")),
+    }
+
+
+def _parse_or_error(path: str) -> tuple[dict | None, str | None]:
+    try:
+        return parse_product(path), None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return None, f"{path}: {e}"
+
+
+def parse_products(directory: str = PRODUCTS_DIR, workers: int | None = None) -> list[dict]:
+    """Parse every ``*.json`` file in ``directory``; raise listing all bad files."""
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json"))
+    if workers == 1 or len(paths) < 2:
+        results = [_parse_or_error(path) for path in paths]
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(paths) // (workers * 4))
+            results = list(executor.map(_parse_or_error, paths, chunksize=chunksize))
+    errors = [error for _, error in results if error]
+    if errors:
+        raise ValueError("Invalid product files:\n" + "\n".join(errors))
+    return [product for product, _ in results]
+
+
+# Vacation columns owned by the catalog files. availableTickets is only set
+# when a vacation is first inserted, so a reload never resets live stock.
+_CATALOG_COLUMNS = ("name", "location", "price", "duration", "departureDate", "shortDescription", "description")
+
+
+def load_catalog(products: list[dict], prune: bool = False, dry_run: bool = False) -> dict:
+    """Bring the catalog tables in line with ``products``, writing only what changed.
+
+    ``products`` are normalized dicts with ``id``, the _CATALOG_COLUMNS,
+    ``availableTickets`` and the child lists. The current rows are read once
+    and diffed in memory. New or changed vacations are written with batched
+    multi-row upserts. A child list that differs is replaced as a whole.
+    With ``prune``, vacations missing from ``products`` are deleted.
+    Everything runs in one transaction, which ``dry_run`` rolls back.
+    """
+    ids = [product["id"] for product in products]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Duplicate product ids")
+
+    with _db_connection() as cnx:
+        cursor = cnx.cursor(dictionary=True)
+        try:
+            cnx.start_transaction()
+            current = _current_catalog(cursor)
+
+            upserts = []
+            replaced: dict[str, list[dict]] = {key: [] for _, _, key in _CHILD_TABLES}
+            for product in products:
+                existing = current.get(product["id"])
+                if existing is None or existing["static"] != tuple(product[column] for column in _CATALOG_COLUMNS):
+                    upserts.append(product)
+                for _, _, key in _CHILD_TABLES:
+                    if existing is None or existing[key] != product[key]:
+                        replaced[key].append(product)
+            pruned = sorted(set(current).difference(ids)) if prune else []
+
+            columns = ("id",) + _CATALOG_COLUMNS + ("availableTickets",)
+            _insert_batches(cursor, f"INSERT INTO Vacation ({', '.join(columns)})", len(columns),
+                            [tuple(product[column] for column in columns) for product in upserts],
+                            " ON DUPLICATE KEY UPDATE "
+                            + ", ".join(f"{column} = VALUES({column})" for column in _CATALOG_COLUMNS))
+            for table, column, key in _CHILD_TABLES:
+                _delete_batches(cursor, table, "vacationId", [product["id"] for product in replaced[key]])
+                _insert_batches(cursor, f"INSERT INTO {table} (vacationId, {column})", 2,
+                                [(product["id"], value) for product in replaced[key] for value in product[key]])
+            for table, _, _ in _CHILD_TABLES:
+                _delete_batches(cursor, table, "vacationId", pruned)
+            _delete_batches(cursor, "VacationTicketShard", "vacationId", pruned)
+            _delete_batches(cursor, "Vacation", "id", pruned)
+
+            if dry_run:
+                cnx.rollback()
+            else:
+                cnx.commit()
+        except Exception:
+            cnx.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    changed = sorted({product["id"] for product in upserts}.union(
+        product["id"] for key in replaced for product in replaced[key]))
+    if not dry_run and (changed or pruned):
+        _CACHE.invalidate(changed + pruned)
+        _SOLD_OUT.clear(changed + pruned)
+        _invalidate_search_index()
+    if pruned and not dry_run:
+        _invalidate_shard_map()
+    return {
+        "products": len(products),
+        "inserted": sum(1 for product in upserts if product["id"] not in current),
+        "updated": sum(1 for product in upserts if product["id"] in current),
+        "childListsReplaced": {key: len(replaced[key]) for key in replaced},
+        "deleted": len(pruned),
+        "unchanged": len(products) - len(changed),
+        "dryRun": dry_run,
+    }
+
+
+def _current_catalog(cursor) -> dict[int, dict]:
+    """``{id: {"static": tuple of _CATALOG_COLUMNS, "images": [...], ...}}`` for every vacation."""
+    cursor.execute(f"SELECT id, {', '.join(_CATALOG_COLUMNS)} FROM Vacation;")
+    current = {}
+    for row in cursor.fetchall():
+        row["price"] = float(row["price"]) if row["price"] is not None else None
+        if row["departureDate"] is not None:
+            row["departureDate"] = str(row["departureDate"])  # DATE -> "YYYY-MM-DD"
+        current[row["id"]] = {"static": tuple(row[column] for column in _CATALOG_COLUMNS)}
+        current[row["id"]].update((key, []) for _, _, key in _CHILD_TABLES)
+    for table, column, key in _CHILD_TABLES:
+        get_children = (
+            f"SELECT vacationId, {column} "
+            f"FROM {table} "
+            "WHERE vacationId IS NOT NULL "
+            "ORDER BY vacationId, id;"
+        )
+        cursor.execute(get_children)
+        for row in cursor.fetchall():
+            entry = current.get(row["vacationId"])
+            if entry is not None:
+                entry[key].append(row[column])
+    return current
+
+
+def _insert_batches(cursor, insert: str, width: int, rows: list[tuple], suffix: str = "") -> None:
+    placeholders = "(" + ", ".join(["%s"] * width) + ")"
+    for start in range(0, len(rows), LOAD_BATCH_SIZE):
+        batch = rows[start:start + LOAD_BATCH_SIZE]
+        cursor.execute(f"{insert} VALUES {', '.join([placeholders] * len(batch))}{suffix};",
+                       tuple(value for row in batch for value in row))
+
+
+def _delete_batches(cursor, table: str, column: str, ids: list[int]) -> None:
+    for start in range(0, len(ids), LOAD_BATCH_SIZE):
+        batch = ids[start:start + LOAD_BATCH_SIZE]
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({', '.join(['%s'] * len(batch))});", tuple(batch))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", default=PRODUCTS_DIR, help="directory of product JSON files")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--prune", action="store_true", help="delete vacations that have no product file")
+    parser.add_argument("--dry-run", action="store_true", help="report the changes and roll them back")
+    args = parser.parse_args(argv)
+    products = parse_products(args.products, args.workers)
+    result = load_catalog(products, prune=args.prune, dry_run=args.dry_run)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Shard, unshard and rebalance the ticket counters of hot inventory items.
+
+Usage:
+    python manage_shards.py shard ITEM_ID SHARDS
+    python manage_shards.py unshard ITEM_ID
+    python manage_shards.py rebalance [ITEM_ID] [--threshold N]
+
+Uses the same DB_* environment variables as the inventory service.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+
+from inventory_management import _CACHE, _SOLD_OUT, _db_connection, _execute_query, _invalidate_shard_map
+
+
+def shard_item(item_id: int, shard_count: int) -> dict:
+    """Split an item's stock evenly across ``shard_count`` counter rows.
+
+    Calling it on an already sharded item re-shards its current total;
+    ``shard_count`` 0 moves the stock back onto the Vacation row.
+    """
+    if shard_count < 0:
+        raise ValueError("shard_count must not be negative")
+    with _db_connection() as cnx:
+        cursor = cnx.cursor(dictionary=True)
+        try:
+            cnx.start_transaction()
+            total = _lock_item_stock(cursor, item_id)
+            delete_shards = "DELETE FROM VacationTicketShard WHERE vacationId = %s;"
+            cursor.execute(delete_shards, (item_id,))
+            if shard_count:
+                _insert_shards(cursor, item_id, total, shard_count)
+            update_vacation = ("UPDATE Vacation "
+                               "SET ticketShards = %s, availableTickets = %s "
+                               "WHERE id = %s;")
+            cursor.execute(update_vacation, (shard_count, 0 if shard_count else total, item_id))
+            cnx.commit()
+        finally:
+            cursor.close()
+    _invalidate_shard_map()
+    _CACHE.expire_availability([item_id])
+    _SOLD_OUT.clear([item_id])
+    return {"id": item_id, "shards": shard_count, "availableTickets": total}
+
+
+def unshard_item(item_id: int) -> dict:
+    """Fold an item's shards back into Vacation.availableTickets."""
+    return shard_item(item_id, 0)
+
+
+def rebalance_item(item_id: int) -> dict:
+    """Spread a sharded item's stock evenly across its existing shards."""
+    with _db_connection() as cnx:
+        cursor = cnx.cursor(dictionary=True)
+        try:
+            cnx.start_transaction()
+            total = _lock_item_stock(cursor, item_id)
+            get_count = "SELECT ticketShards FROM Vacation WHERE id = %s;"
+            cursor.execute(get_count, (item_id,))
+            shard_count = cursor.fetchone()['ticketShards']
+            if shard_count:
+                cursor.execute("DELETE FROM VacationTicketShard WHERE vacationId = %s;", (item_id,))
+                _insert_shards(cursor, item_id, total, shard_count)
+            cnx.commit()
+        finally:
+            cursor.close()
+    return {"id": item_id, "shards": shard_count, "availableTickets": total}
+
+
+def rebalance_drained(threshold: int = 0) -> list[dict]:
+    """Rebalance every sharded item that has a shard at or below ``threshold``."""
+    get_drained = ("SELECT DISTINCT vacationId "
+                   "FROM VacationTicketShard "
+                   "WHERE availableTickets <= %s "
+                   "ORDER BY vacationId;")
+    rows = _execute_query(get_drained, (threshold,), fetch_all=True) or []
+    return [rebalance_item(row["vacationId"]) for row in rows]
+
+
+def _lock_item_stock(cursor, item_id: int) -> int:
+    """Lock an item's Vacation row and shards; return its total stock."""
+    lock_vacation = ("SELECT availableTickets, ticketShards "
+                     "FROM Vacation "
+                     "WHERE id = %s "
+                     "FOR UPDATE;")
+    cursor.execute(lock_vacation, (item_id,))
+    vacation = cursor.fetchone()
+    if not vacation:
+        raise ValueError(f"Item {item_id} not found")
+    lock_shards = ("SELECT availableTickets "
+                   "FROM VacationTicketShard "
+                   "WHERE vacationId = %s "
+                   "ORDER BY shardId "
+                   "FOR UPDATE;")
+    cursor.execute(lock_shards, (item_id,))
+    return (vacation['availableTickets'] or 0) + sum(row['availableTickets'] for row in cursor.fetchall())
+
+
+def _insert_shards(cursor, item_id: int, total: int, shard_count: int) -> None:
+    base, extra = divmod(total, shard_count)
+    insert_shards = ("INSERT INTO VacationTicketShard (vacationId, shardId, availableTickets) "
+                     f"VALUES {', '.join(['(%s, %s, %s)'] * shard_count)};")
+    data = tuple(
+        value
+        for shard_id in range(shard_count)
+        for value in (item_id, shard_id, base + (1 if shard_id < extra else 0))
+    )
+    cursor.execute(insert_shards, data)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    shard = commands.add_parser("shard", help="split an item's stock across SHARDS counter rows")
+    shard.add_argument("item_id", type=int)
+    shard.add_argument("shards", type=int)
+
+    unshard = commands.add_parser("unshard", help="move an item's stock back onto its Vacation row")
+    unshard.add_argument("item_id", type=int)
+
+    rebalance = commands.add_parser("rebalance", help="spread stock evenly across an item's shards")
+    rebalance.add_argument("item_id", type=int, nargs="?")
+    rebalance.add_argument("--threshold", type=int, default=0,
+                           help="without ITEM_ID, rebalance items with a shard at or below this count")
+
+    args = parser.parse_args(argv)
+    if args.command == "shard":
+        result = shard_item(args.item_id, args.shards)
+    elif args.command == "unshard":
+        result = unshard_item(args.item_id)
+    elif args.item_id is not None:
+        result = rebalance_item(args.item_id)
+    else:
+        result = rebalance_drained(args.threshold)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
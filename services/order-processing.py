@@ -1,30 +1,73 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
 from uuid import uuid4
 
 import requests
-import boto3
+from requests.adapters import HTTPAdapter
+
+import api_response
+import idempotency
 
 ROOT_URL = os.environ.get('ROOT_URL')
 HEADERS = {
     "Content-Type": "application/json",
-    "Access-Control-Allow-Headers": "Content-Type",
-    "Access-Control-Allow-Methods": "POST",
+    "Access-Control-Allow-Headers": "Content-Type, Idempotency-Key",
+    "Access-Control-Allow-Methods": "GET, POST",
 }
 BUSINESS_ID = 1234567
+# Items the inventory service reported at 0 tickets are rejected locally for this long
+SOLD_OUT_TTL = float(os.environ.get('SOLD_OUT_TTL', '2'))
+# Successful responses are replayed for repeated Idempotency-Keys for this long
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+# Replayable responses also kept in this process, in front of the IDEMPOTENCY table
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+# How long a duplicate waits for the in-flight submission with its key before
+# its 409; keep it well under the API Gateway integration timeout (29 s)
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', '10'))
+# A claim not finished after this many seconds is taken over; keep it above the function timeout
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', '900'))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3'))
+# Read timeout in seconds for each downstream call
+HTTP_TIMEOUTS = {
+    "fetch_items": float(os.environ.get('FETCH_ITEM_TIMEOUT', '10')),
+    "reserve_items": float(os.environ.get('RESERVE_ITEMS_TIMEOUT', '5')),
+    "payment": float(os.environ.get('PAYMENT_TIMEOUT', '5')),
+    "orders": float(os.environ.get('ORDERS_TIMEOUT', '5')),
+}
+# Only idempotent (GET) calls are retried
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '2'))
+HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', '0.1'))
+HTTP_BACKOFF_CAP = float(os.environ.get('HTTP_BACKOFF_CAP', '1'))
+_RETRY_STATUSES = {502, 503, 504}
+# "http" calls inventory, payment and order through API Gateway; "inprocess"
+# imports and calls them directly on one shared DB transaction; "auto" uses
+# in-process calls when the sibling modules are deployed alongside this one
+SERVICE_MODE = os.environ.get('SERVICE_MODE', 'http')
+# "sync" persists payment and order before answering; "async" answers 202
+# once the tickets are reserved and paid for and leaves the order to
+# checkout_worker_handler
+CHECKOUT_MODE = os.environ.get('CHECKOUT_MODE', 'sync')
+# Deliveries of a checkout message before its reservation is released
+CHECKOUT_MAX_ATTEMPTS = int(os.environ.get('CHECKOUT_MAX_ATTEMPTS', '3'))
+# checkout_sweep_handler releases checkouts left RESERVED or PAID this many
+# seconds; keep it above the queue's visibility timeout * CHECKOUT_MAX_ATTEMPTS
+CHECKOUT_TIMEOUT = float(os.environ.get('CHECKOUT_TIMEOUT', '3600'))
+CHECKOUT_SWEEP_BATCH_SIZE = int(os.environ.get('CHECKOUT_SWEEP_BATCH_SIZE', '100'))
+# Check the cart's prices against inventory (one batched call) before reserving;
+# a cart priced differently is answered 409 "Prices changed"
+VERIFY_PRICES = os.environ.get('VERIFY_PRICES', 'true').lower() == 'true'
 
 
 def _response(status: int, body: dict | list | None = None) -> dict:
-    response = {
-        "isBase64Encoded": False,
-        "statusCode": status,
-        "headers": HEADERS,
-    }
-    if body is not None:
-        response["body"] = json.dumps(body)
-    return response
+    return api_response.build(status, body, HEADERS)
 
 
 def _format_body(body: object) -> dict | None:
@@ -47,27 +90,277 @@ def _validate_section(section: object, name: str) -> dict:
     return section
 
 
-def _fetch_item(item_id: int) -> dict:
-    url = f'{ROOT_URL.rstrip('/')}/inventory-management/inventory/items/{item_id}'
+def _load_local_services() -> tuple | None:
+    if SERVICE_MODE not in ("inprocess", "auto"):
+        return None
     try:
-        response = requests.get(url, timeout=10)
-    except requests.exceptions.Timeout as e:
-        raise RuntimeError(f"{e}\nInventory service timed out: {url}") from e
+        import inventory_management
+        import order as order_service
+        import payment as payment_service
+    except ImportError:
+        if SERVICE_MODE == "inprocess":
+            raise
+        print("Sibling services are not deployed with order-processing; calling them over HTTP")
+        return None
+    return inventory_management, payment_service, order_service
 
-    if response.status_code == 404:
-        raise ValueError(f"Item {item_id} not found")
 
-    if not response.ok:
-        raise RuntimeError(f"Inventory service error: {response.status_code}: {response.text}")
+# (inventory_management, payment, order) modules, or None in HTTP mode
+_LOCAL_SERVICES = _load_local_services()
+
+
+def _load_checkout() -> tuple:
+    if CHECKOUT_MODE != "async":
+        return None, None
+    import checkout
+    # Failed checkouts are released in-process; there is no public release route
+    import inventory_management
+    return checkout, inventory_management
+
+
+# The checkout state store and queue module and the inventory module that
+# releases failed checkouts, or None in sync mode
+_CHECKOUT, _CHECKOUT_INVENTORY = _load_checkout()
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Module level so keep-alive connections survive across warm Lambda invocations
+_SESSION = _build_session()
+_LATENCIES: dict[str, deque] = {endpoint: deque(maxlen=1000) for endpoint in HTTP_TIMEOUTS}
 
-    return response.json()
 
+def _request(endpoint: str, method: str, url: str, **kwargs) -> requests.Response:
+    """Send a request on the shared session and record its latency.
 
-def _reserve_items(items: list[dict]) -> dict:
+    GETs are retried up to HTTP_MAX_RETRIES times on connection errors,
+    timeouts and 502/503/504, sleeping with full-jitter exponential backoff
+    in between. Other methods are sent exactly once.
+    """
+    attempts = 1 + (HTTP_MAX_RETRIES if method == "GET" else 0)
+    timeout = (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUTS[endpoint])
+    for attempt in range(attempts):
+        started = time.perf_counter()
+        try:
+            response = _SESSION.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == attempts - 1:
+                raise
+        else:
+            if response.status_code not in _RETRY_STATUSES or attempt == attempts - 1:
+                return response
+        finally:
+            _LATENCIES[endpoint].append(time.perf_counter() - started)
+        time.sleep(random.uniform(0, min(HTTP_BACKOFF_CAP, HTTP_BACKOFF_BASE * 2 ** attempt)))
+
+
+def _latency_stats() -> dict:
+    """p50/p99/max in milliseconds over the recent calls to each endpoint."""
+    stats = {}
+    for endpoint, samples in _LATENCIES.items():
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        stats[endpoint] = {
+            "count": len(ordered),
+            "p50": round(ordered[len(ordered) // 2] * 1000, 1),
+            "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 1),
+            "max": round(ordered[-1] * 1000, 1),
+        }
+    return stats
+
+
+class _SoldOutCache:
+    """Short-lived negative cache of item ids the inventory service reported sold out.
+
+    Carts containing one of these items get the inventory service's 409
+    payload without another reservation round trip. Entries expire after
+    ``ttl`` seconds and are cleared when a reservation for the item succeeds.
+    """
+
+    def __init__(self, ttl: float):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._items: dict[int, tuple[str | None, float]] = {}  # id -> (name, expires_at)
+
+    def remember(self, insufficient_items: list[dict]) -> None:
+        with self._lock:
+            expires_at = time.monotonic() + self._ttl
+            for item in insufficient_items:
+                if item.get("available") == 0:
+                    self._items[int(item["id"])] = (item.get("name"), expires_at)
+
+    def forget(self, item_ids: list[int]) -> None:
+        with self._lock:
+            for item_id in item_ids:
+                self._items.pop(item_id, None)
+
+    def insufficient(self, items: list[dict]) -> list[dict]:
+        """409 payload lines for the cart items currently marked sold out."""
+        with self._lock:
+            now = time.monotonic()
+            lines = []
+            for item in items:
+                entry = self._items.get(item["id"])
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self._items[item["id"]]
+                    continue
+                lines.append({"id": item["id"], "name": entry[0], "requested": item["quantity"], "available": 0})
+            return lines
+
+
+_SOLD_OUT = _SoldOutCache(SOLD_OUT_TTL)
+
+
+class _IdempotencyCache:
+    """Responses of order submissions, keyed by their Idempotency-Key header.
+
+    Keys are claimed in the shared IDEMPOTENCY table (idempotency.py), so a
+    key holds across Lambda containers; this process only keeps a
+    read-through map of completed responses (at most ``max_size``) so
+    repeated replays skip the database. ``begin`` either claims a key for
+    the caller or returns the response to send instead: the stored response
+    for a replay, 422 when the key was used with a different body, or 409
+    when the original is still running after ``wait_timeout``. Duplicates
+    poll the store with one read per poll until the claimant calls
+    ``finish``, and only try to claim again once the key is freed, so only
+    one of them runs the checkout. Only 2xx responses are stored (for ``ttl`` seconds),
+    so a failed submission can be retried with the same key.
+    """
+
+    def __init__(self, store, ttl: float, max_size: int, wait_timeout: float, lock_timeout: float):
+        self._store = store
+        self._ttl = ttl
+        self._max_size = max_size
+        self._wait_timeout = wait_timeout
+        self._lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._results: OrderedDict[str, tuple[str, dict, float]] = OrderedDict()  # key -> (fingerprint, response, expires_at)
+        self._claimed: dict[str, str] = {}  # key -> fingerprint, for claims this process holds
+        self.replays = 0
+
+    def begin(self, key: str, fingerprint: str) -> dict | None:
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                del self._results[key]
+                entry = None
+        if entry is not None:
+            return self._replay(entry[0], entry[1], fingerprint)
+
+        deadline = time.monotonic() + self._wait_timeout
+        delay = 0.05
+        try:
+            claim = self._store.claim(key, fingerprint, self._lock_timeout)
+            while claim is not None:
+                if claim["fingerprint"] != fingerprint:
+                    return _response(422, {"error": "Idempotency-Key was already used for a different order"})
+                if claim["status"] == self._store.COMPLETED:
+                    self._remember(key, fingerprint, claim["response"])
+                    return self._replay(fingerprint, claim["response"], fingerprint)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return _response(409, {"error": "An order with this Idempotency-Key is still being processed"})
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.5)
+                claim = self._store.lookup(key)
+                if claim is None:
+                    # Released or expired; race the other duplicates for it
+                    claim = self._store.claim(key, fingerprint, self._lock_timeout)
+        except Exception as exc:
+            print(f"Idempotency store error: {exc}")
+            return _response(503, {"error": "Could not check the Idempotency-Key; please retry"})
+        with self._lock:
+            self._claimed[key] = fingerprint
+        return None
+
+    def finish(self, key: str, response: dict | None) -> None:
+        """Release the key claimed by ``begin``, storing ``response`` if it succeeded."""
+        with self._lock:
+            fingerprint = self._claimed.pop(key)
+        try:
+            if response is not None and 200 <= response["statusCode"] < 300:
+                self._store.complete(key, response, self._ttl)
+                self._remember(key, fingerprint, response)
+            else:
+                self._store.release(key)
+        except Exception as exc:
+            # The claim then blocks the key until it expires
+            print(f"Idempotency store error for key {key}: {exc}")
+
+    def _remember(self, key: str, fingerprint: str, response: dict) -> None:
+        with self._lock:
+            self._results[key] = (fingerprint, response, time.monotonic() + self._ttl)
+            self._results.move_to_end(key)
+            while len(self._results) > self._max_size:
+                self._results.popitem(last=False)
+
+    def _replay(self, stored_fingerprint: str, response: dict, fingerprint: str) -> dict:
+        if stored_fingerprint != fingerprint:
+            return _response(422, {"error": "Idempotency-Key was already used for a different order"})
+        with self._lock:
+            self.replays += 1
+        return {**response, "headers": {**response["headers"], "Idempotent-Replayed": "true"}}
+
+
+_IDEMPOTENCY = _IdempotencyCache(idempotency, IDEMPOTENCY_TTL, IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_WAIT_TIMEOUT,
+                                 IDEMPOTENCY_LOCK_TIMEOUT)
+
+
+def _fetch_items(item_ids: list[int]) -> dict[int, dict]:
+    """Current ``{id: {"id", "price", "availableTickets"}}`` for a whole cart in one call.
+
+    Raises ValueError naming any id the inventory service does not know.
+    """
+    if _LOCAL_SERVICES is not None:
+        fetched = _LOCAL_SERVICES[0].get_items_by_ids(",".join(map(str, item_ids)), "availability")
+        if fetched["statusCode"] != 200:
+            raise RuntimeError(f"Inventory service error: {fetched['statusCode']}: {fetched['body']}")
+        rows = json.loads(fetched["body"])
+    else:
+        url = f'{ROOT_URL.rstrip("/")}/inventory-management/inventory/items'
+        params = {"ids": ",".join(map(str, item_ids)), "view": "availability"}
+        try:
+            response = _request("fetch_items", "GET", url, params=params)
+        except requests.exceptions.Timeout as e:
+            raise RuntimeError(f"{e}\nInventory service timed out: {url}") from e
+        if not response.ok:
+            raise RuntimeError(f"Inventory service error: {response.status_code}: {response.text}")
+        rows = response.json()
+
+    items = {row["id"]: row for row in rows}
+    unknown = [item_id for item_id in item_ids if item_id not in items]
+    if unknown:
+        raise ValueError(f"Items not found: {', '.join(map(str, unknown))}")
+    return items
+
+
+def _price_mismatches(items: list[dict]) -> list[dict]:
+    """Cart lines whose price differs from the inventory's current price."""
+    current = _fetch_items(list(dict.fromkeys(item["id"] for item in items)))
+    return [
+        {"id": item["id"], "name": item["name"], "price": item["price"], "current_price": current[item["id"]]["price"]}
+        for item in items
+        if round(item["price"], 2) != round(float(current[item["id"]]["price"]), 2)
+    ]
+
+
+def _reserve_items(items: list[dict], order_token: str | None = None) -> dict:
     url = f'{ROOT_URL.rstrip("/")}/inventory-management/inventory/items'
+    reservation = {"items": items}
+    if order_token is not None:
+        reservation["order_token"] = order_token
     try:
         print(f"Sending inventory service post request")
-        response = requests.post(url, json={"items": items}, timeout=5)
+        response = _request("reserve_items", "POST", url, json=reservation)
     except requests.exceptions.Timeout as e:
         raise RuntimeError(f"{e}\nInventory service timed out: {url}") from e
 
@@ -80,6 +373,30 @@ def _reserve_items(items: list[dict]) -> dict:
     return {"status": 200, "body": response.json()}
 
 
+def _release_checkout(order_token: str, error: str) -> bool:
+    """Mark an async checkout FAILED and return its tickets, unless an order exists for it."""
+    released = _CHECKOUT_INVENTORY.release_checkout(order_token, error)
+    if not released:
+        print(f"Checkout {order_token} was not released: it has an order or is no longer pending")
+    return released
+
+
+def _release_after_error(order_token: str, exc: Exception) -> None:
+    try:
+        _release_checkout(order_token, str(exc))
+    except Exception as release_exc:
+        print(f"Releasing checkout {order_token} failed: {release_exc}")
+
+
+def _reservation_result(reservation: dict) -> dict:
+    """Translate an in-process reserve_items response into _reserve_items' shape."""
+    if reservation["statusCode"] == 409:
+        return {"status": 409, "body": json.loads(reservation["body"])}
+    if reservation["statusCode"] != 200:
+        raise RuntimeError(f"Inventory service error: {reservation['statusCode']}: {reservation['body']}")
+    return {"status": 200, "body": json.loads(reservation["body"])}
+
+
 def _validate_items(items: object) -> list[dict]:
     if not isinstance(items, list) or not items:
         raise ValueError(f"Invalid order format: {items}")
@@ -101,42 +418,267 @@ def _validate_items(items: object) -> list[dict]:
     return validated_items
 
 
-def _save_order_to_database(items: list[dict], payment: dict, shipping: dict) -> str:
-    payment_response = requests.post(f'{ROOT_URL.rstrip("/")}/payment', json=payment)
-    if not payment_response.ok:
-        raise RuntimeError("Error saving payment data")
-
-    shipping_confirmation_number = uuid4().hex[:10].upper()
-    orders = {
+def _order_request(items: list[dict], shipping: dict, shipping_confirmation_number: str,
+                   payment_confirmation_number: str) -> dict:
+    """Order service payload; the shipping message rides along and is written
+    to the outbox in the order's transaction instead of being published here."""
+    return {
         "orders": {
             "customer_name": shipping.get("name"),
             "shipping_info": shipping_confirmation_number,
-            "payment_info": payment_response.json().get("confirmation_number"),
+            "payment_info": payment_confirmation_number,
         },
-        "items": items
+        "items": items,
+        "shipping": _shipping_message(items, shipping, shipping_confirmation_number),
     }
-    order_response = requests.post(f'{ROOT_URL.rstrip("/")}/orders', json=orders)
-    if not order_response.ok:
-        raise RuntimeError("Error saving order data")
 
+
+def _shipping_message(items: list[dict], shipping: dict, shipping_confirmation_number: str) -> dict:
     shipping["confirmation_number"] = shipping_confirmation_number
     shipping["business_id"] = BUSINESS_ID
     shipping["num_packets"] = len(items)
     shipping["weight"] = sum([1.0 * items[i]['quantity'] for i in range(len(items))])
+    return shipping
+
+
+def _persist_payment(payment: dict, order_token: str | None = None) -> str:
+    if order_token is not None:
+        # Stored at most once per token by the payment service
+        payment = {**payment, "order_token": order_token}
+    if _LOCAL_SERVICES is not None:
+        return _LOCAL_SERVICES[1]._persist_payment_info(payment)
+
+    payment_response = _request("payment", "POST", f'{ROOT_URL.rstrip("/")}/payment', json=payment)
+    if not payment_response.ok:
+        raise RuntimeError("Error saving payment data")
+    return payment_response.json().get("confirmation_number")
 
-    sns = boto3.client('sns')
-    sns.publish(
-        TopicArn=os.environ.get('SHIPPING_TOPIC_ARN'),
-        Message=json.dumps(shipping),
-    )
 
+def _persist_order(orders: dict) -> str:
+    if _LOCAL_SERVICES is not None:
+        return _LOCAL_SERVICES[2]._save_order(orders["orders"], orders["items"], shipping=orders["shipping"])
+
+    order_response = _request("orders", "POST", f'{ROOT_URL.rstrip("/")}/orders', json=orders)
+    if not order_response.ok:
+        raise RuntimeError("Error saving order data")
     return order_response.json().get("confirmation_number")
 
 
+def _save_order_to_database(items: list[dict], payment: dict, shipping: dict) -> str:
+    payment_confirmation_number = _persist_payment(payment)
+    shipping_confirmation_number = uuid4().hex[:10].upper()
+    orders = _order_request(items, shipping, shipping_confirmation_number, payment_confirmation_number)
+    return _persist_order(orders)
+
+
+def _checkout_in_process(items: list[dict], payment: dict, shipping: dict) -> dict:
+    """Reserve, persist payment and persist the order in one DB transaction.
+
+    Returns the same ``{"status", "body"}`` shape as _reserve_items; on
+    success the body holds the order confirmation number. Any failure rolls
+    back the reservation together with the payment and order rows.
+    """
+    inventory, payment_service, order_service = _LOCAL_SERVICES
+    with inventory._db_connection() as cnx:
+        cnx.start_transaction()
+        reservation = inventory.reserve_items({"items": items}, cnx=cnx)
+        if reservation["statusCode"] != 200:
+            cnx.rollback()
+            return _reservation_result(reservation)
+
+        shipping_confirmation_number = uuid4().hex[:10].upper()
+        payment_confirmation_number = payment_service._persist_payment_info(payment, cnx=cnx)
+        orders = _order_request(items, shipping, shipping_confirmation_number, payment_confirmation_number)
+        confirmation_number = order_service._save_order(orders["orders"], orders["items"], cnx=cnx,
+                                                         shipping=orders["shipping"])
+        cnx.commit()
+
+    return {"status": 200, "body": {"confirmation_number": confirmation_number}}
+
+
+def _reserve_checkout_in_process(order_token: str, items: list[dict], payment: dict, shipping: dict) -> dict:
+    """Reserve, record the checkout and persist its payment in one DB transaction.
+
+    The async counterpart of _checkout_in_process: the CHECKOUT row commits
+    already PAID, together with the reservation and the payment, or nothing
+    is written. Returns the same ``{"status", "body"}`` shape as
+    _reserve_items.
+    """
+    inventory, payment_service, _ = _LOCAL_SERVICES
+    with inventory._db_connection() as cnx:
+        cnx.start_transaction()
+        reservation = inventory.reserve_items({"items": items, "order_token": order_token}, cnx=cnx)
+        if reservation["statusCode"] != 200:
+            cnx.rollback()
+            return _reservation_result(reservation)
+
+        payment_confirmation_number = payment_service._persist_payment_info({**payment, "order_token": order_token},
+                                                                            cnx=cnx)
+        _CHECKOUT.advance(order_token, (_CHECKOUT.RESERVED,), _CHECKOUT.PAID, cnx=cnx,
+                          payment_confirmation_number=payment_confirmation_number, shipping=shipping)
+        cnx.commit()
+
+    return _reservation_result(reservation)
+
+
+def _submit_checkout(order_token: str, payment: dict, shipping: dict) -> dict:
+    """Finish the synchronous part of a reserved checkout and queue its order work.
+
+    Over HTTP the payment is persisted here and the checkout moved to PAID
+    (in-process, _reserve_checkout_in_process already did both). Only the
+    token is queued; the worker reads everything else from the CHECKOUT row.
+    If any step fails, the checkout is released before raising.
+    """
+    try:
+        if _LOCAL_SERVICES is None:
+            payment_confirmation_number = _persist_payment(payment, order_token)
+            if not _CHECKOUT.advance(order_token, (_CHECKOUT.RESERVED,), _CHECKOUT.PAID,
+                                     payment_confirmation_number=payment_confirmation_number, shipping=shipping):
+                raise RuntimeError(f"Checkout {order_token} is no longer reserved")
+        _CHECKOUT.queue().send({"order_token": order_token})
+    except Exception as exc:
+        _release_after_error(order_token, exc)
+        raise RuntimeError(f"Could not queue checkout: {exc}") from exc
+    return {"order_token": order_token, "status": _CHECKOUT.PAID}
+
+
+def _complete_in_process(order_token: str, orders: dict) -> None:
+    """Write the order, its outbox row and the COMPLETED status in one DB transaction."""
+    inventory, _, order_service = _LOCAL_SERVICES
+    with inventory._db_connection() as cnx:
+        cnx.start_transaction()
+        confirmation_number = order_service._save_order(orders["orders"], orders["items"], cnx=cnx,
+                                                         shipping=orders["shipping"])
+        _CHECKOUT.advance(order_token, (_CHECKOUT.PAID,), _CHECKOUT.COMPLETED, cnx=cnx,
+                          confirmation_number=confirmation_number)
+        cnx.commit()
+
+
+def _process_checkout(message: dict, final_attempt: bool) -> None:
+    """Write the order of one paid async checkout and mark it COMPLETED.
+
+    In-process, the order, its outbox row and the status change commit in
+    one transaction. Over HTTP the order service writes at most one order
+    per token, so a redelivery after a lost status update returns the same
+    order instead of a second one. A failure is re-raised for the queue to
+    redeliver, except on the final attempt, when the checkout is released
+    unless an order was written for it.
+    """
+    order_token = message["order_token"]
+    state = _CHECKOUT.get(order_token)
+    if state is None or state["status"] in (_CHECKOUT.COMPLETED, _CHECKOUT.FAILED):
+        return
+
+    try:
+        if state["status"] != _CHECKOUT.PAID:
+            raise RuntimeError(f"Checkout {order_token} is {state['status']}, not {_CHECKOUT.PAID}")
+        # Derived from the token so that every attempt builds the same order
+        shipping_confirmation_number = order_token[:10].upper()
+        orders = _order_request(state["items"], state["shipping"], shipping_confirmation_number,
+                                state["payment_confirmation_number"])
+        orders["orders"]["order_token"] = order_token
+        if _LOCAL_SERVICES is not None:
+            _complete_in_process(order_token, orders)
+        else:
+            confirmation_number = _persist_order(orders)
+            _CHECKOUT.advance(order_token, (_CHECKOUT.PAID,), _CHECKOUT.COMPLETED,
+                              confirmation_number=confirmation_number)
+    except Exception as exc:
+        if not final_attempt:
+            raise
+        _release_checkout(order_token, str(exc))
+
+
+def checkout_worker_handler(event: dict, context):
+    """Queue consumer for async checkouts; failed messages are reported for redelivery."""
+    failures = []
+    for record in event.get("Records", []):
+        attempt = int(record.get("attributes", {}).get("ApproximateReceiveCount", 1))
+        try:
+            _process_checkout(json.loads(record["body"]), attempt >= CHECKOUT_MAX_ATTEMPTS)
+        except Exception as exc:
+            print(f"Checkout message {record.get('messageId')} failed on attempt {attempt}: {exc}")
+            failures.append({"itemIdentifier": record["messageId"]})
+    print(f"Downstream latency: {_latency_stats()}")
+    return {"batchItemFailures": failures}
+
+
+def checkout_sweep_handler(event: dict, context):
+    """Scheduled release of checkouts left RESERVED or PAID for CHECKOUT_TIMEOUT seconds.
+
+    Catches the reservations nothing else releases: one committed by the
+    inventory service after its response was lost, or a container that died
+    between reserving and queueing. Checkouts with an order are skipped, and
+    release_checkout rechecks that under the row lock, so a worker finishing
+    the same checkout wins or loses cleanly.
+    """
+    if _CHECKOUT is None:
+        return {"released": 0}
+    released = 0
+    for order_token in _CHECKOUT.stale(CHECKOUT_TIMEOUT, CHECKOUT_SWEEP_BATCH_SIZE):
+        try:
+            if _release_checkout(order_token, f"Checkout timed out after {CHECKOUT_TIMEOUT:g} seconds"):
+                released += 1
+        except Exception as exc:
+            print(f"Releasing stale checkout {order_token} failed: {exc}")
+    print(f"Released {released} stale checkouts")
+    return {"released": released}
+
+
+def _checkout_status(event: dict) -> dict:
+    if _CHECKOUT is None:
+        return _response(404, {"error": "Not found"})
+    order_token = (event.get("pathParameters") or {}).get("token") \
+        or event["requestContext"]["http"].get("path", "").rstrip("/").rsplit("/", 1)[-1]
+    state = _CHECKOUT.get(order_token)
+    if state is None:
+        return _response(404, {"error": f"Order {order_token} not found"})
+    body = {"order_token": order_token, "status": state["status"]}
+    if state["confirmation_number"]:
+        body["confirmation_number"] = state["confirmation_number"]
+    if state["status"] == _CHECKOUT.FAILED:
+        body["error"] = state["error"]
+    return _response(200, body)
+
+
+def _request_fingerprint(body: object) -> str:
+    if not isinstance(body, str):
+        body = json.dumps(body, sort_keys=True)
+    return hashlib.sha256((body or "").encode()).hexdigest()
+
+
 def lambda_handler(event: dict, context):
-    if event["requestContext"]["http"]["method"] != "POST":
+    headers = {key.lower(): value for key, value in (event.get("headers") or {}).items()}
+    return api_response.compress(_handle(event), headers.get("accept-encoding"))
+
+
+def _handle(event: dict) -> dict:
+    method = event["requestContext"]["http"]["method"]
+    if method == "GET":
+        return _checkout_status(event)
+    if method != "POST":
         return _response(404, {"error": "Not found"})
 
+    headers = {key.lower(): value for key, value in (event.get("headers") or {}).items()}
+    idempotency_key = headers.get("idempotency-key")
+    if not idempotency_key:
+        return _submit_order(event)
+    if len(idempotency_key) > 255:
+        return _response(400, {"error": "Idempotency-Key must be at most 255 characters"})
+
+    replay = _IDEMPOTENCY.begin(idempotency_key, _request_fingerprint(event.get("body")))
+    if replay is not None:
+        print(f"Idempotent replays: {_IDEMPOTENCY.replays}")
+        return replay
+    response = None
+    try:
+        response = _submit_order(event)
+    finally:
+        _IDEMPOTENCY.finish(idempotency_key, response)
+    return response
+
+
+def _submit_order(event: dict) -> dict:
     body = _format_body(event.get("body", None))
     if not body:
         return _response(400, {"Invalid JSON format": f"{body}"})
@@ -148,13 +690,53 @@ def lambda_handler(event: dict, context):
     except ValueError as exc:
         return _response(400, {"error": str(exc)})
 
+    sold_out = _SOLD_OUT.insufficient(items)
+    if sold_out:
+        return _response(409, {"error": "Insufficient inventory", "items": sold_out})
+
+    if VERIFY_PRICES:
+        try:
+            changed = _price_mismatches(items)
+        except ValueError as exc:
+            return _response(400, {"error": str(exc)})
+        except RuntimeError as exc:
+            return _response(502, {"Inventory error": repr(exc)})
+        if changed:
+            return _response(409, {"error": "Prices changed", "items": changed})
+
+    order_token = uuid4().hex if _CHECKOUT is not None else None
     try:
-        reservation_result = _reserve_items(items)
+        if _CHECKOUT is not None and _LOCAL_SERVICES is not None:
+            reservation_result = _reserve_checkout_in_process(order_token, items, payment, shipping)
+        elif _CHECKOUT is not None:
+            reservation_result = _reserve_items(items, order_token)
+        elif _LOCAL_SERVICES is not None:
+            reservation_result = _checkout_in_process(items, payment, shipping)
+        else:
+            reservation_result = _reserve_items(items)
     except RuntimeError as exc:
+        if order_token is not None:
+            # The reservation and its CHECKOUT row may have committed even
+            # though the call failed, e.g. on a read timeout
+            _release_after_error(order_token, exc)
         return _response(502, {"Reservation error": repr(exc)})
 
     if reservation_result["status"] == 409:
+        _SOLD_OUT.remember(reservation_result["body"].get("items", []))
         return _response(409, reservation_result["body"])
+    _SOLD_OUT.forget([item["id"] for item in items])
 
-    confirmation_number = _save_order_to_database(items, payment, shipping)
+    if _CHECKOUT is not None:
+        try:
+            accepted = _submit_checkout(order_token, payment, shipping)
+        except RuntimeError as exc:
+            return _response(502, {"Checkout error": repr(exc)})
+        accepted["status_url"] = f"/order-processing/order/{accepted['order_token']}"
+        return _response(202, {**accepted, "items": items})
+
+    if _LOCAL_SERVICES is not None:
+        confirmation_number = reservation_result["body"]["confirmation_number"]
+    else:
+        confirmation_number = _save_order_to_database(items, payment, shipping)
+    print(f"Downstream latency: {_latency_stats()}")
     return _response(200,{"confirmation_number": confirmation_number, "items": items})
@@ -1,9 +1,8 @@
-import os
 import json
 from uuid import uuid4
 
-import mysql.connector
-from mysql.connector import errorcode
+import api_response
+import db
 
 
 HEADERS = {
@@ -14,14 +13,7 @@ HEADERS = {
 
 
 def _response(status: int, body: dict | list | None = None) -> dict:
-    response = {
-        "isBase64Encoded": False,
-        "statusCode": status,
-        "headers": HEADERS,
-    }
-    if body is not None:
-        response["body"] = json.dumps(body)
-    return response
+    return api_response.build(status, body, HEADERS)
 
 
 def _format_body(body: object) -> dict | None:
@@ -36,47 +28,125 @@ def _format_body(body: object) -> dict | None:
     return body
 
 
-def _connect_to_db():
-    try:
-        return mysql.connector.connect(
-            host=os.environ.get('DB_HOST'),
-            user=os.environ.get('DB_USER'),
-            password=os.environ.get('DB_PASSWORD'),
-            database=os.environ.get('DB_NAME'),
-        )
-    except mysql.connector.Error as err:
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-            print("Something is wrong with your user name or password")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
-            print("Database does not exist")
-        else:
-            print(err)
-        raise
+def _save_order(order: dict, items: dict, cnx=None, shipping: dict | None = None):
+    return _save_orders([(order, items, shipping)], cnx)[0]
+
 
+def _save_orders(orders: list[tuple[dict, list[dict], dict | None]], cnx=None) -> list[str]:
+    """Insert orders and their line items with one multi-row INSERT per table.
 
-def _save_order(order: dict, items: dict):
-    cnx = _connect_to_db()
+    Each entry is ``(order, items, shipping)``; a non-empty ``shipping``
+    message is queued in the OUTBOX table for outbox.py to publish, so the
+    shipping event exists if and only if the order does. Everything is
+    written in a single transaction with one commit, so a failure never
+    leaves a half-written order. With ``cnx`` the inserts join the caller's
+    open transaction and nothing is committed or closed here.
+
+    An order carrying an ``order_token`` (asynchronous checkout) is written
+    at most once per token: if one exists, its confirmation number is
+    returned and nothing is inserted for it.
+    """
+    owns_connection = cnx is None
+    if owns_connection:
+        cnx = db.connect()
     cursor = cnx.cursor()
-    insert_order = ("INSERT INTO ORDERS "
-                    "(CUSTOMER_NAME, ORDER_CONFIRMATION_NUMBER, SHIPPING_INFO_CONFIRMATION_NUMBER, PAYMENT_INFO_CONFIRMATION_NUMBER)"
-                    " VALUES (%s, %s, %s, %s)")
-    confirmation_number = uuid4().hex[:10].upper()
-    order_data = (order.get("name"), confirmation_number, order.get("shipping_info"), order.get("payment_info"))
-    cursor.execute(insert_order, order_data)
-    order_id = cursor.lastrowid
-    cnx.commit()
-
-    for item in items:
-        insert_item = ("INSERT INTO ORDER_LINE_ITEM (ORDER_ID, NAME, QUANTITY, PRICE) VALUES (%s, %s, %s, %s)")
-        item_data = (order_id, item.get("name"), item.get("quantity"), item.get("price"))
-        cursor.execute(insert_item, item_data)
-        cnx.commit()
-    cursor.close()
-    cnx.close()
-    return confirmation_number
+    try:
+        existing = _existing_orders(cursor, [order["order_token"] for order, _, _ in orders if order.get("order_token")])
+        confirmation_numbers = [existing.get(order.get("order_token")) or uuid4().hex[:10].upper()
+                                for order, _, _ in orders]
+        pending = [(entry, confirmation_number) for entry, confirmation_number in zip(orders, confirmation_numbers)
+                   if entry[0].get("order_token") not in existing]
+        if pending:
+            _insert_orders(cursor, pending)
+
+        if owns_connection:
+            cnx.commit()
+    except Exception:
+        if owns_connection:
+            cnx.rollback()
+        raise
+    finally:
+        cursor.close()
+        if owns_connection:
+            cnx.close()
+    return confirmation_numbers
+
+
+def _existing_orders(cursor, order_tokens: list[str]) -> dict[str, str]:
+    """``{order_token: confirmation_number}`` of the orders already written.
+
+    Locks the tokens' CHECKOUT rows first, as
+    inventory_management.release_checkout does, and refuses a token whose
+    checkout was released, so the tickets of an order are never returned.
+    """
+    if not order_tokens:
+        return {}
+    placeholders = ', '.join(['%s'] * len(order_tokens))
+    get_checkouts = ("SELECT ORDER_TOKEN, STATUS FROM CHECKOUT "
+                     f"WHERE ORDER_TOKEN IN ({placeholders}) "
+                     "ORDER BY ORDER_TOKEN "
+                     "FOR UPDATE")
+    cursor.execute(get_checkouts, tuple(order_tokens))
+    released = [order_token for order_token, status in cursor.fetchall() if status == "FAILED"]
+    if released:
+        raise ValueError(f"Checkout already released: {', '.join(released)}")
+
+    get_orders = ("SELECT ORDER_TOKEN, ORDER_CONFIRMATION_NUMBER FROM ORDERS "
+                  f"WHERE ORDER_TOKEN IN ({placeholders})")
+    cursor.execute(get_orders, tuple(order_tokens))
+    return dict(cursor.fetchall())
+
+
+def _insert_orders(cursor, orders: list[tuple[tuple[dict, list[dict], dict | None], str]]) -> None:
+    """Write ``((order, items, shipping), confirmation_number)`` entries with their line items and outbox rows."""
+    confirmation_numbers = [confirmation_number for _, confirmation_number in orders]
+    insert_orders = ("INSERT INTO ORDERS "
+                     "(CUSTOMER_NAME, ORDER_CONFIRMATION_NUMBER, SHIPPING_INFO_CONFIRMATION_NUMBER, PAYMENT_INFO_CONFIRMATION_NUMBER, ORDER_TOKEN)"
+                     f" VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(orders))}")
+    order_data = tuple(
+        value
+        for (order, _, _), confirmation_number in orders
+        for value in (order.get("name"), confirmation_number, order.get("shipping_info"), order.get("payment_info"),
+                      order.get("order_token"))
+    )
+    cursor.execute(insert_orders, order_data)
+    order_ids = _inserted_order_ids(cursor, confirmation_numbers)
+
+    item_data = tuple(
+        value
+        for order_id, ((_, items, _), _) in zip(order_ids, orders)
+        for item in items or []
+        for value in (order_id, item.get("name"), item.get("quantity"), item.get("price"))
+    )
+    if item_data:
+        insert_items = ("INSERT INTO ORDER_LINE_ITEM (ORDER_ID, NAME, QUANTITY, PRICE) "
+                        f"VALUES {', '.join(['(%s, %s, %s, %s)'] * (len(item_data) // 4))}")
+        cursor.execute(insert_items, item_data)
+
+    events = [json.dumps(shipping) for (_, _, shipping), _ in orders if shipping]
+    if events:
+        insert_events = ("INSERT INTO OUTBOX (TOPIC, PAYLOAD) "
+                         f"VALUES {', '.join(['(%s, %s)'] * len(events))}")
+        cursor.execute(insert_events, tuple(value for event in events for value in ("shipping", event)))
+
+
+def _inserted_order_ids(cursor, confirmation_numbers: list[str]) -> list[int]:
+    if len(confirmation_numbers) == 1:
+        return [cursor.lastrowid]
+    # Look the ids up rather than assuming the batch got consecutive values
+    get_ids = ("SELECT ORDER_ID, ORDER_CONFIRMATION_NUMBER FROM ORDERS "
+               f"WHERE ORDER_CONFIRMATION_NUMBER IN ({', '.join(['%s'] * len(confirmation_numbers))})")
+    cursor.execute(get_ids, tuple(confirmation_numbers))
+    ids = {confirmation_number: order_id for order_id, confirmation_number in cursor.fetchall()}
+    return [ids[confirmation_number] for confirmation_number in confirmation_numbers]
 
 
 def lambda_handler(event, context):
+    headers = {key.lower(): value for key, value in (event.get("headers") or {}).items()}
+    return api_response.compress(_handle(event), headers.get("accept-encoding"))
+
+
+def _handle(event: dict) -> dict:
     if event["requestContext"]["http"]["method"] != "POST":
         return _response(404, {"error": "Not found"})
 
@@ -84,8 +154,19 @@ def lambda_handler(event, context):
     if not body:
         return _response(400, {"Invalid JSON format": f"{body}"})
 
+    batch = body.get("batch")
+    if batch is not None:
+        if not isinstance(batch, list) or not batch:
+            return _response(400, {"error": "batch must be a non-empty list of orders"})
+        try:
+            confirmation_numbers = _save_orders(
+                [(entry.get("orders"), entry.get("items"), entry.get("shipping")) for entry in batch])
+        except Exception as e:
+            return _response(500, {"error": f"{str(e)}"})
+        return _response(200, {"confirmation_numbers": confirmation_numbers})
+
     try:
-        confirmation_number = _save_order(body.get("orders"), body.get("items"))
+        confirmation_number = _save_order(body.get("orders"), body.get("items"), shipping=body.get("shipping"))
     except Exception as e:
         return _response(500, {"error": f"{str(e)}"})
 
@@ -0,0 +1,176 @@
+"""Publishes events queued in the OUTBOX table.
+
+The order service writes each shipping message to OUTBOX in the same
+transaction as the order, so checkout never waits on SNS. This module drains
+unpublished rows in batches, either as a scheduled Lambda or locally:
+
+    python outbox.py            # publish to SNS
+    python outbox.py --local    # deliver straight to shipping.lambda_handler
+
+Delivery is at-least-once: a crash between publishing and stamping
+PUBLISHED_AT republishes that batch.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from collections import defaultdict
+
+import db
+
+
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_MAX_BATCHES = int(os.environ.get('OUTBOX_MAX_BATCHES', '20'))
+# Rows that failed this many times are left for manual inspection
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '10'))
+# "sns" or "local"
+OUTBOX_PUBLISHER = os.environ.get('OUTBOX_PUBLISHER', 'sns')
+# Outbox topic -> SNS topic ARN
+TOPIC_ARNS = {
+    "shipping": os.environ.get('SHIPPING_TOPIC_ARN'),
+}
+SNS_BATCH_LIMIT = 10
+
+
+class SnsPublisher:
+    """Publishes with SNS PublishBatch, up to ten messages per call."""
+
+    def __init__(self, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('sns')
+        self._client = client
+
+    def publish(self, topic: str, messages: list[tuple[str, str]]) -> set[str]:
+        """Publish ``(message_id, payload)`` pairs; return the ids SNS accepted."""
+        published = set()
+        for start in range(0, len(messages), SNS_BATCH_LIMIT):
+            chunk = messages[start:start + SNS_BATCH_LIMIT]
+            response = self._client.publish_batch(
+                TopicArn=TOPIC_ARNS[topic],
+                PublishBatchRequestEntries=[{"Id": message_id, "Message": payload} for message_id, payload in chunk],
+            )
+            published.update(entry["Id"] for entry in response.get("Successful", []))
+            for failure in response.get("Failed", []):
+                print(f"SNS rejected outbox message {failure.get('Id')}: {failure.get('Message')}")
+        return published
+
+
+class LocalPublisher:
+    """Stand-in for SNS in local runs and tests.
+
+    Records every published message and, for topics with a consumer, invokes
+    it with an SNS-shaped event, e.g. ``{"shipping": shipping.lambda_handler}``.
+    """
+
+    def __init__(self, consumers: dict | None = None):
+        self.published: list[tuple[str, str]] = []  # (topic, payload)
+        self._consumers = consumers or {}
+
+    def publish(self, topic: str, messages: list[tuple[str, str]]) -> set[str]:
+        consumer = self._consumers.get(topic)
+        if consumer is not None:
+            records = [{"Sns": {"MessageId": message_id, "Message": payload}} for message_id, payload in messages]
+            consumer({"Records": records}, None)
+        self.published.extend((topic, payload) for _, payload in messages)
+        return {message_id for message_id, _ in messages}
+
+
+_PUBLISHER = None
+
+
+def _default_publisher():
+    # Created once per container so the SNS client is reused across invocations
+    global _PUBLISHER
+    if _PUBLISHER is None:
+        _PUBLISHER = LocalPublisher() if OUTBOX_PUBLISHER == 'local' else SnsPublisher()
+    return _PUBLISHER
+
+
+def drain(publisher=None, batch_size: int = OUTBOX_BATCH_SIZE, cnx=None) -> dict:
+    """Publish one batch of unpublished events and stamp them as published.
+
+    Rows are claimed with ``FOR UPDATE SKIP LOCKED`` so concurrent drainers
+    never publish the same batch. Failed rows have ATTEMPTS incremented and
+    are picked up again by a later drain.
+    """
+    publisher = publisher or _default_publisher()
+    owns_connection = cnx is None
+    if owns_connection:
+        cnx = db.connect()
+    cursor = cnx.cursor(dictionary=True)
+    try:
+        cnx.start_transaction()
+        claim_events = ("SELECT OUTBOX_ID, TOPIC, PAYLOAD "
+                        "FROM OUTBOX "
+                        "WHERE PUBLISHED_AT IS NULL AND ATTEMPTS < %s "
+                        "ORDER BY OUTBOX_ID "
+                        "LIMIT %s "
+                        "FOR UPDATE SKIP LOCKED")
+        cursor.execute(claim_events, (OUTBOX_MAX_ATTEMPTS, batch_size))
+        rows = cursor.fetchall()
+
+        by_topic: dict[str, list[tuple[str, str]]] = defaultdict(list)
+        for row in rows:
+            by_topic[row["TOPIC"]].append((str(row["OUTBOX_ID"]), row["PAYLOAD"]))
+
+        published: set[int] = set()
+        for topic, messages in by_topic.items():
+            try:
+                published.update(int(message_id) for message_id in publisher.publish(topic, messages))
+            except Exception as e:
+                print(f"Publishing {len(messages)} {topic} events failed: {e}")
+        failed = [row["OUTBOX_ID"] for row in rows if row["OUTBOX_ID"] not in published]
+
+        if published:
+            mark_published = ("UPDATE OUTBOX SET PUBLISHED_AT = CURRENT_TIMESTAMP "
+                              f"WHERE OUTBOX_ID IN ({', '.join(['%s'] * len(published))})")
+            cursor.execute(mark_published, tuple(published))
+        if failed:
+            mark_failed = ("UPDATE OUTBOX SET ATTEMPTS = ATTEMPTS + 1 "
+                           f"WHERE OUTBOX_ID IN ({', '.join(['%s'] * len(failed))})")
+            cursor.execute(mark_failed, tuple(failed))
+        cnx.commit()
+    except Exception:
+        cnx.rollback()
+        raise
+    finally:
+        cursor.close()
+        if owns_connection:
+            cnx.close()
+    return {"published": len(published), "failed": len(failed)}
+
+
+def drain_all(publisher=None, batch_size: int = OUTBOX_BATCH_SIZE, max_batches: int = OUTBOX_MAX_BATCHES) -> dict:
+    """Drain batches on one connection until the outbox is empty or max_batches is hit."""
+    totals = {"published": 0, "failed": 0}
+    cnx = db.connect()
+    try:
+        for _ in range(max_batches):
+            result = drain(publisher, batch_size, cnx)
+            totals["published"] += result["published"]
+            totals["failed"] += result["failed"]
+            if result["published"] + result["failed"] < batch_size:
+                break
+    finally:
+        cnx.close()
+    return totals
+
+
+def lambda_handler(event: dict, context):
+    result = drain_all()
+    print(json.dumps(result))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish pending OUTBOX events")
+    parser.add_argument("--local", action="store_true",
+                        help="deliver shipping events to shipping.lambda_handler instead of SNS")
+    args = parser.parse_args()
+    if args.local:
+        import shipping
+        print(json.dumps(drain_all(LocalPublisher({"shipping": shipping.lambda_handler}))))
+    else:
+        print(json.dumps(drain_all()))
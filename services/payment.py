@@ -7,6 +7,9 @@ from uuid import uuid4
 import mysql.connector
 from mysql.connector import errorcode
 
+import api_response
+import db
+
 
 ROOT_URL = os.environ.get('ROOT_URL')
 HEADERS = {
@@ -17,14 +20,7 @@ HEADERS = {
 
 
 def _response(status: int, body: dict | list | None = None) -> dict:
-    response = {
-        "isBase64Encoded": False,
-        "statusCode": status,
-        "headers": HEADERS,
-    }
-    if body is not None:
-        response["body"] = json.dumps(body)
-    return response
+    return api_response.build(status, body, HEADERS)
 
 
 def _format_body(body: dict | str | None) -> dict | None:
@@ -39,37 +35,57 @@ def _format_body(body: dict | str | None) -> dict | None:
     return body
 
 
-def _connect_to_db():
-    try:
-        return mysql.connector.connect(
-            host=os.environ.get('DB_HOST'),
-            user=os.environ.get('DB_USER'),
-            password=os.environ.get('DB_PASSWORD'),
-            database=os.environ.get('DB_NAME'),
-        )
-    except mysql.connector.Error as err:
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-            print("Something is wrong with your user name or password")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
-            print("Database does not exist")
-        else:
-            print(err)
-        raise
-
-
-def _execute_query(query: str, data: tuple | None = None):
-    cnx = _connect_to_db()
+def _execute_query(query: str, data: tuple | None = None, cnx=None):
+    """Run a write and commit it, or leave it to the caller's transaction on ``cnx``."""
+    if cnx is not None:
+        cursor = cnx.cursor()
+        cursor.execute(query, data)
+        cursor.close()
+        return
+
+    cnx = db.connect()
     cursor = cnx.cursor()
     cursor.execute(query, data)
     cnx.commit()
     cursor.close()
     cnx.close()
 
-def _persist_payment_info(body: dict):
+def _fetch_one(query: str, data: tuple, cnx=None):
+    owns_connection = cnx is None
+    if owns_connection:
+        cnx = db.connect()
+    cursor = cnx.cursor()
+    try:
+        cursor.execute(query, data)
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        if owns_connection:
+            cnx.close()
+
+
+def _payment_for_token(order_token: str, cnx=None) -> str | None:
+    get_payment = "SELECT PAYMENT_INFO_CONFIRMATION_NUMBER FROM PAYMENT_INFO WHERE ORDER_TOKEN = %s"
+    row = _fetch_one(get_payment, (order_token,), cnx)
+    return row[0] if row else None
+
+
+def _persist_payment_info(body: dict, cnx=None):
+    """Store the payment and return its confirmation number.
+
+    A body with an ``order_token`` (asynchronous checkout) is stored at most
+    once per token; repeating the call returns the stored row's number.
+    """
+    order_token = body.get("order_token")
+    if order_token:
+        existing = _payment_for_token(order_token, cnx)
+        if existing:
+            return existing
+
     insert_query = (
         "INSERT INTO PAYMENT_INFO "
-        "(payment_info_confirmation_number, holder_name, card_num, exp_date, cvv) "
-        "VALUES (%s, %s, %s, %s, %s)"
+        "(payment_info_confirmation_number, holder_name, card_num, exp_date, cvv, order_token) "
+        "VALUES (%s, %s, %s, %s, %s, %s)"
     )
     confirmation_number = uuid4().hex[:10].upper()
     insert_data = (
@@ -78,12 +94,24 @@ def _persist_payment_info(body: dict):
         body["credit_card_number"],
         body["expir_date"],
         body["cvvCode"],
+        order_token or None,
     )
-    _execute_query(insert_query, insert_data)
+    try:
+        _execute_query(insert_query, insert_data, cnx)
+    except mysql.connector.IntegrityError as err:
+        # A concurrent call stored the same token first
+        if not order_token or err.errno != errorcode.ER_DUP_ENTRY:
+            raise
+        return _payment_for_token(order_token, cnx)
     return confirmation_number
 
 
 def lambda_handler(event: dict, context):
+    headers = {key.lower(): value for key, value in (event.get("headers") or {}).items()}
+    return api_response.compress(_handle(event), headers.get("accept-encoding"))
+
+
+def _handle(event: dict) -> dict:
     if event["requestContext"]["http"]["method"] != "POST":
         return _response(404, {"error": "Not found"})
 
@@ -0,0 +1,26 @@
+"""Regenerate the materialized item documents in VacationDocument.
+
+Usage:
+    python rebuild_documents.py [--batch-size N]
+
+Run after deploying the VacationDocument table or changing the document
+format. Reads rebuild missing documents on their own, so this is only
+needed to avoid the slower first reads. Uses the same DB_* environment
+variables as the inventory service.
+"""
+from __future__ import annotations
+
+import argparse
+
+import inventory_management
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=200, help="vacations assembled per round trip")
+    args = parser.parse_args(argv)
+    print(f"Rebuilt {inventory_management.rebuild_documents(args.batch_size)} item documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,17 @@ from __future__ import annotations
 
 import json
 import os
+from collections import defaultdict, deque
 from uuid import uuid4
 
-import mysql.connector
-from mysql.connector import errorcode
+import api_response
+import db
 
 
 ROOT_URL = os.environ.get('ROOT_URL')
+# Messages that can never be persisted (bad JSON, missing fields) are sent to
+# this SQS queue if it is set and only logged otherwise; they are not retried
+SHIPPING_DEAD_LETTER_QUEUE_URL = os.environ.get('SHIPPING_DEAD_LETTER_QUEUE_URL')
 HEADERS = {
     "Content-Type": "application/json",
     "Access-Control-Allow-Headers": "Content-Type",
@@ -17,14 +21,7 @@ HEADERS = {
 
 
 def _response(status: int, body: dict | list | None = None) -> dict:
-    response = {
-        "isBase64Encoded": False,
-        "statusCode": status,
-        "headers": HEADERS,
-    }
-    if body is not None:
-        response["body"] = json.dumps(body)
-    return response
+    return api_response.build(status, body, HEADERS)
 
 
 def _format_body(body: dict | str | None) -> dict | None:
@@ -39,77 +36,196 @@ def _format_body(body: dict | str | None) -> dict | None:
     return body
 
 
-def _connect_to_db():
-    try:
-        return mysql.connector.connect(
-            host=os.environ.get('DB_HOST'),
-            user=os.environ.get('DB_USER'),
-            password=os.environ.get('DB_PASSWORD'),
-            database=os.environ.get('DB_NAME'),
-        )
-    except mysql.connector.Error as err:
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-            print("Something is wrong with your user name or password")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
-            print("Database does not exist")
-        else:
-            print(err)
-        raise
-
-
-def _execute_query(query: str, data: tuple | None = None):
-    cnx = _connect_to_db()
-    cursor = cnx.cursor()
-    cursor.execute(query, data)
-    id = cursor.lastrowid
-    cnx.commit()
-    cursor.close()
-    cnx.close()
-    return id
-
-def _persist_shipping_info(body: dict):
-    insert_query = (
-        "INSERT INTO ADDRESS "
-        "(NAME, ADDRESS1, ADDRESS2, CITY, STATE, POSTAL_CODE) "
-        "VALUES (%s, %s, %s, %s, %s, %s)"
-    )
-    insert_data = (
+def _address_row(body: dict) -> tuple:
+    return (
         body["name"],
         body["addressLine1"],
         body["addressLine2"],
         body["city"],
         body["state"],
         body["zip"],
+        str(body["confirmation_number"]),
     )
-    address_id = _execute_query(insert_query, insert_data)
 
-    insert_shipping_query = (
-        "INSERT INTO SHIPPING_INFO "
-        "(SHIPPING_INFO_CONFIRMATION_NUMBER, BUSINESS_ID, ADDRESS_ID, NUM_PACKETS, WEIGHT) "
-        "VALUES (%s, %s, %s, %s, %s)"
-    )
-    insert_shipping_data = (
+
+def _shipping_row(body: dict, address_id: int) -> tuple:
+    return (
         body['confirmation_number'],
         body["business_id"],
         address_id,
         body["num_packets"],
         body['weight']
     )
-    _execute_query(insert_shipping_query, insert_shipping_data)
 
 
+def _persist_shipping_info(body: dict):
+    _persist_shipping_batch([body])
 
-def lambda_handler(event: dict, context):
-    for record in event['Records']:
-        message = record['Sns']['Message']
-        body = _format_body(message)
-        if not body:
-            return _response(400, {"Invalid JSON format": f"{body}"})
 
+def _persist_shipping_batch(bodies: list[dict], cnx=None):
+    """Insert the ADDRESS and SHIPPING_INFO rows of every message in one transaction.
+
+    Each table gets a single multi-row INSERT. Address rows carry their
+    shipping confirmation number, which is how their ids are read back
+    (see _inserted_address_ids).
+    """
+    address_rows = [_address_row(body) for body in bodies]
+
+    owns_connection = cnx is None
+    if owns_connection:
+        cnx = db.connect()
+    cursor = cnx.cursor()
+    try:
+        insert_query = (
+            "INSERT INTO ADDRESS "
+            "(NAME, ADDRESS1, ADDRESS2, CITY, STATE, POSTAL_CODE, SHIPPING_INFO_CONFIRMATION_NUMBER) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(address_rows))}"
+        )
+        cursor.execute(insert_query, tuple(value for row in address_rows for value in row))
+        address_ids = _inserted_address_ids(cursor, [row[-1] for row in address_rows])
+
+        shipping_rows = [_shipping_row(body, address_id) for body, address_id in zip(bodies, address_ids)]
+        insert_shipping_query = (
+            "INSERT INTO SHIPPING_INFO "
+            "(SHIPPING_INFO_CONFIRMATION_NUMBER, BUSINESS_ID, ADDRESS_ID, NUM_PACKETS, WEIGHT) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(shipping_rows))}"
+        )
+        cursor.execute(insert_shipping_query, tuple(value for row in shipping_rows for value in row))
+        if owns_connection:
+            cnx.commit()
+    except Exception:
+        if owns_connection:
+            cnx.rollback()
+        raise
+    finally:
+        cursor.close()
+        if owns_connection:
+            cnx.close()
+
+
+def _inserted_address_ids(cursor, confirmation_numbers: list[str]) -> list[int]:
+    if len(confirmation_numbers) == 1:
+        return [cursor.lastrowid]
+    # Look the ids up rather than assuming the batch got consecutive values.
+    # LAST_INSERT_ID() is the batch's first id, which excludes the rows of an
+    # earlier delivery of the same message; a number repeated within the
+    # batch takes its ids in insert order.
+    get_ids = ("SELECT ADDRESS_ID, SHIPPING_INFO_CONFIRMATION_NUMBER FROM ADDRESS "
+               f"WHERE SHIPPING_INFO_CONFIRMATION_NUMBER IN ({', '.join(['%s'] * len(confirmation_numbers))}) "
+               "AND ADDRESS_ID >= %s "
+               "ORDER BY ADDRESS_ID")
+    cursor.execute(get_ids, (*confirmation_numbers, cursor.lastrowid))
+    ids = defaultdict(deque)
+    for address_id, confirmation_number in cursor.fetchall():
+        ids[confirmation_number].append(address_id)
+    return [ids[confirmation_number].popleft() for confirmation_number in confirmation_numbers]
+
+
+def _parse_record(record: dict) -> tuple[str | None, dict | None]:
+    """Return ``(message_id, shipping_body)`` for an SNS or SQS-wrapped SNS record."""
+    if "Sns" in record:
+        return record["Sns"].get("MessageId"), _format_body(record["Sns"].get("Message"))
+
+    message = record.get("body")
+    envelope = _format_body(message)
+    if envelope and "TopicArn" in envelope and "Message" in envelope:
+        message = envelope["Message"]
+    return record.get("messageId"), _format_body(message)
+
+
+_SQS = None
+
+
+def _dead_letter(record: dict, error: Exception) -> bool:
+    """Park a record that failed validation on the dead-letter queue; False if sending failed."""
+    if not SHIPPING_DEAD_LETTER_QUEUE_URL:
+        return True
+    global _SQS
+    try:
+        if _SQS is None:
+            import boto3
+            _SQS = boto3.client('sqs')
+        _SQS.send_message(
+            QueueUrl=SHIPPING_DEAD_LETTER_QUEUE_URL,
+            MessageBody=json.dumps(record),
+            MessageAttributes={"error": {"DataType": "String", "StringValue": repr(error)}},
+        )
+        return True
+    except Exception as e:
+        print(f"Could not dead-letter shipping message: {e}")
+        return False
+
+
+def _persist_batch_isolating_failures(cnx, valid: list[tuple[str | None, dict]]) -> list[str | None]:
+    """Persist ``(message_id, body)`` pairs; return the ids that could not be saved.
+
+    The whole batch is tried in one transaction first. If that fails, each
+    message is retried in its own transaction so one bad row does not fail
+    the rest.
+    """
+    try:
+        _persist_shipping_batch([body for _, body in valid], cnx)
+        cnx.commit()
+        return []
+    except Exception as e:
+        cnx.rollback()
+        if len(valid) == 1:
+            print(e)
+            return [valid[0][0]]
+        print(f"Batch insert failed, retrying messages one at a time: {e}")
+
+    failed = []
+    for message_id, body in valid:
         try:
-            _persist_shipping_info(body)
+            _persist_shipping_batch([body], cnx)
+            cnx.commit()
         except Exception as e:
+            cnx.rollback()
             print(e)
-            return _response(500, {"error": "Internal server error"})
+            failed.append(message_id)
+    return failed
+
 
-        print(_response(200, {}))
+def lambda_handler(event: dict, context):
+    """Persist a batch of shipping messages and report the ones that failed.
+
+    All valid messages share one connection and transaction. The result
+    uses the ``batchItemFailures`` shape so an SQS event source redelivers
+    only the messages that failed to persist. Messages that fail validation
+    would fail on every delivery, so they are dropped (and dead-lettered if
+    SHIPPING_DEAD_LETTER_QUEUE_URL is set) instead. A direct SNS invocation
+    has no partial-batch support, so a persistence failure is raised to
+    trigger its retry.
+    """
+    not_dead_lettered: list[str | None] = []
+    rejected = 0
+    valid: list[tuple[str | None, dict]] = []
+    for record in event['Records']:
+        message_id, body = _parse_record(record)
+        try:
+            if not body:
+                raise ValueError(f"Invalid JSON format: {body}")
+            _address_row(body)
+            _shipping_row(body, 0)
+        except (KeyError, ValueError) as e:
+            print(f"Dropping invalid shipping message {message_id}: {e!r}")
+            rejected += 1
+            if not _dead_letter(record, e):
+                not_dead_lettered.append(message_id)
+        else:
+            valid.append((message_id, body))
+
+    not_saved: list[str | None] = []
+    if valid:
+        cnx = db.connect()
+        try:
+            not_saved = _persist_batch_isolating_failures(cnx, valid)
+        finally:
+            cnx.close()
+
+    # A rejected message is only redelivered if it could not be dead-lettered
+    failed = not_dead_lettered + not_saved
+    print(_response(200, {"persisted": len(valid) - len(not_saved), "failed": len(not_saved), "rejected": rejected}))
+    if failed and any("Sns" in record for record in event['Records']):
+        raise RuntimeError(f"Failed to persist shipping messages: {failed}")
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed]}
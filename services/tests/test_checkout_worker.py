@@ -0,0 +1,230 @@
+"""Redelivery and compensation of asynchronous checkouts.
+
+Drives order-processing's checkout_worker_handler through checkout.LocalQueue,
+with the CHECKOUT table, the order service and inventory's release_checkout
+replaced by in-memory stand-ins that keep their token semantics.
+
+    cd services
+    python -m unittest discover tests
+"""
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+import unittest
+from unittest import mock
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICES_DIR)
+
+import checkout  # noqa: E402
+
+
+def _load_order_processing():
+    environment = {"SERVICE_MODE": "http", "CHECKOUT_MODE": "async", "CHECKOUT_QUEUE": "local",
+                   "CHECKOUT_MAX_ATTEMPTS": "3", "ROOT_URL": "http://localhost"}
+    with mock.patch.dict(os.environ, environment):
+        spec = importlib.util.spec_from_file_location("order_processing", os.path.join(SERVICES_DIR, "order-processing.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+order_processing = _load_order_processing()
+
+TOKEN = "0123456789abcdef0123456789abcdef"
+ITEMS = [{"id": 1, "name": "Alpine Getaway", "quantity": 2, "price": 100.0}]
+# Inventory's current prices for ITEMS, as _fetch_items returns them
+CURRENT = {1: {"id": 1, "price": 100.0, "availableTickets": 10}}
+
+
+class _Checkouts:
+    """CHECKOUT table stand-in with checkout's states and a LocalQueue."""
+
+    RESERVED, PAID, COMPLETED, FAILED = checkout.RESERVED, checkout.PAID, checkout.COMPLETED, checkout.FAILED
+
+    def __init__(self):
+        self.rows: dict[str, dict] = {}
+        self.lost_completions = 0  # COMPLETED updates to fail, as if the connection dropped
+        self.stale_tokens: list[str] = []  # what stale() reports, regardless of age
+        self._queue = checkout.LocalQueue()
+
+    def queue(self) -> checkout.LocalQueue:
+        return self._queue
+
+    def get(self, order_token: str) -> dict | None:
+        row = self.rows.get(order_token)
+        return None if row is None else {"order_token": order_token, **row}
+
+    def advance(self, order_token, from_statuses, to_status, cnx=None, **fields) -> bool:
+        if to_status == self.COMPLETED and self.lost_completions:
+            self.lost_completions -= 1
+            raise RuntimeError("Lost connection during the status update")
+        row = self.rows.get(order_token)
+        if row is None or row["status"] not in from_statuses:
+            return False
+        row.update(fields, status=to_status)
+        return True
+
+    def stale(self, older_than: float, limit: int) -> list[str]:
+        return self.stale_tokens[:limit]
+
+
+class _Orders:
+    """Order service stand-in: at most one order per token, like order._save_orders."""
+
+    def __init__(self):
+        self.by_token: dict[str, str] = {}
+        self.failures = 0
+
+    def persist(self, orders: dict) -> str:
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Error saving order data")
+        order_token = orders["orders"]["order_token"]
+        return self.by_token.setdefault(order_token, f"ORDER{len(self.by_token) + 1}")
+
+
+class _Inventory:
+    """release_checkout stand-in with the real preconditions."""
+
+    def __init__(self, checkouts: _Checkouts, orders: _Orders, stock: int):
+        self.checkouts = checkouts
+        self.orders = orders
+        self.stock = stock
+
+    def release_checkout(self, order_token: str, error: str) -> bool:
+        row = self.checkouts.rows.get(order_token)
+        if row is None or row["status"] not in (checkout.RESERVED, checkout.PAID) or order_token in self.orders.by_token:
+            return False
+        self.stock += sum(item["quantity"] for item in row["items"])
+        row.update(status=checkout.FAILED, error=error)
+        return True
+
+
+class CheckoutWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.checkouts = _Checkouts()
+        self.orders = _Orders()
+        # Two tickets are held by the checkout below
+        self.inventory = _Inventory(self.checkouts, self.orders, stock=8)
+        self.checkouts.rows[TOKEN] = {
+            "status": checkout.PAID, "items": ITEMS, "shipping": {"name": "Ada Lovelace"},
+            "payment_confirmation_number": "PAY1", "confirmation_number": None, "error": None,
+        }
+        for name, value in (("_CHECKOUT", self.checkouts), ("_CHECKOUT_INVENTORY", self.inventory),
+                            ("_persist_order", self.orders.persist)):
+            patcher = mock.patch.object(order_processing, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def drain(self) -> int:
+        with mock.patch("builtins.print"):
+            return self.checkouts.queue().drain(order_processing.checkout_worker_handler)
+
+    def test_completes_paid_checkout(self):
+        self.checkouts.queue().send({"order_token": TOKEN})
+
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(self.checkouts.rows[TOKEN]["status"], checkout.COMPLETED)
+        self.assertEqual(self.checkouts.rows[TOKEN]["confirmation_number"], "ORDER1")
+
+    def test_duplicate_delivery_writes_one_order(self):
+        self.checkouts.queue().send({"order_token": TOKEN})
+        self.checkouts.queue().send({"order_token": TOKEN})
+
+        self.drain()
+        self.assertEqual(self.orders.by_token, {TOKEN: "ORDER1"})
+        self.assertEqual(self.inventory.stock, 8)
+
+    def test_redelivery_after_lost_status_update_reuses_the_order(self):
+        self.checkouts.lost_completions = 1
+        self.checkouts.queue().send({"order_token": TOKEN})
+
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(self.orders.by_token, {TOKEN: "ORDER1"})
+        self.assertEqual(self.checkouts.rows[TOKEN]["status"], checkout.COMPLETED)
+        self.assertEqual(self.checkouts.rows[TOKEN]["confirmation_number"], "ORDER1")
+
+    def test_final_attempt_releases_checkout_without_order(self):
+        self.orders.failures = 3
+        self.checkouts.queue().send({"order_token": TOKEN})
+
+        self.drain()
+        self.assertEqual(self.checkouts.rows[TOKEN]["status"], checkout.FAILED)
+        self.assertEqual(self.checkouts.rows[TOKEN]["error"], "Error saving order data")
+        self.assertEqual(self.inventory.stock, 10)
+        self.assertEqual(len(self.checkouts.queue()), 0)
+
+    def test_final_attempt_keeps_tickets_once_order_exists(self):
+        self.checkouts.lost_completions = 3
+        self.checkouts.queue().send({"order_token": TOKEN})
+
+        self.drain()
+        self.assertEqual(self.orders.by_token, {TOKEN: "ORDER1"})
+        self.assertEqual(self.checkouts.rows[TOKEN]["status"], checkout.PAID)
+        self.assertEqual(self.inventory.stock, 8)
+
+    def test_earlier_attempts_are_redelivered_without_releasing(self):
+        self.orders.failures = 2
+        self.checkouts.queue().send({"order_token": TOKEN})
+
+        self.drain()
+        self.assertEqual(self.checkouts.rows[TOKEN]["status"], checkout.COMPLETED)
+        self.assertEqual(self.inventory.stock, 8)
+
+    def test_queued_message_carries_only_the_token(self):
+        self.checkouts.rows[TOKEN].update(status=checkout.RESERVED, payment_confirmation_number=None, shipping=None)
+        payment = {"card_holder_name": "Ada Lovelace", "credit_card_number": "4111111111111111",
+                   "expir_date": "12/30", "cvvCode": "123"}
+        with mock.patch.object(order_processing, "_persist_payment", return_value="PAY2") as persist_payment:
+            accepted = order_processing._submit_checkout(TOKEN, payment, {"name": "Ada Lovelace"})
+
+        persist_payment.assert_called_once_with(payment, TOKEN)
+        self.assertEqual(accepted["status"], checkout.PAID)
+        self.assertEqual(self.checkouts.rows[TOKEN]["payment_confirmation_number"], "PAY2")
+        self.assertEqual([record["body"] for record in self.checkouts.queue()._messages],
+                         ['{"order_token": "0123456789abcdef0123456789abcdef"}'])
+
+    def test_reservation_error_releases_a_committed_reservation(self):
+        def reserve_then_time_out(items, order_token=None):
+            # The inventory service committed; only its response was lost
+            self.inventory.stock -= 2
+            self.checkouts.rows[order_token] = {"status": checkout.RESERVED, "items": ITEMS, "error": None}
+            raise RuntimeError("Inventory service timed out")
+
+        body = {"items": ITEMS, "payment": {"card_holder_name": "Ada Lovelace"}, "shipping": {"name": "Ada Lovelace"}}
+        with mock.patch.object(order_processing, "_fetch_items", return_value=CURRENT), \
+                mock.patch.object(order_processing, "_reserve_items", side_effect=reserve_then_time_out), \
+                mock.patch("builtins.print"):
+            response = order_processing._submit_order({"body": body})
+
+        self.assertEqual(response["statusCode"], 502)
+        order_token = next(token for token in self.checkouts.rows if token != TOKEN)
+        self.assertEqual(self.checkouts.rows[order_token]["status"], checkout.FAILED)
+        self.assertEqual(self.inventory.stock, 8)
+
+    def test_changed_prices_are_rejected_before_reserving(self):
+        body = {"items": ITEMS, "payment": {"card_holder_name": "Ada Lovelace"}, "shipping": {"name": "Ada Lovelace"}}
+        repriced = {1: {**CURRENT[1], "price": 120.0}}
+        with mock.patch.object(order_processing, "_fetch_items", return_value=repriced), \
+                mock.patch.object(order_processing, "_reserve_items") as reserve_items:
+            response = order_processing._submit_order({"body": body})
+
+        self.assertEqual(response["statusCode"], 409)
+        self.assertIn("Prices changed", response["body"])
+        reserve_items.assert_not_called()
+
+    def test_sweep_releases_stale_checkouts_only_once(self):
+        self.checkouts.stale_tokens = [TOKEN]
+
+        with mock.patch("builtins.print"):
+            self.assertEqual(order_processing.checkout_sweep_handler({}, None), {"released": 1})
+            self.assertEqual(order_processing.checkout_sweep_handler({}, None), {"released": 0})
+        self.assertEqual(self.checkouts.rows[TOKEN]["status"], checkout.FAILED)
+        self.assertEqual(self.inventory.stock, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
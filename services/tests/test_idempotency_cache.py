@@ -0,0 +1,90 @@
+"""Duplicate Idempotency-Key submissions in order-processing's _IdempotencyCache.
+
+The IDEMPOTENCY table is replaced by an in-memory store with the
+claim/lookup/complete/release semantics of idempotency.py.
+
+    cd services
+    python -m unittest discover tests
+"""
+from __future__ import annotations
+
+import unittest
+from unittest import mock
+
+from test_checkout_worker import order_processing
+
+FINGERPRINT = "f" * 64
+
+
+class _Store:
+    IN_PROGRESS, COMPLETED = "IN_PROGRESS", "COMPLETED"
+
+    def __init__(self):
+        self.rows: dict[str, dict] = {}
+        self.calls: list[str] = []
+        self.on_lookup = None  # called before each lookup, to change the row mid-wait
+
+    def claim(self, key: str, fingerprint: str, lock_timeout: float) -> dict | None:
+        self.calls.append("claim")
+        if key not in self.rows:
+            self.rows[key] = {"fingerprint": fingerprint, "status": self.IN_PROGRESS, "response": None}
+            return None
+        return dict(self.rows[key])
+
+    def lookup(self, key: str) -> dict | None:
+        self.calls.append("lookup")
+        if self.on_lookup is not None:
+            self.on_lookup()
+        row = self.rows.get(key)
+        return None if row is None else dict(row)
+
+    def complete(self, key: str, response: dict, ttl: float) -> None:
+        self.rows[key].update(status=self.COMPLETED, response=response)
+
+    def release(self, key: str) -> None:
+        self.rows.pop(key, None)
+
+
+class IdempotencyCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.store = _Store()
+        self.cache = order_processing._IdempotencyCache(self.store, ttl=60, max_size=10, wait_timeout=0.3,
+                                                        lock_timeout=900)
+        patcher = mock.patch.object(order_processing.time, "sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_waiting_duplicate_polls_with_lookups_and_gets_409(self):
+        self.store.rows["k"] = {"fingerprint": FINGERPRINT, "status": _Store.IN_PROGRESS, "response": None}
+        clock = iter(range(100))
+        with mock.patch.object(order_processing.time, "monotonic", side_effect=lambda: next(clock) * 0.1):
+            response = self.cache.begin("k", FINGERPRINT)
+
+        self.assertEqual(response["statusCode"], 409)
+        self.assertEqual(self.store.calls.count("claim"), 1)
+        self.assertGreater(self.store.calls.count("lookup"), 0)
+
+    def test_duplicate_replays_the_response_completed_while_it_waits(self):
+        self.store.rows["k"] = {"fingerprint": FINGERPRINT, "status": _Store.IN_PROGRESS, "response": None}
+        self.store.on_lookup = lambda: self.store.complete("k", {"statusCode": 200, "headers": {}, "body": "{}"}, 60)
+
+        response = self.cache.begin("k", FINGERPRINT)
+
+        self.assertEqual(response["headers"]["Idempotent-Replayed"], "true")
+        self.assertEqual(self.store.calls, ["claim", "lookup"])
+
+    def test_duplicate_claims_a_key_released_while_it_waits(self):
+        self.store.rows["k"] = {"fingerprint": FINGERPRINT, "status": _Store.IN_PROGRESS, "response": None}
+        self.store.on_lookup = lambda: self.store.release("k")
+
+        self.assertIsNone(self.cache.begin("k", FINGERPRINT))
+        self.assertEqual(self.store.calls, ["claim", "lookup", "claim"])
+
+    def test_store_error_answers_503(self):
+        with mock.patch.object(self.store, "claim", side_effect=RuntimeError("connection refused")), \
+                mock.patch("builtins.print"):
+            self.assertEqual(self.cache.begin("k", FINGERPRINT)["statusCode"], 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
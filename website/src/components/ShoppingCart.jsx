@@ -3,7 +3,7 @@ import { Link } from "react-router-dom";
 import { useStore } from "../store/Store.jsx";
 
 export default function ShoppingCart({ isOpen, onClose }) {
-    const { cart, updateQty, removeItem, cartTotal } = useStore();
+    const { cart, updateQty, removeItem, cartTotal, refreshCart } = useStore();
 
     const [state, setState] = useState(cart);
 
@@ -16,6 +16,11 @@ export default function ShoppingCart({ isOpen, onClose }) {
         setState(cart);
     }, [cart]);
 
+    useEffect(() => {
+        if (isOpen)
+            refreshCart();
+    }, [isOpen]);
+
     return (
         <>
             <div className={`cart-overlay ${isOpen ? "open" : ""}`} onClick={onClose} aria-hidden="true"/>
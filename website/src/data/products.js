@@ -16,8 +16,24 @@ export const getAllProducts = async () => {
       return productsCache;
     }
 
-    // Fetch from inventory service
-    const products = await inventoryService.getAllItems();
+    // Static snapshot plus live stock; the full API listing is the fallback
+    let products = null;
+    if (inventoryService.isCatalogSnapshotAvailable()) {
+      try {
+        const [snapshot, availability] = await Promise.all([
+          inventoryService.getCatalogSnapshot(),
+          inventoryService.getAvailability(),
+        ]);
+        products = snapshot
+          .filter(product => product.id in availability)
+          .map(product => ({ ...product, availableTickets: availability[product.id] }));
+      } catch (error) {
+        products = null;
+      }
+    }
+    if (products === null) {
+      products = await inventoryService.getAllItems();
+    }
     
     // Update cache
     productsCache = products;
@@ -45,6 +61,23 @@ export const getProductById = async (id) => {
   }
 };
 
+/**
+ * Get the current price and availability of several products in one request
+ * @param {Array<number>} ids - Product IDs
+ * @returns {Promise<Array>} [{ id, price, availableTickets }]; unknown IDs are omitted
+ */
+export const getProductsByIds = async (ids) => {
+  if (ids.length === 0) {
+    return [];
+  }
+  try {
+    return await inventoryService.getItemsByIds(ids, 'availability');
+  } catch (error) {
+    console.error(`Error fetching products ${ids}:`, error);
+    return [];
+  }
+};
+
 /**
  * Search products by name
  * @param {string} name - Name to search for
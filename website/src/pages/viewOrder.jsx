@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { useStore } from "../store/Store";
 import orderService from "../services/orderService";
@@ -6,8 +6,15 @@ import "bootstrap/dist/css/bootstrap.min.css";
 
 export default function ViewOrder() {
   const navigate = useNavigate();
-  const { cart, cartTotal } = useStore();
+  const { cart, cartTotal, refreshCart } = useStore();
   const [submitting, setSubmitting] = useState(false);
+  // One key per order on this page, so retried submissions are not placed twice
+  const [idempotencyKey] = useState(() => crypto.randomUUID());
+
+  // Show the prices the order will be charged at
+  useEffect(() => {
+    refreshCart();
+  }, []);
 
   const items = cart;
   const total = cartTotal;
@@ -51,8 +58,8 @@ export default function ViewOrder() {
         shipping: shipping
       };
 
-      // Call order processing Lambda
-      const result = await orderService.submitOrder(orderData);
+      // Call order processing Lambda; resolves once an accepted order completes
+      const result = await orderService.submitOrder(orderData, idempotencyKey);
       
       // Store confirmation number
       sessionStorage.setItem('confirmation_number', result.confirmation_number);
@@ -73,8 +80,16 @@ export default function ViewOrder() {
             .map(item => `${item.name}: requested ${item.requested}, available ${item.available}`)
             .join('\n');
           alert(`Unable to complete order. Insufficient inventory:\n\n${itemsList}`);
+        } else if (errorObj.type === 'PRICES_CHANGED') {
+          const itemsList = errorObj.items
+            .map(item => `${item.name}: was $${Number(item.price).toFixed(2)}, now $${Number(item.current_price).toFixed(2)}`)
+            .join('\n');
+          alert(`Some prices have changed. Please review your order:\n\n${itemsList}`);
+          await refreshCart();
         } else if (errorObj.type === 'VALIDATION_ERROR') {
           alert(`Order validation failed: ${errorObj.message}`);
+        } else if (errorObj.type === 'ORDER_PENDING') {
+          alert(errorObj.message);
         } else {
           alert(`Order failed: ${errorObj.message}`);
         }
@@ -2,6 +2,10 @@
 const API_BASE_URL = 'https://bbxc8iwzfk.execute-api.us-east-2.amazonaws.com';
 const INVENTORY_PATH = '/inventory-management/inventory';
 const INVENTORY_API_BASE = `${API_BASE_URL}${INVENTORY_PATH}`;
+// Static catalog snapshot written by services/build_catalog_snapshot.py
+const CATALOG_SNAPSHOT_BASE = '/catalog';
+// Set for the session once the manifest turns out not to be deployed
+const SNAPSHOT_UNAVAILABLE_KEY = 'catalog_snapshot_unavailable';
 
 class InventoryService {
   /**
@@ -30,6 +34,61 @@ class InventoryService {
     }
   }
 
+  /**
+   * Whether the catalog snapshot is worth requesting in this session
+   * @returns {boolean} False once the manifest was found missing
+   */
+  isCatalogSnapshotAvailable() {
+    return !sessionStorage.getItem(SNAPSHOT_UNAVAILABLE_KEY);
+  }
+
+  /**
+   * Fetch the static catalog snapshot (every field except availableTickets)
+   * @returns {Promise<Array>} Array of inventory items without stock
+   */
+  async getCatalogSnapshot() {
+    try {
+      // The manifest is revalidated on every load; the hashed file it names never changes
+      const manifestResponse = await fetch(`${CATALOG_SNAPSHOT_BASE}/manifest.json`, { cache: 'no-cache' });
+      const contentType = manifestResponse.headers.get('Content-Type') || '';
+      if (manifestResponse.status === 404 || (manifestResponse.ok && !contentType.includes('json'))) {
+        // Not deployed: the SPA fallback answers with index.html. Skip it for the rest of the session
+        sessionStorage.setItem(SNAPSHOT_UNAVAILABLE_KEY, 'true');
+        throw new Error('Catalog snapshot is not deployed');
+      }
+      if (!manifestResponse.ok) {
+        throw new Error(`HTTP error! status: ${manifestResponse.status}`);
+      }
+      const manifest = await manifestResponse.json();
+
+      const response = await fetch(`${CATALOG_SNAPSHOT_BASE}/${manifest.file}`);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      return await response.json();
+    } catch (error) {
+      console.error('Error fetching catalog snapshot:', error);
+      throw error;
+    }
+  }
+
+  /**
+   * Fetch live ticket counts for every item
+   * @returns {Promise<Object>} Map of item ID to availableTickets
+   */
+  async getAvailability() {
+    try {
+      const response = await fetch(`${INVENTORY_API_BASE}/availability`);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      return await response.json();
+    } catch (error) {
+      console.error('Error fetching availability:', error);
+      throw error;
+    }
+  }
+
   /**
    * Fetch a specific item by ID
    * @param {number} itemId - The ID of the item to fetch
@@ -51,6 +110,29 @@ class InventoryService {
     }
   }
 
+  /**
+   * Fetch several items in one request
+   * @param {Array<number>} ids - Item IDs
+   * @param {string} [view] - 'availability' for only id, price and availableTickets
+   * @returns {Promise<Array>} Items in the order requested; unknown IDs are omitted
+   */
+  async getItemsByIds(ids, view) {
+    try {
+      const params = new URLSearchParams({ ids: ids.join(',') });
+      if (view) {
+        params.set('view', view);
+      }
+      const response = await fetch(`${INVENTORY_API_BASE}/items?${params}`);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      return await response.json();
+    } catch (error) {
+      console.error(`Error fetching items ${ids}:`, error);
+      throw error;
+    }
+  }
+
   /**
    * Search items by name
    * @param {string} name - The name to search for
@@ -1,20 +1,33 @@
 // AWS API Gateway configuration - Hardcoded
 const API_BASE_URL = 'https://bbxc8iwzfk.execute-api.us-east-2.amazonaws.com';
 const ORDER_PATH = '/order-processing/order';
+// How often, and for how long, an accepted (202) order is polled for its outcome
+const ORDER_POLL_INTERVAL_MS = 1000;
+const ORDER_POLL_TIMEOUT_MS = 60000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
 
 class OrderService {
   /**
    * Submit an order to AWS Lambda via API Gateway
    * @param {Object} orderData - Order data with items, payment, and shipping
+   * @param {string} [idempotencyKey] - Reused on retries so the order is placed only once
    * @returns {Promise<Object>} Order confirmation with confirmation number
+   *
+   * With asynchronous checkout the service answers 202 with an order token;
+   * the order is then polled until it completes (see waitForOrder).
    */
-  async submitOrder(orderData) {
+  async submitOrder(orderData, idempotencyKey) {
     try {
+      const headers = {
+        'Content-Type': 'application/json',
+      };
+      if (idempotencyKey) {
+        headers['Idempotency-Key'] = idempotencyKey;
+      }
       const response = await fetch(`${API_BASE_URL}${ORDER_PATH}`, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
+        headers,
         body: JSON.stringify(orderData),
       });
 
@@ -27,7 +40,14 @@ class OrderService {
         }
         
         // Handle specific error codes
-        if (response.status === 409) {
+        if (response.status === 409 && errorData.error === 'Prices changed') {
+          // Cart prices no longer match the inventory
+          throw new Error(JSON.stringify({
+            type: 'PRICES_CHANGED',
+            message: errorData.error,
+            items: errorData.items || []
+          }));
+        } else if (response.status === 409) {
           // Insufficient inventory
           throw new Error(JSON.stringify({
             type: 'INSUFFICIENT_INVENTORY',
@@ -58,12 +78,61 @@ class OrderService {
       }
 
       const result = await response.json();
+      if (response.status === 202) {
+        return await this.waitForOrder(result);
+      }
       return result;
     } catch (error) {
       console.error('Error submitting order:', error);
       throw error;
     }
   }
+
+  /**
+   * Fetch the progress of an accepted order
+   * @param {string} orderToken - Token from the 202 response
+   * @returns {Promise<Object>} { order_token, status, confirmation_number?, error? }
+   */
+  async getOrderStatus(orderToken) {
+    const response = await fetch(`${API_BASE_URL}${ORDER_PATH}/${encodeURIComponent(orderToken)}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  }
+
+  /**
+   * Poll an accepted order until it is COMPLETED or FAILED
+   * @param {Object} accepted - 202 response body with order_token and items
+   * @returns {Promise<Object>} Order confirmation with confirmation number
+   */
+  async waitForOrder(accepted) {
+    const deadline = Date.now() + ORDER_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await sleep(ORDER_POLL_INTERVAL_MS);
+      let order;
+      try {
+        order = await this.getOrderStatus(accepted.order_token);
+      } catch (error) {
+        // Transient failures are retried until the deadline
+        console.warn('Error polling order status:', error);
+        continue;
+      }
+      if (order.status === 'COMPLETED') {
+        return { confirmation_number: order.confirmation_number, items: accepted.items };
+      }
+      if (order.status === 'FAILED') {
+        throw new Error(JSON.stringify({
+          type: 'ORDER_FAILED',
+          message: 'Your order could not be completed. Please try again.'
+        }));
+      }
+    }
+    throw new Error(JSON.stringify({
+      type: 'ORDER_PENDING',
+      message: `Your order is still being processed. Reference: ${accepted.order_token}`
+    }));
+  }
 }
 
 // Create and export a singleton instance
@@ -1,5 +1,5 @@
 import React, {createContext, useContext, useEffect, useMemo, useState} from "react";
-import { getAllProducts } from "../data/products";
+import { getAllProducts, getProductsByIds } from "../data/products";
 
 const StoreContext = createContext(null);
 
@@ -71,12 +71,25 @@ export function StoreProvider({ children }) {
         });
     };
 
+    // Current prices and stock for the lines in the cart, in one batched request
+    const refreshCart = async () => {
+        const ids = cart.filter(l => l.quantity > 0).map(l => l.id)
+        const current = await getProductsByIds(ids)
+        if (current.length === 0)
+            return
+        const byId = new Map(current.map(i => [i.id, i]))
+        setCart(prev => prev.map(l => byId.has(l.id) ? { ...l, price: byId.get(l.id).price } : l))
+        setCatalog(prev => prev.map(product => byId.has(product.id) ?
+            { ...product, price: byId.get(product.id).price, availableTickets: byId.get(product.id).availableTickets } :
+            product))
+    }
+
     const cartCount = useMemo(() => cart.reduce((s, l) => s + l.quantity, 0), [cart])
     const cartTotal = useMemo(() => cart.reduce((s, l) => s + l.quantity * l.price, 0), [cart])
 
     const value = {
         catalog, cart, loading,
-        addToCart, updateQty, getQty, clearCart, updateAvailableTickets,
+        addToCart, updateQty, getQty, clearCart, updateAvailableTickets, refreshCart,
         cartCount, cartTotal,
     }
 